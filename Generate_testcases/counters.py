@@ -0,0 +1,142 @@
+# Generate_testcases/counters.py
+"""
+反规范化计数列的维护。
+
+- FeatureLevel1.level2_count / seed_count
+- FeatureLevel2.seed_count / saved_count
+- GenerationSession.item_count
+
+写入路径在创建、删除、批量写入的同一事务里调用 bump/bump_many，用 F 表达式原子增减，
+列表接口直接读计数列，不再做 COUNT(*) 聚合扫描。
+计数出现偏差（手工改库、并发导入的冲突忽略等）时用 repair_counters 命令按主键分块重算；
+扣减时最多减到 0，不会因为偏差让无符号列下溢（MySQL 严格模式下报 1690 错误，导致删除失败）。
+"""
+from collections import Counter
+
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import FeatureLevel1, FeatureLevel2, GenerationSession, GenerationItem, SavedCaseItem, TestCaseSeed
+
+
+def _add(field, delta):
+    """计数列加上 delta 的更新表达式；扣减时不足则置 0（CASE 只计算命中的分支，减法不会在无符号列上下溢）"""
+    if delta >= 0:
+        return F(field) + delta
+    return Case(When(**{f"{field}__gte": -delta}, then=F(field) + delta), default=Value(0))
+
+
+def bump(model, pk, **deltas):
+    """单行计数增减：bump(FeatureLevel2, 3, seed_count=1, saved_count=-2)"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if pk is None or not deltas:
+        return
+    model.objects.filter(pk=pk).update(**{field: _add(field, delta) for field, delta in deltas.items()})
+
+
+def bump_many(model, field, counts):
+    """
+    多行计数增减：counts 为 {主键: 增量}
+    增量相同的行合并成一条 UPDATE，批量写入时查询次数只取决于不同增量的个数
+    """
+    by_delta = {}
+    for pk, delta in counts.items():
+        if pk is not None and delta:
+            by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        model.objects.filter(pk__in=pks).update(**{field: _add(field, delta)})
+
+
+def count_by(objs, attr):
+    """按外键列统计内存中对象的数量：count_by(items, "session_id") -> {session_id: n}"""
+    return Counter(getattr(obj, attr) for obj in objs)
+
+
+def seeds_created(level2_counts):
+    """新增种子后更新 level2 / level1 的种子计数；level2_counts 为 {level2_id: n}"""
+    if not level2_counts:
+        return
+    bump_many(FeatureLevel2, "seed_count", level2_counts)
+    level1_counts = Counter()
+    for level2_id, level1_id in FeatureLevel2.objects.filter(id__in=list(level2_counts)).values_list("id", "level1_id"):
+        level1_counts[level1_id] += level2_counts[level2_id]
+    bump_many(FeatureLevel1, "seed_count", level1_counts)
+
+
+def seeds_deleting(seed_qs):
+    """在删除种子之前调用：按即将删除的种子扣减 level2 / level1 的种子计数"""
+    level2_counts = Counter()
+    level1_counts = Counter()
+    rows = seed_qs.values("level2_id", "level2__level1_id").annotate(n=Count("id")).order_by()
+    for row in rows:
+        level2_counts[row["level2_id"]] -= row["n"]
+        level1_counts[row["level2__level1_id"]] -= row["n"]
+    bump_many(FeatureLevel2, "seed_count", level2_counts)
+    bump_many(FeatureLevel1, "seed_count", level1_counts)
+
+
+def level2_deleting(level2_qs):
+    """在删除二级功能之前调用：扣减所属一级功能的二级功能数和种子数（种子随二级功能级联删除）"""
+    level2_counts = Counter()
+    seed_counts = Counter()
+    for level1_id, seed_count in level2_qs.values_list("level1_id", "seed_count"):
+        level2_counts[level1_id] -= 1
+        seed_counts[level1_id] -= seed_count
+    bump_many(FeatureLevel1, "level2_count", level2_counts)
+    bump_many(FeatureLevel1, "seed_count", seed_counts)
+
+
+def _count_subquery(model, fk, field="id"):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef("pk")})
+            .order_by().values(fk).annotate(c=Count(field)).values("c")[:1]
+        ),
+        Value(0),
+    )
+
+
+# 各计数列的重算表达式：{模型: {计数列: 子查询}}
+RECOUNTS = {
+    FeatureLevel1: {
+        "level2_count": lambda: _count_subquery(FeatureLevel2, "level1"),
+        "seed_count": lambda: _count_subquery(TestCaseSeed, "level2__level1"),
+    },
+    FeatureLevel2: {
+        "seed_count": lambda: _count_subquery(TestCaseSeed, "level2"),
+        "saved_count": lambda: _count_subquery(SavedCaseItem, "level2"),
+    },
+    GenerationSession: {
+        "item_count": lambda: _count_subquery(GenerationItem, "session"),
+    },
+}
+
+
+# 各计数列统计的是哪些子表：这些表被批量清理（如 reset_database）后需要重算
+COUNTED_FROM = {
+    FeatureLevel1: (FeatureLevel2, TestCaseSeed),
+    FeatureLevel2: (TestCaseSeed, SavedCaseItem),
+    GenerationSession: (GenerationItem,),
+}
+
+
+def recompute(model, chunk_size=1000, on_chunk=None):
+    """
+    按主键分块重算 model 的全部计数列（每块一条带相关子查询的 UPDATE），返回处理的行数
+    on_chunk(已处理行数)：每块完成后调用，用于输出进度
+    """
+    expressions = {field: make() for field, make in RECOUNTS[model].items()}
+    done = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            break
+        model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1]).update(**expressions)
+        done += len(pks)
+        last_pk = pks[-1]
+        if on_chunk is not None:
+            on_chunk(done)
+    return done
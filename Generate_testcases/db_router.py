@@ -0,0 +1,108 @@
+# Generate_testcases/db_router.py
+"""
+只读副本路由。
+
+- 用 read_replica 装饰的只读视图（以及 replica_reads() 代码块）里的查询走 READ_REPLICA_ALIAS，其余读写都走主库
+- 同一请求里一旦有写入，之后的读取回到主库
+- 写请求（非 GET/HEAD/OPTIONS，或请求中发生了写入）的响应里设置 cookie，
+  之后 READ_REPLICA_STICKY_SECONDS 秒内该浏览器的请求都读主库，避免因复制延迟读不到自己刚写的数据
+- READ_REPLICA_ENABLED=False 或 DATABASES 中没有副本别名时全部走主库（单库部署）
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_COOKIE = "db_pin_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+_use_replica = ContextVar("use_replica", default=False)
+_wrote = ContextVar("db_wrote", default=False)
+
+
+def replica_alias():
+    return getattr(settings, "READ_REPLICA_ALIAS", "replica")
+
+
+def enabled():
+    return getattr(settings, "READ_REPLICA_ENABLED", False) and replica_alias() in settings.DATABASES
+
+
+def _sticky_seconds():
+    return getattr(settings, "READ_REPLICA_STICKY_SECONDS", 10)
+
+
+def _pinned(request):
+    """该浏览器最近写过数据，仍在读主库的时间窗内"""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE) or 0) > time.time()
+    except ValueError:
+        return False
+
+
+@contextmanager
+def replica_reads():
+    """代码块内的查询走只读副本（可用于视图以外的只读查询，例如报表）"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_replica(view):
+    """只读视图装饰器：未开启副本或该浏览器处于写后粘滞窗口内时直接走主库"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not enabled() or _pinned(request):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and not _wrote.get() and enabled():
+            return replica_alias()
+        # 明确返回主库：否则 Django 会沿用实例来源的库，从副本读出的对象会继续读副本
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库数据相同，跨库关联没有问题
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构由复制同步，不单独迁移
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """记录请求中是否发生写入；写请求的响应设置粘滞 cookie，使之后的读取暂时回到主库"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+        if enabled() and (wrote or request.method not in SAFE_METHODS):
+            seconds = _sticky_seconds()
+            response.set_cookie(
+                PIN_COOKIE, f"{time.time() + seconds:.3f}", max_age=seconds, httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,124 @@
+# Generate_testcases/excel_export.py
+"""
+最终用例（SavedCaseItem）导出为 Excel。
+
+- 按场景（level2）或保存批次（saved_batch_id）导出；
+- 按 (saved_batch_id, idx) 键集分页（两列联合唯一），每页 EXPORT_CHUNK_SIZE 行一次查询，openpyxl write-only 模式逐行写入，
+  内存占用与行数无关（不用 iterator：MySQL 驱动没有服务端游标，iterator 仍会把整个结果集读进内存）；
+- 全部为「已交付」状态的批次内容不再变化，生成的文件缓存在 EXPORT_CACHE_DIR，重复下载直接读缓存。
+  缓存文件名包含行数和最大 id，批次内容若有变化会自动生成新文件。
+"""
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from openpyxl import Workbook
+
+from .fields import unpack
+from .models import SavedCaseItem
+
+
+HEADERS = ["一级功能", "二级功能", "保存批次", "序号", "测试用例", "状态", "版本备注", "保存时间"]
+
+STATUS_LABELS = dict(SavedCaseItem._meta.get_field("status").choices)
+
+
+def export_queryset(level2_id=None, batch_id=None):
+    qs = SavedCaseItem.objects.all()
+    if level2_id is not None:
+        qs = qs.filter(level2_id=level2_id)
+    if batch_id is not None:
+        qs = qs.filter(saved_batch_id=batch_id)
+    return qs.order_by("saved_batch_id", "idx")
+
+
+def _pages(qs, chunk_size):
+    """按 (saved_batch_id, idx) 键集分页逐页读取，每页一次有上限的查询，输出顺序与 export_queryset 一致"""
+    rows = qs.order_by("saved_batch_id", "idx").values_list(
+        "level2__level1__name", "level2__name", "saved_batch_id", "idx",
+        "text", "status", "version_title", "created_at",
+    )
+    page = list(rows[:chunk_size])
+    while page:
+        yield from page
+        if len(page) < chunk_size:
+            return
+        _, _, batch, idx = page[-1][:4]
+        page = list(
+            rows.filter(Q(saved_batch_id__gt=batch) | Q(saved_batch_id=batch, idx__gt=idx))[:chunk_size]
+        )
+
+
+def write_workbook(qs, fileobj):
+    """把查询集逐行写入 fileobj（文件路径或二进制文件对象），返回写入的行数"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("测试用例")
+    ws.append(HEADERS)
+
+    rows = _pages(qs, max(1, getattr(settings, "EXPORT_CHUNK_SIZE", 2000)))
+
+    count = 0
+    for l1, l2, batch, idx, text, status, version_title, created_at in rows:
+        ws.append([
+            l1, l2, batch, idx, unpack(text),
+            STATUS_LABELS.get(status, status),
+            version_title or "",
+            created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "",
+        ])
+        count += 1
+    wb.save(fileobj)
+    return count
+
+
+def _cache_dir():
+    return str(getattr(settings, "EXPORT_CACHE_DIR", os.path.join(settings.BASE_DIR, "export_cache")))
+
+
+def cached_batch_path(batch_id):
+    """
+    已交付批次的缓存文件路径；批次为空或含有未交付的用例时返回 None（不缓存）
+    """
+    summary = SavedCaseItem.objects.filter(saved_batch_id=batch_id).aggregate(
+        total=Count("id"), max_id=Max("id"),
+    )
+    if not summary["total"]:
+        return None
+    if SavedCaseItem.objects.filter(saved_batch_id=batch_id).exclude(status="delivered").exists():
+        return None
+    safe_id = re.sub(r"[^0-9A-Za-z_.-]", "_", batch_id)
+    return os.path.join(_cache_dir(), f"{safe_id}_{summary['total']}_{summary['max_id']}.xlsx")
+
+
+def open_export(level2_id=None, batch_id=None):
+    """
+    生成导出文件并返回一个可读的二进制文件对象（已定位到开头），由调用方负责关闭：
+    - 已交付批次：命中缓存直接打开；未命中则生成到缓存目录后再打开
+    - 其他：写入匿名临时文件，关闭后自动删除
+    """
+    if batch_id is not None and level2_id is None:
+        path = cached_batch_path(batch_id)
+        if path is not None:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # 先写临时文件再原子改名，并发下载或中途失败都不会留下半个文件
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as out:
+                        write_workbook(export_queryset(batch_id=batch_id), out)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            return open(path, "rb")
+
+    tmp = tempfile.TemporaryFile()
+    try:
+        write_workbook(export_queryset(level2_id=level2_id, batch_id=batch_id), tmp)
+    except BaseException:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    return tmp
@@ -0,0 +1,432 @@
+# Generate_testcases/excel_import.py
+"""
+Excel 种子用例导入（流式、分块批量写入）。
+
+Excel 规则（固定列位）：
+- 忽略第 1 列
+- 第 2 列：一级功能
+- 第 3 列：二级功能
+- 第 4 列：二级功能场景提示词 prompt（支持合并单元格向下继承）
+- 第 5 列：种子测试用例 seed
+说明：prompt 可以为空；seed 不继承
+
+实现要点：
+- 只读模式打开工作簿，逐行读取，内存占用与表格行数无关；
+- 已有的一级/二级功能预先加载到字典里，逐行判断不再查库；
+- 每 IMPORT_CHUNK_SIZE 行写一次库：新功能 / 提示词变更 / 新种子分别批量插入或更新，
+  种子按内容指纹（text_hash）批量查重；
+- 异步任务（ImportJob）：上传文件先落盘，后台线程或 run_import_jobs 命令逐块导入，
+  每块提交时同时记录进度，中断后从最后提交的块之后继续。
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import counters, search_index, similarity
+from .models import FeatureLevel1, FeatureLevel2, TestCaseSeed, ImportJob
+
+
+logger = logging.getLogger(__name__)
+
+
+NAME_MAX_LENGTH = 128
+
+
+def _norm(v):
+    return "" if v is None else str(v).strip()
+
+
+def iter_sheet_rows(file):
+    """
+    逐行读取第一个工作表（跳过表头），处理好合并单元格的向下继承后产出：
+        (行号, 一级功能, 二级功能, prompt, seed)
+    缺少一级/二级功能的行也会产出（由调用方计为跳过），行号与 Excel 中一致
+    """
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        # 合并单元格继承：l1/l2/prompt
+        last_l1 = ""
+        last_l2 = ""
+        last_prompt = ""
+        for row_number, r in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            # B/C/D/E
+            raw_l1 = _norm(r[1]) if len(r) > 1 else ""
+            raw_l2 = _norm(r[2]) if len(r) > 2 else ""
+            raw_prompt = _norm(r[3]) if len(r) > 3 else ""   # 第4列 prompt
+            seed = _norm(r[4]) if len(r) > 4 else ""         # 第5列 seed
+
+            # l1/l2 向下继承
+            l1 = raw_l1 or last_l1
+            l2 = raw_l2 or last_l2
+
+            if not l1 or not l2:
+                yield row_number, "", "", "", seed
+                continue
+
+            # prompt 向下继承（只对合并单元格有效：同一个 l1+l2 的连续行）
+            if raw_prompt:
+                prompt = raw_prompt
+            else:
+                prompt = last_prompt if (l1 == last_l1 and l2 == last_l2) else ""
+
+            last_l1, last_l2, last_prompt = l1, l2, prompt
+            yield row_number, l1, l2, prompt, seed
+    finally:
+        # 只读模式会一直占用文件句柄
+        wb.close()
+
+
+class ExcelImporter:
+    """
+    把 iter_sheet_rows 产出的行分块写入数据库：
+        importer = ExcelImporter()
+        importer.import_rows(iter_sheet_rows(f))
+        importer.stats  # 与接口返回的 stats 字段一致
+    每块在一个事务内提交；on_chunk(最后一行行号) 在该事务内、提交前调用，
+    用它记录进度可以保证进度与数据同时提交或同时回滚
+    """
+
+    # 种子插入遇到并发写入的唯一键冲突时，重新查重并重试的次数
+    MAX_SEED_INSERT_ATTEMPTS = 3
+
+    def __init__(self, chunk_size=None, batch_size=None):
+        self.chunk_size = chunk_size or getattr(settings, "IMPORT_CHUNK_SIZE", 1000)
+        self.batch_size = batch_size or getattr(settings, "BULK_INSERT_BATCH_SIZE", 500)
+        self.stats = {
+            "created_level1": 0,
+            "created_level2": 0,
+            "updated_level2_prompt": 0,
+            "created_seed": 0,
+            "skipped_rows": 0,
+        }
+        self.errors = []  # [{"row": 行号, "error": 原因}]
+
+        # 预加载：{一级功能名: id}、{(一级功能名, 二级功能名): {"id":..., "prompt":...}}
+        self._level1 = dict(FeatureLevel1.objects.values_list("name", "id"))
+        self._level2 = {
+            (l1_name, name): {"id": pk, "prompt": prompt or ""}
+            for pk, l1_name, name, prompt in FeatureLevel2.objects.values_list("id", "level1__name", "name", "prompt")
+        }
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self._new_level1 = []        # 本块新出现的一级功能名（保持顺序）
+        self._new_level2 = []        # 本块新出现的二级功能 key
+        self._dirty_prompts = set()  # 本块中提示词有变化的已有二级功能 key
+        self._seeds = []             # [(二级功能 key, 种子文本)]
+        self._rows = 0
+        self._last_row = None
+
+    def import_rows(self, rows, resume_after=0, on_chunk=None):
+        """resume_after：跳过行号不大于它的行（断点续传：这些行已在之前的块中提交）"""
+        for row_number, l1, l2, prompt, seed in rows:
+            if row_number <= resume_after:
+                continue
+            self._add_row(row_number, l1, l2, prompt, seed)
+            if self._rows >= self.chunk_size:
+                self._flush(on_chunk)
+        if self._rows:
+            self._flush(on_chunk)
+        return self.stats
+
+    def _add_row(self, row_number, l1, l2, prompt, seed):
+        self._rows += 1
+        self._last_row = row_number
+
+        # 必须有 l1/l2，prompt 可为空
+        if not l1 or not l2:
+            self.stats["skipped_rows"] += 1
+            return
+        if len(l1) > NAME_MAX_LENGTH or len(l2) > NAME_MAX_LENGTH:
+            self.stats["skipped_rows"] += 1
+            self._add_error(row_number, f"功能名称超过 {NAME_MAX_LENGTH} 个字符")
+            return
+
+        if l1 not in self._level1:
+            self._level1[l1] = None
+            self._new_level1.append(l1)
+            self.stats["created_level1"] += 1
+
+        key = (l1, l2)
+        level2 = self._level2.get(key)
+        if level2 is None:
+            level2 = self._level2[key] = {"id": None, "prompt": ""}
+            self._new_level2.append(key)
+            self.stats["created_level2"] += 1
+
+        # prompt 可为空：为空不覆盖；有值才更新
+        if prompt and level2["prompt"] != prompt:
+            level2["prompt"] = prompt
+            if level2["id"] is not None:
+                self._dirty_prompts.add(key)
+            self.stats["updated_level2_prompt"] += 1
+
+        # seed 写入（不继承；为空则跳过）
+        if seed:
+            self._seeds.append((key, seed))
+
+    def _add_error(self, row_number, error):
+        # 只保留前 IMPORT_MAX_ERRORS 条明细，避免大量错误行撑大内存和任务记录
+        if len(self.errors) < getattr(settings, "IMPORT_MAX_ERRORS", 200):
+            self.errors.append({"row": row_number, "error": error})
+
+    def _flush(self, on_chunk=None):
+        with transaction.atomic():
+            self._flush_level1()
+            self._flush_level2()
+            self._flush_seeds()
+            if on_chunk is not None:
+                on_chunk(self._last_row)
+        self._reset_chunk()
+
+    def _flush_level1(self):
+        if not self._new_level1:
+            return
+        FeatureLevel1.objects.bulk_create(
+            [FeatureLevel1(name=name) for name in self._new_level1],
+            batch_size=self.batch_size, ignore_conflicts=True,
+        )
+        # MySQL 的 bulk_create 不回填主键，按名称回查
+        self._level1.update(
+            FeatureLevel1.objects.filter(name__in=self._new_level1).values_list("name", "id")
+        )
+
+    def _flush_level2(self):
+        if self._new_level2:
+            FeatureLevel2.objects.bulk_create(
+                [
+                    FeatureLevel2(level1_id=self._level1[l1], name=l2, prompt=self._level2[(l1, l2)]["prompt"] or None)
+                    for l1, l2 in self._new_level2
+                ],
+                batch_size=self.batch_size, ignore_conflicts=True,
+            )
+            created = (
+                FeatureLevel2.objects
+                .filter(level1_id__in={self._level1[l1] for l1, _ in self._new_level2},
+                        name__in={l2 for _, l2 in self._new_level2})
+                .values_list("id", "level1__name", "name")
+            )
+            for pk, l1, l2 in created:
+                if (l1, l2) in self._level2:
+                    self._level2[(l1, l2)]["id"] = pk
+            counters.bump_many(
+                FeatureLevel1, "level2_count", Counter(self._level1[l1] for l1, _ in self._new_level2)
+            )
+
+        if self._dirty_prompts:
+            FeatureLevel2.objects.bulk_update(
+                [FeatureLevel2(id=self._level2[key]["id"], prompt=self._level2[key]["prompt"]) for key in self._dirty_prompts],
+                ["prompt"], batch_size=self.batch_size,
+            )
+
+    @staticmethod
+    def _existing_seed_keys(keys):
+        """keys 中已存在于库里的 (level2_id, text_hash)"""
+        return set(
+            TestCaseSeed.objects
+            .filter(level2_id__in={level2_id for level2_id, _ in keys},
+                    text_hash__in={text_hash for _, text_hash in keys})
+            .values_list("level2_id", "text_hash")
+        )
+
+    def _flush_seeds(self):
+        if not self._seeds:
+            return
+        candidates = {}
+        for key, text in self._seeds:
+            level2_id = self._level2[key]["id"]
+            candidates.setdefault((level2_id, TestCaseSeed.hash_text(text)), text)
+
+        # 并发导入同一内容时，查重之后可能有其他进程先写入相同种子：整批插入放在保存点里，
+        # 冲突时回滚这一批、重新查重后再插入，保证只统计本次真正写入的种子
+        for attempt in range(self.MAX_SEED_INSERT_ATTEMPTS):
+            existing = self._existing_seed_keys(candidates)
+            new_seeds = [
+                TestCaseSeed(level2_id=level2_id, text=text, text_hash=text_hash)
+                for (level2_id, text_hash), text in candidates.items()
+                if (level2_id, text_hash) not in existing
+            ]
+            try:
+                with transaction.atomic():
+                    TestCaseSeed.objects.bulk_create(new_seeds, batch_size=self.batch_size)
+                break
+            except IntegrityError:
+                if attempt == self.MAX_SEED_INSERT_ATTEMPTS - 1:
+                    raise
+
+        # bulk_create 不回填主键，按 (level2_id, text_hash) 取回新种子，用于计数、检索索引和相似度签名
+        new_keys = {(seed.level2_id, seed.text_hash) for seed in new_seeds}
+        if not new_keys:
+            return
+        created = [
+            seed for seed in TestCaseSeed.objects
+            .filter(level2_id__in={level2_id for level2_id, _ in new_keys},
+                    text_hash__in={text_hash for _, text_hash in new_keys})
+            .only("id", "level2_id", "text", "text_hash")
+            if (seed.level2_id, seed.text_hash) in new_keys
+        ]
+        counters.seeds_created(counters.count_by(created, "level2_id"))
+        self.stats["created_seed"] += len(created)
+        search_index.index_seeds(created)
+        similarity.index_seeds(created)
+
+# ---------------------------------------------------------------------------
+# 异步导入任务
+# ---------------------------------------------------------------------------
+
+def _spool_dir():
+    return str(getattr(settings, "IMPORT_SPOOL_DIR", os.path.join(settings.BASE_DIR, "import_spool")))
+
+
+class InvalidWorkbook(ValueError):
+    """上传的文件无法作为 xlsx 打开，或者没有数据行；在入队前同步检查，由接口直接返回 400"""
+    pass
+
+
+def inspect_workbook(path):
+    """
+    打开工作簿读取表头和第一行数据，确认文件可以导入；失败抛出 InvalidWorkbook
+    返回工作表声明的数据行数（不含表头），文件没有写尺寸信息时返回 None
+    """
+    try:
+        wb = load_workbook(path, read_only=True)
+    except Exception as e:
+        raise InvalidWorkbook(f"读取Excel失败：{e}")
+    try:
+        ws = wb.active
+        rows = list(islice(ws.iter_rows(values_only=True), 2))
+        if len(rows) <= 1:
+            raise InvalidWorkbook("Excel中没有数据行")
+        max_row = ws.max_row
+        return max(max_row - 1, 0) if max_row else None
+    except InvalidWorkbook:
+        raise
+    except Exception as e:
+        raise InvalidWorkbook(f"读取Excel失败：{e}")
+    finally:
+        wb.close()
+
+
+def create_import_job(uploaded_file, user=None):
+    """
+    把上传文件分块写到落盘目录并创建任务；只同步检查表头（inspect_workbook），不解析数据行
+    文件无法导入时删除落盘文件并抛出 InvalidWorkbook，不创建任务
+    """
+    spool_dir = _spool_dir()
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, f"{uuid.uuid4().hex}.xlsx")
+    with open(path, "wb") as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+
+    try:
+        total_rows = inspect_workbook(path)
+    except InvalidWorkbook:
+        os.remove(path)
+        raise
+
+    return ImportJob.objects.create(
+        original_name=(uploaded_file.name or "")[:255],
+        file_path=path,
+        total_rows=total_rows,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def start_import_job(job_id):
+    """
+    事务提交后在后台线程中处理任务；IMPORT_RUN_IN_THREAD=False 时只入队，
+    由 run_import_jobs 命令（独立的 worker 进程）处理
+    """
+    if not getattr(settings, "IMPORT_RUN_IN_THREAD", True):
+        return
+
+    def _start():
+        threading.Thread(
+            target=_run_in_thread, args=(job_id,), name=f"import-job-{job_id}", daemon=True
+        ).start()
+
+    transaction.on_commit(_start)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_import_job(job_id)
+    except Exception:
+        logger.exception("导入任务 %s 异常退出", job_id)
+    finally:
+        connection.close()
+
+
+def _claimable_jobs(include_failed=False):
+    """待处理的任务：排队中的，以及心跳超时（处理进程已中断）的导入中任务"""
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, "IMPORT_JOB_STALE_SECONDS", 300))
+    condition = Q(status="pending") | Q(status="running", heartbeat_at__lt=stale_before)
+    if include_failed:
+        condition |= Q(status="failed")
+    return ImportJob.objects.filter(condition)
+
+
+def run_import_job(job_id, include_failed=False):
+    """
+    处理（或从断点继续处理）一个导入任务；任务已被其他进程领取时直接返回 None
+    include_failed：允许重试失败的任务（同样从最后提交的块之后继续）
+    """
+    now = timezone.now()
+    claimed = _claimable_jobs(include_failed).filter(id=job_id).update(
+        status="running", message="", started_at=now, heartbeat_at=now, finished_at=None
+    )
+    if not claimed:
+        return None
+    job = ImportJob.objects.get(id=job_id)
+
+    importer = ExcelImporter()
+    importer.stats.update(job.stats or {})
+    importer.errors = list(job.errors or [])
+
+    def on_chunk(last_row):
+        ImportJob.objects.filter(id=job.id).update(
+            last_committed_row=last_row,
+            processed_rows=last_row - 1,  # 第 1 行是表头
+            stats=importer.stats,
+            errors=importer.errors,
+            heartbeat_at=timezone.now(),
+        )
+
+    try:
+        importer.import_rows(iter_sheet_rows(job.file_path), resume_after=job.last_committed_row, on_chunk=on_chunk)
+    except Exception as e:
+        logger.exception("导入任务 %s 失败", job.id)
+        ImportJob.objects.filter(id=job.id).update(
+            status="failed", message=str(e), finished_at=timezone.now()
+        )
+        job.refresh_from_db()
+        return job
+
+    ImportJob.objects.filter(id=job.id).update(status="done", finished_at=timezone.now())
+    try:
+        os.remove(job.file_path)
+    except OSError:
+        pass
+    job.refresh_from_db()
+    return job
+
+
+def run_pending_jobs(include_failed=False):
+    """依次处理所有可领取的任务，返回处理的任务数"""
+    count = 0
+    for job_id in _claimable_jobs(include_failed).order_by("created_at").values_list("id", flat=True):
+        if run_import_job(job_id, include_failed=include_failed) is not None:
+            count += 1
+    return count
@@ -0,0 +1,124 @@
+# Generate_testcases/fields.py
+"""
+压缩存储的长文本字段。
+
+- 列类型为二进制（MySQL longblob）；写入时 UTF-8 编码后超过 COMPRESSED_TEXT_MIN_BYTES 字节、
+  且压缩后确实更小的值用 zlib 压缩，并加上魔数前缀 MAGIC；其余值按 UTF-8 原样存储
+- 0xFF 不会出现在合法的 UTF-8 里，读取时据此区分压缩值和原样存储的值，两种格式可以混存，
+  调整阈值或压缩级别不需要迁移旧数据
+- 读取是惰性的：查询只取回压缩字节（PackedText），第一次访问模型属性时才解压并缓存；
+  只读取其他字段、原样保存的实例不会产生解压/重新压缩的开销
+- values()/values_list() 不经过模型属性，压缩值以 PackedText 返回，需要文本时用 unpack() 转换
+- 压缩后的列不能再用 SQL 做 LIKE/contains 等文本查询
+"""
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+
+MAGIC = b"\xffz"
+
+
+class PackedText:
+    """尚未解压的压缩文本"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = bytes(data)
+
+    def unpack(self):
+        return zlib.decompress(self.data[len(MAGIC):]).decode("utf-8")
+
+    def __str__(self):
+        return self.unpack()
+
+    def __repr__(self):
+        return f"<PackedText {len(self.data)} bytes>"
+
+    def __eq__(self, other):
+        if isinstance(other, PackedText):
+            return self.data == other.data
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.data)
+
+
+def unpack(value):
+    """values()/values_list() 取出的值转成文本（未压缩的值原样返回）"""
+    return value.unpack() if isinstance(value, PackedText) else value
+
+
+def pack(text, min_bytes=None, level=None):
+    """
+    文本转成存储格式（bytes）：达到阈值且压缩后更小才压缩
+    min_bytes / level 默认读 settings.COMPRESSED_TEXT_MIN_BYTES / COMPRESSED_TEXT_LEVEL
+    """
+    raw = text.encode("utf-8")
+    if min_bytes is None:
+        min_bytes = getattr(settings, "COMPRESSED_TEXT_MIN_BYTES", 256)
+    if len(raw) < min_bytes:
+        return raw
+    if level is None:
+        level = getattr(settings, "COMPRESSED_TEXT_LEVEL", 6)
+    packed = MAGIC + zlib.compress(raw, level)
+    return packed if len(packed) < len(raw) else raw
+
+
+class _CompressedTextAttribute(DeferredAttribute):
+    """
+    第一次访问时解压，结果写回实例缓存，之后的访问不再解压
+    定义 __set__ 使其成为数据描述符，否则实例 __dict__ 里的值会绕过 __get__
+    """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, PackedText):
+            value = value.unpack()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """用法与 TextField 相同（表单、模板、序列化都拿到文本），数据库里按需压缩存储"""
+
+    descriptor_class = _CompressedTextAttribute
+
+    def get_internal_type(self):
+        # 决定列类型：MySQL longblob / sqlite BLOB
+        return "BinaryField"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            # 转换前遗留的文本值（sqlite 修改列类型不会改写已有数据）
+            return value
+        value = bytes(value)
+        if value.startswith(MAGIC):
+            return PackedText(value)
+        return value.decode("utf-8")
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            value = self.from_db_value(value, None, None)
+        return unpack(value) if isinstance(value, PackedText) else super().to_python(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, PackedText):
+            # 未被访问过的值原样写回，不重新压缩
+            return value.data
+        value = super().get_prep_value(value)
+        return pack(value)
+
+    def pre_save(self, model_instance, add):
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, PackedText):
+            return value
+        return super().pre_save(model_instance, add)
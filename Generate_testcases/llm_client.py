@@ -1,15 +1,31 @@
 # Generate_testcases/llm_client.py
 import os
 import re
-from typing import List
+from typing import Callable, List, Optional
 from zhipuai import ZhipuAI
 
+from . import llm_quota, singleflight
+from .llm_scheduler import get_scheduler, PRIORITY_BULK, SlotCancelled
+
 
 class LLMError(RuntimeError):
     """LLM 调用或返回内容不符合预期时抛出。"""
     pass
 
 
+class GenerationCancelled(LLMError):
+    """调用方在请求完成前取消了生成（例如会话被用户取消）。"""
+    pass
+
+
+class QuotaExceeded(LLMError):
+    """当前用户/团队当日的大模型配额已用完；retry_after 为建议的重试等待秒数。"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 def safe_print(s: str) -> None:
     """
     Windows 控制台常见：gbk 不能打印 emoji/部分字符，导致 UnicodeEncodeError。
@@ -135,7 +151,11 @@ def generate_cases_for_seed(
     n: int,
     temperature: float,
     top_p: float,
-    idx
+    idx,
+    priority: str = PRIORITY_BULK,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    tenant: str = llm_quota.ANONYMOUS_TENANT,
+    reuse_recent: bool = True,
 ) -> List[str]:
     """
     输入：
@@ -145,6 +165,12 @@ def generate_cases_for_seed(
       - prompt: 场景提示词（可为空）
       - n: 生成条数
       - temperature/top_p: 采样参数
+      - priority: 调度优先级（interactive/bulk/background），见 llm_scheduler
+      - cancel_check: 可选，返回 True 表示调用方已取消；在排队/等待合并结果期间定期检查，
+        取消时抛出 GenerationCancelled（已发往供应商的同步请求无法中断）
+      - tenant: 配额与公平排队的主体（llm_quota.tenant_for_user），当日配额用完时抛出 QuotaExceeded
+      - reuse_recent: 是否复用几秒内刚完成的相同请求的结果（见 singleflight）；重新生成时传 False，
+        否则连续点击「重新生成」会拿到与上一次完全相同的文本
 
     输出：
       - List[str]：长度为 n（尽力保证）
@@ -166,6 +192,9 @@ def generate_cases_for_seed(
     if n <= 0:
         return []
 
+    if cancel_check is not None and cancel_check():
+        raise GenerationCancelled("生成已取消")
+
     client = ZhipuAI(api_key=api_key)
 
     # 场景提示词可选：前端可填可不填
@@ -200,20 +229,57 @@ def generate_cases_for_seed(
         "再次强调：必须中文；不要编号；不要解释；不要输出多余内容。"
     )
 
-    try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user},
-            ],
-            temperature=float(temperature),
-            top_p=float(top_p),
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user},
+    ]
+
+    # 本请求自己真正调用了模型（而不是拿到合并的结果）时置为 True
+    charged = False
+
+    def call():
+        nonlocal charged
+        try:
+            # 先排队拿槽位，再请求供应商
+            with get_scheduler().slot(
+                priority,
+                cancel_check=cancel_check,
+                tenant=tenant,
+                weight=llm_quota.weight_for(tenant),
+            ):
+                resp = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=float(temperature),
+                    top_p=float(top_p),
+                )
+        except SlotCancelled:
+            raise GenerationCancelled("生成已取消")
+        except Exception as e:
+            raise LLMError(f"智谱调用失败：{e}")
+
+        charged = True
+        usage = getattr(resp, "usage", None)
+        llm_quota.record_usage(
+            tenant,
+            prompt_tokens=int(getattr(usage, "prompt_tokens", 0) or 0),
+            completion_tokens=int(getattr(usage, "completion_tokens", 0) or 0),
         )
-    except Exception as e:
-        raise LLMError(f"智谱调用失败：{e}")
+        return (resp.choices[0].message.content or "").strip()
 
-    content = (resp.choices[0].message.content or "").strip()
+    # 相同提示词 + 采样参数的并发请求只调用一次模型，其余等待结果
+    key = singleflight.make_key(
+        model=model, messages=messages, temperature=float(temperature), top_p=float(top_p)
+    )
+    # 先占用一次请求额度（原子判断配额）；失败或结果来自合并时退回，只有真实调用计入用量
+    retry_after = llm_quota.reserve_request(tenant)
+    if retry_after is not None:
+        raise QuotaExceeded("今日大模型调用配额已用完，请稍后再试", retry_after=retry_after)
+    try:
+        content = singleflight.do(key, call, cancel_check=cancel_check, reuse_recent=reuse_recent)
+    finally:
+        if not charged:
+            llm_quota.release_request(tenant)
 
     print(f"===== ZHIPU LLM RAW OUTPUT{idx} (FIRST RESPONSE) =====")
     safe_print(content)
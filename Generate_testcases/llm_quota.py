@@ -0,0 +1,100 @@
+# Generate_testcases/llm_quota.py
+"""
+大模型调用的按用户（或团队）配额与用量统计。
+
+- tenant：调度与计费的主体，"user:<id>" / "team:<组名>" / "anonymous"
+- 每日配额：请求次数、token 数；超出后返回距次日零点的秒数，由视图返回 429 + Retry-After
+- 用量：每个 tenant 每天一行（LLMUsage），用 F 表达式原子累加；请求数在调用前用条件 UPDATE 占用，
+  失败或被合并的请求再退回，并发请求不会一起越过配额
+- 权重：调度器内同一优先级按 tenant 加权公平排队，权重越大分到的份额越多
+
+相关配置（settings）：
+    LLM_FAIR_SHARE_BY = "user"            # 或 "team"：按用户所在的第一个 Django 组聚合
+    LLM_DAILY_REQUEST_QUOTA = None        # 默认每日请求上限，None 表示不限
+    LLM_DAILY_TOKEN_QUOTA = None          # 默认每日 token 上限，None 表示不限
+    LLM_TENANT_QUOTAS = {}                # 按 tenant 覆盖：{"user:3": {"requests": 500, "tokens": 2000000}}
+    LLM_TENANT_WEIGHTS = {}               # 按 tenant 设置调度权重：{"team:qa": 2}
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+
+ANONYMOUS_TENANT = "anonymous"
+
+
+def tenant_for_user(user) -> str:
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS_TENANT
+    if getattr(settings, "LLM_FAIR_SHARE_BY", "user") == "team":
+        group = user.groups.order_by("name").first()
+        if group is not None:
+            return f"team:{group.name}"
+    return f"user:{user.pk}"
+
+
+def weight_for(tenant: str) -> float:
+    weight = getattr(settings, "LLM_TENANT_WEIGHTS", {}).get(tenant, 1)
+    return max(float(weight), 0.01)
+
+
+def _quota_for(tenant: str):
+    override = getattr(settings, "LLM_TENANT_QUOTAS", {}).get(tenant, {})
+    requests = override.get("requests", getattr(settings, "LLM_DAILY_REQUEST_QUOTA", None))
+    tokens = override.get("tokens", getattr(settings, "LLM_DAILY_TOKEN_QUOTA", None))
+    return requests, tokens
+
+
+def _seconds_until_tomorrow() -> int:
+    now = timezone.now()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    if timezone.is_aware(now):
+        tomorrow = timezone.make_aware(tomorrow, now.tzinfo)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+def reserve_request(tenant: str) -> Optional[int]:
+    """
+    调用模型前占用一次请求额度：配额充足时原子地把当日请求数 +1 并返回 None；已用完返回建议的重试等待秒数。
+    判断和累加在同一条条件 UPDATE 里完成，并发请求不会同时通过「最后一次」额度的检查。
+    token 用量要等调用结束才知道，token 配额只能保证「用完之后不再放行新请求」，可能略微超出。
+    调用失败或被合并（没有真正请求供应商）时用 release_request 退回。
+    """
+    from .models import LLMUsage
+
+    max_requests, max_tokens = _quota_for(tenant)
+    row, _ = LLMUsage.objects.get_or_create(tenant=tenant, day=timezone.now().date())
+    qs = LLMUsage.objects.filter(id=row.id)
+    if max_requests is not None:
+        qs = qs.filter(request_count__lt=max_requests)
+    if max_tokens is not None:
+        qs = qs.filter(total_tokens__lt=max_tokens)
+    if qs.update(request_count=F("request_count") + 1, updated_at=timezone.now()):
+        return None
+    return _seconds_until_tomorrow()
+
+
+def release_request(tenant: str) -> None:
+    """退回 reserve_request 占用的一次请求额度"""
+    from .models import LLMUsage
+
+    LLMUsage.objects.filter(tenant=tenant, day=timezone.now().date(), request_count__gt=0).update(
+        request_count=F("request_count") - 1,
+        updated_at=timezone.now(),
+    )
+
+
+def record_usage(tenant: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """记录一次真实调用的 token 用量（请求数已在 reserve_request 时计入）"""
+    from .models import LLMUsage
+
+    row, _ = LLMUsage.objects.get_or_create(tenant=tenant, day=timezone.now().date())
+    LLMUsage.objects.filter(id=row.id).update(
+        prompt_tokens=F("prompt_tokens") + prompt_tokens,
+        completion_tokens=F("completion_tokens") + completion_tokens,
+        total_tokens=F("total_tokens") + prompt_tokens + completion_tokens,
+        updated_at=timezone.now(),
+    )
@@ -0,0 +1,230 @@
+# Generate_testcases/llm_scheduler.py
+"""
+大模型调用调度器：所有模型调用在真正请求供应商之前，都要先在这里排队拿到一个并发槽位。
+
+优先级（数值越小越优先）：
+- interactive：用户点击触发的小请求（单条重新生成、少量种子的生成）
+- bulk：大批量生成
+- background：后台任务
+
+调度规则：
+1. 严格优先级：只要有更高优先级的请求在排队，低优先级请求不会被放行；
+2. 预留份额：总并发 LLM_MAX_CONCURRENCY 中预留 LLM_INTERACTIVE_RESERVED 个槽位只给 interactive 使用，
+   即使 bulk 已经在跑，点击类请求也总有槽位可用；
+3. 同一优先级内按 tenant（用户/团队）加权公平排队：每个请求按所属 tenant 的权重计算虚拟完成时间，
+   虚拟完成时间最小的先放行，一个用户的大批量请求不会饿死其他用户；同一 tenant 内先来先服务。
+
+每个优先级单独统计排队时间，用于验证点击类请求的延迟 SLO。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITY_BACKGROUND = "background"
+
+# 按优先级从高到低排列
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BACKGROUND)
+
+
+class SlotCancelled(Exception):
+    """排队期间调用方取消了请求（cancel_check 返回 True）"""
+    pass
+
+
+class _Ticket:
+    """排队中的一个请求；finish 为加权公平排队的虚拟完成时间"""
+    __slots__ = ("tenant", "start", "finish", "seq")
+
+    def __init__(self, tenant, start, finish, seq):
+        self.tenant = tenant
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+
+
+class QueueStats:
+    """单个优先级的排队时间统计（秒）"""
+
+    def __init__(self, window: int = 500):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent = deque(maxlen=window)  # 最近 window 次的排队时间，用于算分位数
+
+    def record(self, wait: float) -> None:
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self._recent.append(wait)
+
+    def _percentile(self, p: float) -> float:
+        if not self._recent:
+            return 0.0
+        data = sorted(self._recent)
+        k = min(len(data) - 1, int(round(p * (len(data) - 1))))
+        return data[k]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_wait_ms": round(self.total_wait / self.count * 1000, 1) if self.count else 0.0,
+            "p50_wait_ms": round(self._percentile(0.50) * 1000, 1),
+            "p95_wait_ms": round(self._percentile(0.95) * 1000, 1),
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+class LLMScheduler:
+    """进程内的优先级调度器（线程安全）"""
+
+    CANCEL_POLL_INTERVAL = 0.5
+
+    def __init__(self, max_concurrency: int, interactive_reserved: int = 1):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency 必须大于 0")
+        self.max_concurrency = max_concurrency
+        # 预留槽位不能占满全部并发，否则 bulk 永远拿不到槽位
+        self.interactive_reserved = max(0, min(interactive_reserved, max_concurrency - 1))
+        self._cond = threading.Condition()
+        self._running = 0
+        self._queues = {p: [] for p in PRIORITIES}
+        self._stats = {p: QueueStats() for p in PRIORITIES}
+        # 加权公平排队的状态（按优先级分别维护）
+        self._vtime = {p: 0.0 for p in PRIORITIES}
+        self._last_finish = {p: {} for p in PRIORITIES}
+        self._seq = 0
+
+    def _limit_for(self, priority: str) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.max_concurrency
+        return self.max_concurrency - self.interactive_reserved
+
+    def _can_run(self, priority: str, ticket) -> bool:
+        # 更高优先级还有人排队 -> 让路
+        for p in PRIORITIES:
+            if p == priority:
+                break
+            if self._queues[p]:
+                return False
+        # 同优先级内虚拟完成时间最小的先走
+        if self._head(priority) is not ticket:
+            return False
+        return self._running < self._limit_for(priority)
+
+    def _head(self, priority: str):
+        return min(self._queues[priority], key=lambda t: (t.finish, t.seq))
+
+    def _enqueue(self, priority: str, tenant: str, weight: float):
+        last_finish = self._last_finish[priority]
+        start = max(self._vtime[priority], last_finish.get(tenant, 0.0))
+        self._seq += 1
+        ticket = _Ticket(tenant, start, start + 1.0 / weight, self._seq)
+        last_finish[tenant] = ticket.finish
+        self._queues[priority].append(ticket)
+        return ticket
+
+    def _dequeue(self, priority: str, ticket) -> None:
+        queue = self._queues[priority]
+        queue.remove(ticket)
+        if not queue:
+            # 队列清空：所有 tenant 都已追平，丢弃各 tenant 的完成时间（虚拟时间保持不变，不回退）
+            self._last_finish[priority].clear()
+
+    @contextmanager
+    def slot(
+        self,
+        priority: str = PRIORITY_BULK,
+        cancel_check: Optional[Callable[[], bool]] = None,
+        tenant: str = "",
+        weight: float = 1.0,
+    ):
+        """
+        获取一个调用槽位，with 块结束后自动释放：
+            with scheduler.slot(PRIORITY_INTERACTIVE, tenant="user:3"):
+                client.chat.completions.create(...)
+        排队期间每隔 CANCEL_POLL_INTERVAL 秒调用一次 cancel_check（可能查库，在锁外调用），
+        返回 True 时放弃排队并抛出 SlotCancelled。
+        """
+        if priority not in self._queues:
+            raise ValueError(f"未知的优先级：{priority}")
+
+        enqueued_at = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(priority, tenant, weight)
+        try:
+            while True:
+                with self._cond:
+                    if self._can_run(priority, ticket):
+                        # 低权重 tenant 的请求 start 可能早于已放行的请求：虚拟时间只前进不后退，
+                        # 否则之后入队的请求会以更早的 start 排到已等待的请求前面
+                        self._vtime[priority] = max(self._vtime[priority], ticket.start)
+                        self._dequeue(priority, ticket)
+                        self._running += 1
+                        self._stats[priority].record(time.monotonic() - enqueued_at)
+                        # 出队后队首变化，唤醒其他等待者重新判断
+                        self._cond.notify_all()
+                        break
+                    self._cond.wait(timeout=self.CANCEL_POLL_INTERVAL if cancel_check else None)
+                if cancel_check is not None and cancel_check():
+                    raise SlotCancelled()
+        except BaseException:
+            with self._cond:
+                if ticket in self._queues[priority]:
+                    self._dequeue(priority, ticket)
+                self._cond.notify_all()
+            raise
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, dict]:
+        """各优先级的排队时间统计 + 当前排队/运行情况"""
+        with self._cond:
+            data = {p: self._stats[p].snapshot() for p in PRIORITIES}
+            for p in PRIORITIES:
+                data[p]["queued"] = len(self._queues[p])
+                queued_by_tenant = {}
+                for t in self._queues[p]:
+                    queued_by_tenant[t.tenant] = queued_by_tenant.get(t.tenant, 0) + 1
+                data[p]["queued_by_tenant"] = queued_by_tenant
+            return {
+                "max_concurrency": self.max_concurrency,
+                "interactive_reserved": self.interactive_reserved,
+                "running": self._running,
+                "classes": data,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """进程级单例，参数来自 settings"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    max_concurrency=getattr(settings, "LLM_MAX_CONCURRENCY", 4),
+                    interactive_reserved=getattr(settings, "LLM_INTERACTIVE_RESERVED", 1),
+                )
+    return _scheduler
+
+
+def priority_for_session(seed_count: int) -> str:
+    """生成会话的优先级：少量种子视为交互式请求，其余按批量处理"""
+    if seed_count <= getattr(settings, "LLM_INTERACTIVE_MAX_SEEDS", 2):
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BULK
@@ -0,0 +1,167 @@
+import json
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from Generate_testcases.fields import unpack
+from Generate_testcases.models import (
+    FeatureLevel2, GenerationSession, GenerationItem, GenerationSeedConfig,
+    SavedCaseItem, GenerationArchive
+)
+
+
+class Command(BaseCommand):
+    help = '归档并删除过期的生成历史（未被最终用例引用的会话），适合定时任务执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'GENERATION_RETENTION_DAYS', 90),
+            help='保留最近多少天的会话（默认 settings.GENERATION_RETENTION_DAYS）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='每个事务归档的会话数（默认 100）',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='只统计符合条件的会话和生成项数量，不做修改',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            metavar='SESSION_ID',
+            help='查看某个已归档会话的内容（按原会话ID）',
+        )
+
+    def handle(self, *args, **options):
+        if options['show']:
+            self._show(options['show'])
+            return
+
+        if options['days'] < 1:
+            raise CommandError('--days 至少为 1')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        chunk_size = max(1, options['chunk_size'])
+
+        candidates = self._candidates(cutoff)
+        if options['dry_run']:
+            sessions = candidates.count()
+            items = GenerationItem.objects.filter(session__in=candidates).count()
+            self.stdout.write(self.style.WARNING(
+                f'DRY RUN：{cutoff:%Y-%m-%d %H:%M} 之前、未被最终用例引用的会话 {sessions} 个，生成项 {items} 条'
+            ))
+            return
+
+        self.stdout.write(f'开始归档 {cutoff:%Y-%m-%d %H:%M} 之前的生成历史...')
+        started = time.monotonic()
+        total_sessions = total_items = 0
+        raw_bytes = packed_bytes = 0
+        collided = []
+        last_id = 0
+        while True:
+            # 按主键游标分块：每块重新按条件筛选，期间新被引用的会话不会被归档
+            ids = list(
+                candidates.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                # 加锁后再确认一次仍未被引用，避免与并发的「保存到最终库」冲突
+                ids = list(
+                    self._candidates(cutoff).filter(id__in=ids).select_for_update().values_list('id', flat=True)
+                )
+                # 已有同 session_id 的归档：主键被重用（reset_database / reorder_ids 后自增值从头开始），
+                # 那一行属于另一个已删除的会话。跳过这些会话、保留热表数据，不能覆盖或丢弃任何一方
+                taken = set(
+                    GenerationArchive.objects.filter(session_id__in=ids).values_list('session_id', flat=True)
+                )
+                if taken:
+                    collided.extend(sorted(taken))
+                    ids = [session_id for session_id in ids if session_id not in taken]
+                if not ids:
+                    continue
+                archived_items, raw, packed = self._archive(ids)
+                GenerationItem.objects.filter(session_id__in=ids).update(regen_from_item=None)
+                GenerationItem.objects.filter(session_id__in=ids).delete()
+                GenerationSession.objects.filter(id__in=ids).delete()
+            total_sessions += len(ids)
+            total_items += archived_items
+            raw_bytes += raw
+            packed_bytes += packed
+            self.stdout.write(f'    已归档 {total_sessions} 个会话 / {total_items} 条生成项')
+
+        if collided:
+            self.stdout.write(self.style.WARNING(
+                f'\n⚠ {len(collided)} 个会话的 ID 已有归档记录（主键被重用），未归档、未删除：'
+                f'{", ".join(map(str, collided[:20]))}{" ..." if len(collided) > 20 else ""}'
+            ))
+        ratio = f'{packed_bytes / raw_bytes:.1%}' if raw_bytes else '-'
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✓ 归档完成：{total_sessions} 个会话，{total_items} 条生成项，'
+            f'压缩后 {packed_bytes} / {raw_bytes} 字节（{ratio}），耗时 {time.monotonic() - started:.1f}s'
+        ))
+
+    def _candidates(self, cutoff):
+        """可归档的会话：早于 cutoff，未被最终用例引用（来源会话或来源生成项），且不是场景当前展示的会话"""
+        return (
+            GenerationSession.objects
+            .filter(created_at__lt=cutoff)
+            .exclude(Exists(SavedCaseItem.objects.filter(from_session=OuterRef('pk'))))
+            .exclude(Exists(SavedCaseItem.objects.filter(from_gen_item__session=OuterRef('pk'))))
+            .exclude(Exists(FeatureLevel2.objects.filter(latest_session=OuterRef('pk'))))
+        )
+
+    def _archive(self, session_ids):
+        """把一批会话写入归档表，返回 (生成项数, 原始字节数, 压缩后字节数)"""
+        configs = {}
+        for row in GenerationSeedConfig.objects.filter(session_id__in=session_ids).values():
+            configs.setdefault(row['session_id'], []).append(row)
+        items = {}
+        for row in GenerationItem.objects.filter(session_id__in=session_ids).order_by('idx', 'id').values():
+            # 整个快照统一压缩，单列的压缩值先还原为文本
+            row['raw_text'] = unpack(row['raw_text'])
+            row['edited_text'] = unpack(row['edited_text'])
+            items.setdefault(row['session_id'], []).append(row)
+
+        archives = []
+        item_total = raw_total = packed_total = 0
+        for session in GenerationSession.objects.filter(id__in=session_ids).values():
+            session_items = items.get(session['id'], [])
+            raw = json.dumps(
+                {'session': session, 'seed_configs': configs.get(session['id'], []), 'items': session_items},
+                cls=DjangoJSONEncoder, ensure_ascii=False,
+            ).encode('utf-8')
+            packed = zlib.compress(raw, 6)
+            archives.append(GenerationArchive(
+                session_id=session['id'],
+                level2_id=session['level2_id'],
+                status=session['status'],
+                item_count=len(session_items),
+                session_created_at=session['created_at'],
+                payload=packed,
+            ))
+            item_total += len(session_items)
+            raw_total += len(raw)
+            packed_total += len(packed)
+        # 不忽略唯一键冲突：与已有归档冲突时整块回滚，不会在归档没写入的情况下删除会话
+        GenerationArchive.objects.bulk_create(archives)
+        return item_total, raw_total, packed_total
+
+    def _show(self, session_id):
+        archive = GenerationArchive.objects.filter(session_id=session_id).first()
+        if archive is None:
+            raise CommandError(f'没有找到会话#{session_id} 的归档')
+        data = archive.load()
+        self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2))
@@ -0,0 +1,83 @@
+import time
+import zlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Generate_testcases.fields import MAGIC, pack, unpack
+from Generate_testcases.models import GenerationItem, SavedCaseItem
+
+
+# 参与压缩的列
+TEXT_COLUMNS = [
+    (GenerationItem, 'raw_text'),
+    (GenerationItem, 'edited_text'),
+    (SavedCaseItem, 'text'),
+]
+
+
+class Command(BaseCommand):
+    help = '抽样评估长文本压缩：存储节省比例和压缩/解压的 CPU 耗时，可对比不同阈值与压缩级别'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sample',
+            type=int,
+            default=5000,
+            help='每列最多抽取的行数（按主键倒序，默认 5000）',
+        )
+        parser.add_argument(
+            '--level',
+            type=int,
+            action='append',
+            default=[],
+            help='要对比的 zlib 压缩级别（可重复，默认 settings.COMPRESSED_TEXT_LEVEL）',
+        )
+        parser.add_argument(
+            '--min-bytes',
+            type=int,
+            default=getattr(settings, 'COMPRESSED_TEXT_MIN_BYTES', 256),
+            help='压缩阈值（字节，默认 settings.COMPRESSED_TEXT_MIN_BYTES）',
+        )
+
+    def handle(self, *args, **options):
+        levels = options['level'] or [getattr(settings, 'COMPRESSED_TEXT_LEVEL', 6)]
+        if any(level < 1 or level > 9 for level in levels):
+            raise CommandError('--level 取值范围 1~9')
+        min_bytes = options['min_bytes']
+
+        for model, field in TEXT_COLUMNS:
+            rows = (
+                model.objects.exclude(**{f'{field}__isnull': True})
+                .order_by('-id').values_list(field, flat=True)[:max(1, options['sample'])]
+            )
+            stored = list(rows)
+            if not stored:
+                self.stdout.write(f'  - {model.__name__}.{field}: 无数据')
+                continue
+            texts = [unpack(value) for value in stored]
+            raw_bytes = sum(len(text.encode('utf-8')) for text in texts)
+            self.stdout.write(
+                f'\n{model.__name__}.{field}: 抽样 {len(texts)} 行，原文 {raw_bytes} 字节，'
+                f'平均 {raw_bytes // len(texts)} 字节/行'
+            )
+
+            for level in levels:
+                started = time.perf_counter()
+                packed = [pack(text, min_bytes=min_bytes, level=level) for text in texts]
+                pack_seconds = time.perf_counter() - started
+
+                started = time.perf_counter()
+                for data in packed:
+                    if data.startswith(MAGIC):
+                        zlib.decompress(data[len(MAGIC):]).decode('utf-8')
+                unpack_seconds = time.perf_counter() - started
+
+                packed_bytes = sum(len(data) for data in packed)
+                compressed_rows = sum(1 for data in packed if data.startswith(MAGIC))
+                self.stdout.write(
+                    f'  ✓ level {level}: 压缩 {compressed_rows}/{len(texts)} 行，'
+                    f'存储 {packed_bytes} 字节（{packed_bytes / raw_bytes:.1%}，节省 {raw_bytes - packed_bytes} 字节）；'
+                    f'压缩 {pack_seconds * 1e6 / len(texts):.1f}µs/行，解压 {unpack_seconds * 1e6 / len(texts):.1f}µs/行'
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ 评估完成（阈值 {min_bytes} 字节）'))
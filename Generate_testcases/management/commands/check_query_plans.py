@@ -0,0 +1,178 @@
+from datetime import timedelta
+
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from Generate_testcases import search_index, similarity
+from Generate_testcases.excel_import import _claimable_jobs
+from Generate_testcases.models import (
+    FeatureLevel1, FeatureLevel2, TestCaseSeed, GenerationSession, GenerationItem,
+    SavedCaseItem, LLMInflightCall
+)
+
+
+def _sample_ids():
+    """用库里已有的主键作为查询参数，空库时用 1"""
+    def first(model, field='id'):
+        return model.objects.order_by(field).values_list(field, flat=True).first() or 1
+
+    return {
+        'level1': first(FeatureLevel1),
+        'level2': first(FeatureLevel2),
+        'session': first(GenerationSession),
+        'seed': first(TestCaseSeed),
+        'batch': SavedCaseItem.objects.values_list('saved_batch_id', flat=True).first() or 'level2_1_0',
+    }
+
+
+# 热点查询目录：(名称, 构造查询集的函数, 允许出现的问题)
+# 与视图里的写法保持一致；新增热点查询时在这里登记
+CATALOGUE = [
+    ('workspace.level1_list', lambda ids: FeatureLevel1.objects.order_by('name'), ()),
+    ('get_level2_list', lambda ids: FeatureLevel2.objects.filter(level1_id=ids['level1']).order_by('name'), ()),
+    ('get_seed_list', lambda ids: TestCaseSeed.objects.filter(level2_id=ids['level2']).order_by('-created_at'), ()),
+    ('seed.ordinals', lambda ids: (
+        TestCaseSeed.objects.filter(level2_id=ids['level2']).order_by('created_at', 'id').values_list('id', flat=True)
+    ), ()),
+    ('seed.duplicate_check', lambda ids: TestCaseSeed.objects.filter(level2_id=ids['level2'], text_hash='0' * 64), ()),
+    ('level2_detail.items', lambda ids: (
+        GenerationItem.objects.filter(session_id=ids['session'], is_current=True).order_by('seed_id', 'idx')
+    ), ()),
+    ('save_to_final.items', lambda ids: (
+        GenerationItem.objects.filter(session_id=ids['session'], is_current=True).order_by('idx')
+        .only('id', 'idx', 'raw_text', 'edited_text', 'is_edited')
+    ), ()),
+    ('generate.reuse_items', lambda ids: (
+        GenerationItem.objects.filter(session_id=ids['session'], seed_id=ids['seed'], is_current=True).order_by('idx')[:10]
+    ), ()),
+    ('regenerate.retire_current', lambda ids: (
+        GenerationItem.objects.filter(session_id=ids['session'], idx__in=[0, 1], is_current=True)
+    ), ()),
+    ('level2_sessions', lambda ids: (
+        GenerationSession.objects.filter(level2_id=ids['level2']).order_by('-id')[:21]
+    ), ()),
+    ('export.by_level2', lambda ids: (
+        SavedCaseItem.objects.filter(level2_id=ids['level2']).order_by('saved_batch_id', 'idx')
+    ), ()),
+    ('export.by_batch', lambda ids: (
+        SavedCaseItem.objects.filter(saved_batch_id=ids['batch']).order_by('saved_batch_id', 'idx')
+    ), ()),
+    ('import.claimable_jobs', lambda ids: _claimable_jobs(include_failed=True), ()),
+    ('llm.expired_inflight', lambda ids: (
+        LLMInflightCall.objects.filter(finished_at__lt=timezone.now() - timedelta(minutes=5))
+    ), ()),
+    # 按聚合结果排序的检索必然需要排序/临时表；参与分组的只有有限的候选文档（SEARCH_MAX_CANDIDATES），
+    # 规模有上限，这里只检查是否走了 token 索引
+    ('search.saved', lambda ids: search_index.ranked('saved', '登录失败')[:21], ('filesort', 'temporary')),
+    ('search.seed_in_level2', lambda ids: (
+        search_index.ranked('seed', '登录失败', level2_id=ids['level2'])[:21]
+    ), ('filesort', 'temporary')),
+    ('similarity.candidates', lambda ids: (
+        similarity.candidate_bands(similarity.signature('用户登录失败后提示密码错误'), level2_id=ids['level2'])[0]
+        .values_list('seed_id', 'saved_item_id')[:31]
+    ), ()),
+]
+
+
+# 以 MySQL 的执行计划为准；本地 sqlite 只输出警告：Django 在 sqlite 上把布尔字段条件写成裸列
+# （WHERE is_current 而不是 = 1），联合索引里的布尔列用不上，计划与生产库不同
+class Command(BaseCommand):
+    help = '对热点查询目录逐条执行 EXPLAIN，出现全表扫描或额外排序（filesort）时失败，用于索引回归检查'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            action='append',
+            default=[],
+            metavar='NAME',
+            help='只检查指定名称的查询（可重复）',
+        )
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='表（或估算扫描行数）小于该值时忽略全表扫描，小表上优化器本就倾向全表扫描（默认 1000）',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            raise CommandError(f'不支持的数据库：{connection.vendor}')
+        names = [name for name, _, _ in CATALOGUE]
+        unknown = set(options['only']) - set(names)
+        if unknown:
+            raise CommandError(f'未知的查询：{", ".join(sorted(unknown))}；可选：{", ".join(names)}')
+
+        strict = connection.vendor == 'mysql'
+        ids = _sample_ids()
+        failures = 0
+        for name, build, allowed in CATALOGUE:
+            if options['only'] and name not in options['only']:
+                continue
+            try:
+                sql, params = build(ids).query.sql_with_params()
+            except EmptyResultSet:
+                # 例如检索词在库里没有候选文档：查询不会发到数据库，没有执行计划可查
+                self.stdout.write(f'  - {name}: 条件恒为空，跳过')
+                continue
+            with connection.cursor() as cursor:
+                if connection.vendor == 'mysql':
+                    plan, problems = self._explain_mysql(cursor, sql, params, options['min_rows'])
+                else:
+                    plan, problems = self._explain_sqlite(cursor, sql, params, options['min_rows'])
+            problems = [problem for kind, problem in problems if kind not in allowed]
+
+            if problems:
+                failures += 1
+                style = self.style.ERROR if strict else self.style.WARNING
+                self.stdout.write(style(f'  ✗ {name}: {"；".join(problems)}'))
+            else:
+                self.stdout.write(f'  ✓ {name}')
+            if problems or options['verbosity'] > 1:
+                for line in plan:
+                    self.stdout.write(f'      {line}')
+
+        if failures and strict:
+            raise CommandError(f'{failures} 条查询的执行计划不符合要求')
+        if failures:
+            self.stdout.write(self.style.WARNING(f'\n{failures} 条查询的执行计划可能有问题（sqlite 仅供参考，请在 MySQL 上确认）'))
+            return
+        self.stdout.write(self.style.SUCCESS('\n✓ 所有查询都走了索引'))
+
+    def _explain_mysql(self, cursor, sql, params, min_rows):
+        """返回 (计划文本行, [(问题类型, 描述)])"""
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [col[0].lower() for col in cursor.description]
+        plan, problems = [], []
+        for values in cursor.fetchall():
+            row = dict(zip(columns, values))
+            extra = row.get('extra') or ''
+            plan.append(
+                f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} extra={extra}"
+            )
+            if row['type'] == 'ALL' and (row['rows'] or 0) >= min_rows:
+                problems.append(('scan', f"{row['table']} 全表扫描（约 {row['rows']} 行）"))
+            if 'Using filesort' in extra:
+                problems.append(('filesort', f"{row['table']} 需要额外排序（filesort）"))
+            if 'Using temporary' in extra:
+                problems.append(('temporary', f"{row['table']} 使用临时表"))
+        return plan, problems
+
+    def _explain_sqlite(self, cursor, sql, params, min_rows):
+        """本地 sqlite：按 EXPLAIN QUERY PLAN 的文字判断"""
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan, problems = [], []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            plan.append(detail)
+            if detail.startswith('SCAN ') and ' USING ' not in detail:
+                table = detail.split()[1]
+                cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                count = cursor.fetchone()[0]
+                if count >= min_rows:
+                    problems.append(('scan', f'{table} 全表扫描（{count} 行）'))
+            if 'TEMP B-TREE FOR ORDER BY' in detail or 'TEMP B-TREE FOR RIGHT PART OF ORDER BY' in detail:
+                problems.append(('filesort', '需要额外排序（临时 B 树）'))
+            if 'TEMP B-TREE FOR GROUP BY' in detail or 'TEMP B-TREE FOR DISTINCT' in detail:
+                problems.append(('temporary', '使用临时 B 树分组/去重'))
+        return plan, problems
@@ -0,0 +1,68 @@
+import os
+import shutil
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from Generate_testcases.excel_export import open_export
+from Generate_testcases.models import FeatureLevel2, SavedCaseItem
+
+
+class Command(BaseCommand):
+    help = '把最终用例（SavedCaseItem）导出为 Excel：按场景或按保存批次，每个一份文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--level2',
+            type=int,
+            action='append',
+            default=[],
+            help='按场景导出（二级功能ID，可重复）',
+        )
+        parser.add_argument(
+            '--batch',
+            action='append',
+            default=[],
+            help='按保存批次导出（saved_batch_id，可重复）',
+        )
+        parser.add_argument(
+            '--all-batches',
+            action='store_true',
+            help='每个保存批次导出一份文件（可与 --level2 一起使用，只导出这些场景的批次）',
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='输出目录（默认当前目录）',
+        )
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+
+        targets = []  # [(文件名, level2_id, batch_id)]
+        if options['all_batches']:
+            qs = SavedCaseItem.objects.all()
+            if options['level2']:
+                qs = qs.filter(level2_id__in=options['level2'])
+            for batch_id in qs.order_by('saved_batch_id').values_list('saved_batch_id', flat=True).distinct():
+                targets.append((f'{batch_id}.xlsx', None, batch_id))
+        else:
+            for level2_id in options['level2']:
+                level2 = FeatureLevel2.objects.filter(id=level2_id).first()
+                if level2 is None:
+                    raise CommandError(f'二级功能不存在：{level2_id}')
+                targets.append((f'level2_{level2_id}_{level2.name}.xlsx', level2_id, None))
+            for batch_id in options['batch']:
+                targets.append((f'{batch_id}.xlsx', None, batch_id))
+
+        if not targets:
+            raise CommandError('请指定 --level2、--batch 或 --all-batches')
+
+        for filename, level2_id, batch_id in targets:
+            started = time.monotonic()
+            path = os.path.join(output_dir, filename.replace('/', '_'))
+            with open_export(level2_id=level2_id, batch_id=batch_id) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            self.stdout.write(f'  ✓ {path} ({time.monotonic() - started:.2f}s)')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ 导出完成，共 {len(targets)} 个文件'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Generate_testcases import similarity
+
+
+class Command(BaseCommand):
+    help = '按主键分块重建近似重复检测的 MinHash 签名和分桶（种子用例、最终用例），上线或调整分段参数后执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            action='append',
+            default=[],
+            choices=sorted(similarity.KINDS),
+            help='只重建指定类型（可重复）：seed 种子用例；saved 最终用例。默认全部',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='每个事务处理的文档数（默认 500）',
+        )
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or sorted(similarity.KINDS):
+            name = similarity.KINDS[kind][1].__name__
+            started = time.monotonic()
+            docs, indexed = similarity.rebuild(
+                kind,
+                chunk_size=max(1, options['chunk_size']),
+                on_chunk=lambda done, name=name: self.stdout.write(f'    {name}: {done}'),
+            )
+            self.stdout.write(f'  ✓ {name}: {docs} 个文档，{indexed} 个签名 ({time.monotonic() - started:.2f}s)')
+
+        self.stdout.write(self.style.SUCCESS('\n✓ 相似度索引已重建'))
@@ -1,4 +1,7 @@
-from django.core.management.base import BaseCommand
+# Django management commands
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 from Generate_testcases.models import (
     FeatureLevel1, FeatureLevel2, TestCaseSeed,
@@ -16,10 +19,20 @@ class Command(BaseCommand):
             action='store_true',
             help='仅显示将要执行的操作，不实际修改数据',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='每批处理的行数（默认 10000）',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        
+        self.chunk_size = max(1, options['chunk_size'])
+
+        if not dry_run and connection.vendor != 'mysql':
+            raise CommandError('ID重排依赖 MySQL 语法（多表 UPDATE / FOREIGN_KEY_CHECKS），当前数据库不支持')
+
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN 模式 - 不会实际修改数据'))
         else:
@@ -52,137 +65,139 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('\n✓ ID重排完成！'))
 
     def _reorder_model_ids(self, model, model_name, dry_run=False):
-        """重排单个模型的ID，并同步更新所有外键"""
-        items = list(model.objects.all().order_by('id'))
-        
-        if not items:
-            return f'✓ {model_name}: 无数据，跳过'
-        
-        # 建立ID映射表 {旧ID: 新ID}
-        id_mapping = {}
-        needs_reorder = False
-        for idx, item in enumerate(items, start=1):
-            id_mapping[item.id] = idx
-            if item.id != idx:
-                needs_reorder = True
-        
-        if not needs_reorder:
-            return f'✓ {model_name}: ID已连续，无需重排 (1-{len(items)})'
-        
+        """
+        重排单个模型的ID，并同步更新所有外键（集合操作，按块执行）：
+        1. 用窗口函数 ROW_NUMBER() 生成 {旧ID: 新ID} 映射，写入临时表（只保留需要变化的行）
+        2. 子表外键：按旧ID升序分块，JOIN 映射表一次改一批
+        3. 主表ID：先 JOIN 映射表改成负的新ID（避免主键冲突），再整体翻回正数
+        总耗时约等于几次全表扫描，与「行数 × 外键表数」无关
+        """
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*), MAX(id) FROM {table}')
+            total, max_id = cursor.fetchone()
+            if not total:
+                return f'✓ {model_name}: 无数据，跳过'
+
+            # 需要变化的行数：id 与其排名不一致的行
+            cursor.execute(
+                f'SELECT COUNT(*), MIN(id) FROM ('
+                f'  SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS rn FROM {table}'
+                f') ranked WHERE id <> rn'
+            )
+            moving, first_moving = cursor.fetchone()
+
+        if not moving:
+            return f'✓ {model_name}: ID已连续，无需重排 (1-{total})'
+
+        fk_columns = self._referencing_columns(model)
+
         if dry_run:
-            old_ids = [item.id for item in items]
-            new_ids = list(range(1, len(items) + 1))
-            return f'⚠ {model_name}: 将重排 {len(items)} 条记录\n    旧ID: {old_ids}\n    新ID: {new_ids}'
-        
-        # 实际执行重排
-        table_name = model._meta.db_table
-        
+            refs = ', '.join(f'{t}.{c}' for t, c in fk_columns) or '无'
+            return (
+                f'⚠ {model_name}: 共 {total} 条，其中 {moving} 条需要重排'
+                f'（ID {first_moving}-{max_id} → 连续编号 1-{total}）\n'
+                f'    同步外键: {refs}'
+            )
+
+        started = time.monotonic()
+        map_table = qn(f'tmp_reorder_{model._meta.db_table}')
+
         with connection.cursor() as cursor:
             # 临时禁用外键检查
             cursor.execute('SET FOREIGN_KEY_CHECKS=0')
-            
+
             try:
-                # 🔧 修复：先同步外键到负数，BEFORE更新主表
-                # 这样可以确保在更新主表ID之前，外键已经跟随变化
-                self._update_foreign_keys_to_negative(model_name, id_mapping, cursor)
-                
-                # 1. 将主表所有ID设为负数（避免冲突）
-                for old_id in id_mapping.keys():
-                    cursor.execute(f"UPDATE {table_name} SET id = -{old_id} WHERE id = {old_id}")
-                
-                # 2. 重新分配正数ID（主表）
-                for old_id, new_id in id_mapping.items():
-                    cursor.execute(f"UPDATE {table_name} SET id = {new_id} WHERE id = -{old_id}")
-                
-                # 3. 同步外键到正数（与主表新ID对应）
-                self._update_foreign_keys_to_positive(model_name, id_mapping, cursor)
-                
+                cursor.execute(f'DROP TEMPORARY TABLE IF EXISTS {map_table}')
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE {map_table} ('
+                    f'  old_id BIGINT NOT NULL PRIMARY KEY,'
+                    f'  new_id BIGINT NOT NULL UNIQUE'
+                    f')'
+                )
+
+                # 1. 分块生成映射：每块内 ROW_NUMBER() 加上之前的行数即为全局新ID
+                offset = 0
+                last_id = 0
+                while True:
+                    hi = self._chunk_upper_bound(cursor, table, 'id', last_id)
+                    if hi is None:
+                        break
+                    cursor.execute(
+                        f'INSERT INTO {map_table} (old_id, new_id) '
+                        f'SELECT old_id, new_id FROM ('
+                        f'  SELECT id AS old_id, %s + ROW_NUMBER() OVER (ORDER BY id) AS new_id'
+                        f'  FROM {table} WHERE id > %s AND id <= %s'
+                        f') chunk WHERE old_id <> new_id',
+                        [offset, last_id, hi],
+                    )
+                    cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE id > %s AND id <= %s', [last_id, hi])
+                    offset += cursor.fetchone()[0]
+                    last_id = hi
+                self.stdout.write(f'    {model_name}: 映射表已生成（{moving} 条需要重排）')
+
+                # 2. 同步子表外键。按旧ID升序处理：新ID总小于旧ID，已改过的值不会被后续批次再次匹配
+                for child_table, fk_column in fk_columns:
+                    self._for_each_map_chunk(
+                        cursor, map_table, moving,
+                        f'UPDATE {qn(child_table)} c JOIN {map_table} m ON c.{qn(fk_column)} = m.old_id '
+                        f'SET c.{qn(fk_column)} = m.new_id '
+                        f'WHERE m.old_id > %s AND m.old_id <= %s',
+                        f'{model_name} → {child_table}.{fk_column}',
+                    )
+
+                # 3. 主表ID：先改成负的新ID，再翻回正数
+                self._for_each_map_chunk(
+                    cursor, map_table, moving,
+                    f'UPDATE {table} t JOIN {map_table} m ON t.id = m.old_id '
+                    f'SET t.id = -m.new_id '
+                    f'WHERE m.old_id > %s AND m.old_id <= %s',
+                    f'{model_name} 主键',
+                )
+                cursor.execute(f'UPDATE {table} SET id = -id WHERE id < 0')
+
                 # 4. 重置AUTO_INCREMENT
-                next_id = len(items) + 1
-                cursor.execute(f"ALTER TABLE {table_name} AUTO_INCREMENT = {next_id}")
-                
+                cursor.execute(f'ALTER TABLE {table} AUTO_INCREMENT = {total + 1}')
+
             finally:
+                cursor.execute(f'DROP TEMPORARY TABLE IF EXISTS {map_table}')
                 # 重新启用外键检查
                 cursor.execute('SET FOREIGN_KEY_CHECKS=1')
-        
-        return f'✓ {model_name}: 已重排 {len(items)} 条记录 (1-{len(items)}，下一个ID: {len(items)+1})'
-    
-    def _update_foreign_keys_to_negative(self, model_name, id_mapping, cursor):
-        """第一步：将所有外键改为负数（在主表ID改变之前）"""
-        
-        # 定义外键关系映射：{模型名: [(子表名, 外键列名)]}
-        fk_updates = {
-            'FeatureLevel1': [
-                ('generate_testcases_featurelevel2', 'level1_id'),
-            ],
-            'FeatureLevel2': [
-                ('generate_testcases_testcaseseed', 'level2_id'),
-                ('generate_testcases_generationsession', 'level2_id'),
-                ('generate_testcases_savedcaseitem', 'level2_id'),
-            ],
-            'TestCaseSeed': [
-                ('generate_testcases_generationseedconfig', 'seed_id'),
-                ('generate_testcases_generationitem', 'seed_id'),
-            ],
-            'GenerationSession': [
-                ('generate_testcases_generationseedconfig', 'session_id'),
-                ('generate_testcases_generationitem', 'session_id'),
-                ('generate_testcases_savedcaseitem', 'from_session_id'),
-            ],
-            'GenerationItem': [
-                ('generate_testcases_generationitem', 'regen_from_item_id'),
-                ('generate_testcases_savedcaseitem', 'from_gen_item_id'),
-            ],
-        }
-        
-        if model_name not in fk_updates:
-            return
-        
-        # 关键：此时主表ID还是原始值，所以我们用原始ID来查找外键
-        for table, fk_column in fk_updates[model_name]:
-            for old_id in id_mapping.keys():
-                # 将外键从旧ID改为负数
-                cursor.execute(
-                    f"UPDATE {table} SET {fk_column} = -{old_id} "
-                    f"WHERE {fk_column} = {old_id}"
-                )
-    
-    def _update_foreign_keys_to_positive(self, model_name, id_mapping, cursor):
-        """第二步：将所有外键改为新的正数ID（在主表ID改变之后）"""
-        
-        # 定义外键关系映射：{模型名: [(子表名, 外键列名)]}
-        fk_updates = {
-            'FeatureLevel1': [
-                ('generate_testcases_featurelevel2', 'level1_id'),
-            ],
-            'FeatureLevel2': [
-                ('generate_testcases_testcaseseed', 'level2_id'),
-                ('generate_testcases_generationsession', 'level2_id'),
-                ('generate_testcases_savedcaseitem', 'level2_id'),
-            ],
-            'TestCaseSeed': [
-                ('generate_testcases_generationseedconfig', 'seed_id'),
-                ('generate_testcases_generationitem', 'seed_id'),
-            ],
-            'GenerationSession': [
-                ('generate_testcases_generationseedconfig', 'session_id'),
-                ('generate_testcases_generationitem', 'session_id'),
-                ('generate_testcases_savedcaseitem', 'from_session_id'),
-            ],
-            'GenerationItem': [
-                ('generate_testcases_generationitem', 'regen_from_item_id'),
-                ('generate_testcases_savedcaseitem', 'from_gen_item_id'),
-            ],
-        }
-        
-        if model_name not in fk_updates:
-            return
-        
-        # 此时主表ID已经是新ID，外键是负数，我们将负数改为新ID
-        for table, fk_column in fk_updates[model_name]:
-            for old_id, new_id in id_mapping.items():
-                # 将外键从负数改为新ID
-                cursor.execute(
-                    f"UPDATE {table} SET {fk_column} = {new_id} "
-                    f"WHERE {fk_column} = -{old_id}"
-                )
+
+        elapsed = time.monotonic() - started
+        return f'✓ {model_name}: 已重排 {moving} 条记录 (1-{total}，下一个ID: {total + 1}，耗时 {elapsed:.1f}s)'
+
+    def _referencing_columns(self, model):
+        """所有指向该模型的外键列 [(子表名, 外键列名)]，从模型元数据中获取"""
+        columns = []
+        for other in model._meta.apps.get_models():
+            for field in other._meta.concrete_fields:
+                if field.is_relation and field.related_model is model:
+                    columns.append((other._meta.db_table, field.column))
+        return columns
+
+    def _chunk_upper_bound(self, cursor, table, column, last_value):
+        """从 last_value 之后取 chunk_size 行，返回这一块的最大值；没有剩余行时返回 None"""
+        cursor.execute(
+            f'SELECT MAX({column}) FROM ('
+            f'  SELECT {column} FROM {table} WHERE {column} > %s ORDER BY {column} LIMIT %s'
+            f') chunk',
+            [last_value, self.chunk_size],
+        )
+        return cursor.fetchone()[0]
+
+    def _for_each_map_chunk(self, cursor, map_table, total, sql, label):
+        """按映射表 old_id 升序分块执行 sql（参数为块的上下界），并输出进度"""
+        done = 0
+        last_id = 0
+        while True:
+            hi = self._chunk_upper_bound(cursor, map_table, 'old_id', last_id)
+            if hi is None:
+                break
+            cursor.execute(sql, [last_id, hi])
+            cursor.execute(f'SELECT COUNT(*) FROM {map_table} WHERE old_id > %s AND old_id <= %s', [last_id, hi])
+            done += cursor.fetchone()[0]
+            last_id = hi
+            self.stdout.write(f'    {label}: {done}/{total}')
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from Generate_testcases import counters
+
+
+class Command(BaseCommand):
+    help = '按实际数据重算计数列（一级/二级功能的二级功能数、种子数、最终用例数，会话的生成项数）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            default=[],
+            choices=[model.__name__ for model in counters.RECOUNTS],
+            help='只重算指定模型（可重复），默认全部',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每条 UPDATE 处理的行数（默认 1000）',
+        )
+
+    def handle(self, *args, **options):
+        selected = set(options['model'])
+        for model in counters.RECOUNTS:
+            if selected and model.__name__ not in selected:
+                continue
+            started = time.monotonic()
+            fields = ', '.join(counters.RECOUNTS[model])
+            total = counters.recompute(
+                model,
+                chunk_size=max(1, options['chunk_size']),
+                on_chunk=lambda done, name=model.__name__: self.stdout.write(f'    {name}: {done}'),
+            )
+            self.stdout.write(f'  ✓ {model.__name__} ({fields}): 重算 {total} 行 ({time.monotonic() - started:.2f}s)')
+
+        self.stdout.write(self.style.SUCCESS('\n✓ 计数列已重算'))
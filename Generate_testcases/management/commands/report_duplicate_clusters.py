@@ -0,0 +1,109 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from Generate_testcases import similarity
+from Generate_testcases.models import MinHashBand, MinHashSignature
+
+
+class Command(BaseCommand):
+    help = '按 MinHash 分桶找出近似重复的种子用例 / 最终用例，输出重复簇（不做两两比较）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=['all'] + sorted(similarity.KINDS),
+            default='seed',
+            help='参与聚类的文档类型（默认 seed）',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=None,
+            help='相似度下限（默认 settings.SIMILARITY_THRESHOLD）',
+        )
+        parser.add_argument(
+            '--level1',
+            type=int,
+            default=None,
+            help='只统计该一级功能下的文档',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='最多输出多少个簇（按大小倒序，默认 50）',
+        )
+
+    def handle(self, *args, **options):
+        threshold = similarity.default_threshold() if options['threshold'] is None else options['threshold']
+        if not 0 < threshold <= 1:
+            raise CommandError('--threshold 取值范围 (0, 1]')
+        kinds = tuple(similarity.KINDS) if options['kind'] == 'all' else (options['kind'],)
+        started = time.monotonic()
+
+        signatures = MinHashSignature.objects.all()
+        if options['kind'] != 'all':
+            signatures = signatures.filter(**{f'{similarity.KINDS[options["kind"]][0]}__isnull': False})
+        if options['level1']:
+            signatures = signatures.filter(level2__level1_id=options['level1'])
+
+        # 签名全部读入内存：每个 256 字节，百万级文档约数百 MB，超出时按一级功能分批执行
+        sigs = {}
+        level2_of = {}
+        for row in signatures.only('seed_id', 'saved_item_id', 'level2_id', 'signature').iterator(chunk_size=2000):
+            key = similarity.doc_key(row)
+            sigs[key] = similarity.unpack_signature(row.signature)
+            level2_of[key] = row.level2_id
+        self.stdout.write(f'读取签名 {len(sigs)} 个 ({time.monotonic() - started:.2f}s)')
+
+        # 并查集：同桶的文档只与桶内第一个文档比较，相似则合并
+        parent = {}
+
+        def find(key):
+            root = key
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while key != root:
+                parent[key], key = root, parent[key]
+            return root
+
+        compared = 0
+        bucket_key = None
+        first = None
+        rows = (
+            MinHashBand.objects.order_by('band', 'bucket')
+            .values_list('band', 'bucket', 'seed_id', 'saved_item_id')
+            .iterator(chunk_size=5000)
+        )
+        for band, bucket, seed_id, saved_item_id in rows:
+            key = ('seed', seed_id) if seed_id else ('saved', saved_item_id)
+            if key not in sigs:
+                continue
+            if (band, bucket) != bucket_key:
+                bucket_key, first = (band, bucket), key
+                continue
+            root_a, root_b = find(first), find(key)
+            if root_a == root_b:
+                continue
+            compared += 1
+            if similarity.estimate(sigs[first], sigs[key]) >= threshold:
+                parent[root_b] = root_a
+
+        clusters = {}
+        for key in sigs:
+            clusters.setdefault(find(key), []).append(key)
+        clusters = sorted((members for members in clusters.values() if len(members) > 1), key=len, reverse=True)
+
+        redundant = sum(len(members) - 1 for members in clusters)
+        self.stdout.write(
+            f'比较候选 {compared} 次，发现 {len(clusters)} 个重复簇，可合并 {redundant} 个文档 '
+            f'({time.monotonic() - started:.2f}s)'
+        )
+        for number, members in enumerate(clusters[:max(0, options['limit'])], start=1):
+            members.sort()
+            self.stdout.write(f'\n  簇 {number}（{len(members)} 个）')
+            for kind, doc_id in members:
+                label = '种子' if kind == 'seed' else '最终用例'
+                self.stdout.write(f'    - {label}#{doc_id}（二级功能#{level2_of[(kind, doc_id)]}）')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ 报告完成（阈值 {threshold}，类型 {", ".join(kinds)}）'))
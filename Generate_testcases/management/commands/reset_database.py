@@ -1,14 +1,26 @@
-from django.core.management.base import BaseCommand
-from django.db import connection
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models
+from Generate_testcases import counters, search_index, similarity
 from Generate_testcases.models import (
-    FeatureLevel1, FeatureLevel2, TestCaseSeed,
     GenerationSession, GenerationItem, GenerationSeedConfig,
-    SavedCaseItem
+    SavedCaseItem, LLMInflightCall, LLMUsage, GenerationArchive, SearchPosting, MinHashSignature
 )
 
 
+# 预置的清理范围；all 为本应用的全部表（包括以后新增的表）
+SCOPES = {
+    'history': [GenerationSession, GenerationSeedConfig, GenerationItem, GenerationArchive],
+    'saved': [SavedCaseItem],
+    'llm': [LLMInflightCall, LLMUsage],
+}
+
+
 class Command(BaseCommand):
-    help = '清空所有测试用例数据并重置自增ID'
+    help = '清空测试用例数据并重置自增ID（TRUNCATE，不经过 ORM 级联删除）'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,50 +28,143 @@ class Command(BaseCommand):
             action='store_true',
             help='强制执行，不需要确认',
         )
+        parser.add_argument(
+            '--scope',
+            choices=['all'] + sorted(SCOPES),
+            default='all',
+            help='清理范围：all 全部；history 生成历史；saved 最终用例；llm 调用锁与用量统计',
+        )
+        parser.add_argument(
+            '--table',
+            action='append',
+            default=[],
+            metavar='MODEL',
+            help='只清空指定模型（可重复），例如 --table GenerationItem；指定后忽略 --scope',
+        )
 
     def handle(self, *args, **options):
+        app_config = apps.get_app_config('Generate_testcases')
+
+        if options['table']:
+            try:
+                selected = [app_config.get_model(name) for name in options['table']]
+            except LookupError as e:
+                raise CommandError(str(e))
+        elif options['scope'] == 'all':
+            selected = list(app_config.get_models())
+        else:
+            selected = SCOPES[options['scope']]
+
+        to_clear, to_detach = self._plan(selected)
+        names = ', '.join(m.__name__ for m in to_clear)
+
         if not options['force']:
-            confirm = input('此操作将删除所有数据！是否继续？(yes/no): ')
+            confirm = input(f'此操作将清空以下表的全部数据：{names}\n是否继续？(yes/no): ')
             if confirm.lower() != 'yes':
                 self.stdout.write(self.style.WARNING('操作已取消'))
                 return
 
         self.stdout.write('开始清空数据...')
+        started = time.monotonic()
 
-        # 按依赖顺序删除（先删除子表，后删除父表）
-        models_to_clear = [
-            ('SavedCaseItem', SavedCaseItem),
-            ('GenerationItem', GenerationItem),
-            ('GenerationSeedConfig', GenerationSeedConfig),
-            ('GenerationSession', GenerationSession),
-            ('TestCaseSeed', TestCaseSeed),
-            ('FeatureLevel2', FeatureLevel2),
-            ('FeatureLevel1', FeatureLevel1),
-        ]
-
-        for model_name, model in models_to_clear:
-            count = model.objects.count()
-            model.objects.all().delete()
-            self.stdout.write(f'  ✓ {model_name}: 删除 {count} 条记录')
-
-        # 重置MySQL自增ID
-        self.stdout.write('\n重置自增ID...')
         with connection.cursor() as cursor:
-            tables = [
-                'generate_testcases_savedcaseitem',
-                'generate_testcases_generationitem',
-                'generate_testcases_generationseedconfig',
-                'generate_testcases_generationsession',
-                'generate_testcases_testcaseseed',
-                'generate_testcases_featurelevel2',
-                'generate_testcases_featurelevel1',
+            if connection.vendor == 'mysql':
+                # TRUNCATE 会隐式提交，且会同时重置 AUTO_INCREMENT；外键检查只在这个窗口内关闭
+                cursor.execute('SET FOREIGN_KEY_CHECKS=0')
+            try:
+                # 范围外的表里 SET_NULL 的外键先置空，避免留下悬空引用
+                for model, field in to_detach:
+                    t0 = time.monotonic()
+                    updated = model.objects.filter(**{f'{field.name}__isnull': False}).update(**{field.name: None})
+                    self.stdout.write(
+                        f'  ✓ {model.__name__}.{field.name}: 置空 {updated} 条引用 ({time.monotonic() - t0:.2f}s)'
+                    )
+
+                # 按依赖顺序清空（先子表，后父表）
+                for model in to_clear:
+                    t0 = time.monotonic()
+                    count = model.objects.count()
+                    self._truncate(cursor, model)
+                    self.stdout.write(f'  ✓ {model.__name__}: 清空 {count} 条记录 ({time.monotonic() - t0:.2f}s)')
+            finally:
+                if connection.vendor == 'mysql':
+                    cursor.execute('SET FOREIGN_KEY_CHECKS=1')
+
+        # 保留下来的表里，统计被清空子表的计数列需要重算
+        for model, children in counters.COUNTED_FROM.items():
+            if model not in to_clear and any(child in to_clear for child in children):
+                t0 = time.monotonic()
+                counters.recompute(model)
+                self.stdout.write(f'  ✓ {model.__name__}: 计数列已重算 ({time.monotonic() - t0:.2f}s)')
+
+        # 检索索引、相似度索引随任一类文档整表清空，保留下来的另一类文档需要重建索引
+        for table, index, label in [(SearchPosting, search_index, '检索索引'), (MinHashSignature, similarity, '相似度索引')]:
+            if table not in to_clear:
+                continue
+            for kind, (_, model) in index.KINDS.items():
+                if model not in to_clear:
+                    t0 = time.monotonic()
+                    docs, _ = index.rebuild(kind)
+                    self.stdout.write(f'  ✓ {model.__name__}: {label}已重建 {docs} 个文档 ({time.monotonic() - t0:.2f}s)')
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ 数据已清空并重置自增ID！总耗时 {time.monotonic() - started:.2f}s'))
+
+    def _truncate(self, cursor, model):
+        table = model._meta.db_table
+        if connection.vendor == 'mysql':
+            cursor.execute(f'TRUNCATE TABLE {connection.ops.quote_name(table)}')
+            return
+        # 其他数据库（如本地 sqlite）用 Django 自带的 flush 语句，同样会重置自增序列
+        for sql in connection.ops.sql_flush(no_style(), [table], reset_sequences=True):
+            cursor.execute(sql)
+
+    def _plan(self, selected):
+        """
+        计算需要清空的表和需要置空的外键：
+        - 范围外的表通过 CASCADE 外键引用了范围内的表：一并清空（与 ORM 删除的结果一致）
+        - 通过 SET_NULL / 其他方式引用：保留数据，只把该外键列置空
+        返回 (按依赖顺序排列的模型列表, [(模型, 外键字段)])
+        """
+        app_models = list(apps.get_app_config('Generate_testcases').get_models())
+        clear = set(selected)
+        changed = True
+        while changed:
+            changed = False
+            for model in app_models:
+                if model in clear:
+                    continue
+                for field in model._meta.concrete_fields:
+                    if (field.is_relation and field.related_model in clear
+                            and field.remote_field.on_delete is models.CASCADE):
+                        clear.add(model)
+                        changed = True
+                        break
+
+        detach = []
+        for model in app_models:
+            if model in clear:
+                continue
+            for field in model._meta.concrete_fields:
+                if field.is_relation and field.related_model in clear:
+                    if not field.null:
+                        raise CommandError(f'{model.__name__}.{field.name} 引用了待清空的表且不允许为空，请一并清空')
+                    detach.append((model, field))
+
+        # 拓扑排序：被引用的表排在引用它的表之后
+        ordered = []
+        pending = set(clear)
+        while pending:
+            ready = [
+                m for m in pending
+                if not any(
+                    f.is_relation and f.related_model is m
+                    for other in pending if other is not m
+                    for f in other._meta.concrete_fields
+                )
             ]
-            
-            for table in tables:
-                try:
-                    cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = 1")
-                    self.stdout.write(f'  ✓ {table}: 自增ID已重置')
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'  ✗ {table}: {str(e)}'))
-
-        self.stdout.write(self.style.SUCCESS('\n✓ 数据库已清空并重置！'))
+            if not ready:
+                ready = list(pending)  # 循环引用：外键检查已关闭，顺序无关紧要
+            ready.sort(key=lambda m: m.__name__)
+            ordered.extend(ready)
+            pending.difference_update(ready)
+        return ordered, detach
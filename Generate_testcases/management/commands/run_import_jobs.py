@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from Generate_testcases.excel_import import run_import_job, run_pending_jobs
+from Generate_testcases.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = '处理 Excel 异步导入任务（排队中的任务，以及中断后需要从断点继续的任务）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job',
+            type=int,
+            help='只处理指定任务；失败的任务也会从最后提交的块之后重试',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='同时重试失败的任务',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='常驻运行，持续处理新任务',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='--loop 模式下没有任务时的轮询间隔（秒，默认 2）',
+        )
+
+    def handle(self, *args, **options):
+        if options['job']:
+            if not ImportJob.objects.filter(id=options['job']).exists():
+                raise CommandError(f"导入任务不存在：{options['job']}")
+            job = run_import_job(options['job'], include_failed=True)
+            if job is None:
+                self.stdout.write(self.style.WARNING('任务已完成或正在被其他进程处理'))
+                return
+            self._report(job)
+            return
+
+        while True:
+            count = run_pending_jobs(include_failed=options['retry_failed'])
+            if count:
+                self.stdout.write(f'  ✓ 本轮处理 {count} 个任务')
+            if not options['loop']:
+                break
+            if not count:
+                # 空闲时释放连接，避免长时间占用后被数据库断开
+                connection.close()
+                time.sleep(options['interval'])
+
+    def _report(self, job):
+        if job.status == 'done':
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ 任务#{job.id} 完成：处理 {job.processed_rows} 行，统计 {job.stats}'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'✗ 任务#{job.id} 失败（已提交到第 {job.last_committed_row} 行）：{job.message}'
+            ))
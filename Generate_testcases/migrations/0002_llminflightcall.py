@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMInflightCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='running', max_length=16)),
+                ('result', models.TextField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('owner', models.CharField(blank=True, default='', max_length=128)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['finished_at'], name='Generate_te_finishe_bb540d_idx')],
+            },
+        ),
+    ]
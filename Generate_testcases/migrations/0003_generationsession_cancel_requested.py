@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0002_llminflightcall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationsession',
+            name='cancel_requested',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='generationsession',
+            name='status',
+            field=models.CharField(choices=[('draft', 'draft'), ('done', 'done'), ('failed', 'failed'), ('cancelled', 'cancelled')], db_index=True, default='draft', max_length=16),
+        ),
+    ]
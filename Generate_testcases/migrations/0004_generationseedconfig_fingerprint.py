@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0003_generationsession_cancel_requested'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationseedconfig',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', help_text='生成输入指纹：种子文本+场景提示词+采样参数，用于增量重建时判断能否复用', max_length=64),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:17
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def _hash_text(text):
+    # 与 TestCaseSeed.hash_text 保持一致（迁移中的历史模型没有自定义方法）
+    normalized = (text or "").replace("\r\n", "\n").replace("\r", "\n").strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def backfill_and_merge(apps, schema_editor):
+    """
+    回填 text_hash，并合并同一二级功能下内容相同的种子：
+    保留 id 最小的一条，生成项/种子配置改指向它后删除其余重复种子
+    """
+    TestCaseSeed = apps.get_model("Generate_testcases", "TestCaseSeed")
+    GenerationSeedConfig = apps.get_model("Generate_testcases", "GenerationSeedConfig")
+    GenerationItem = apps.get_model("Generate_testcases", "GenerationItem")
+
+    keepers = {}
+    duplicates = {}  # {重复种子id: 保留种子id}
+    batch = []
+    for seed in TestCaseSeed.objects.order_by("id").only("id", "level2_id", "text").iterator(chunk_size=2000):
+        seed.text_hash = _hash_text(seed.text)
+        key = (seed.level2_id, seed.text_hash)
+        if key in keepers:
+            duplicates[seed.id] = keepers[key]
+            continue
+        keepers[key] = seed.id
+        batch.append(seed)
+        if len(batch) >= 2000:
+            TestCaseSeed.objects.bulk_update(batch, ["text_hash"])
+            batch = []
+    if batch:
+        TestCaseSeed.objects.bulk_update(batch, ["text_hash"])
+
+    for dup_id, keeper_id in duplicates.items():
+        GenerationItem.objects.filter(seed_id=dup_id).update(seed_id=keeper_id)
+        # 同一会话已包含保留种子的配置时，重复种子的配置直接丢弃（unique_together: session+seed）
+        taken = GenerationSeedConfig.objects.filter(seed_id=keeper_id).values_list("session_id", flat=True)
+        GenerationSeedConfig.objects.filter(seed_id=dup_id, session_id__in=list(taken)).delete()
+        GenerationSeedConfig.objects.filter(seed_id=dup_id).update(seed_id=keeper_id)
+    TestCaseSeed.objects.filter(id__in=list(duplicates)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0005_llmusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testcaseseed',
+            name='text_hash',
+            field=models.CharField(default='', editable=False, help_text='规范化后文本的 sha256，用于同场景下去重', max_length=64),
+        ),
+        migrations.RunPython(backfill_and_merge, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='testcaseseed',
+            constraint=models.UniqueConstraint(fields=('level2', 'text_hash'), name='uniq_seed_level2_text_hash'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(model, fk):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{fk: OuterRef("pk")})
+            .order_by().values(fk).annotate(c=Count("id")).values("c")[:1]
+        ),
+        Value(0),
+    )
+
+
+def backfill_counters(apps, schema_editor):
+    """一次性回填计数列（与 counters.RECOUNTS 的口径一致）"""
+    get = lambda name: apps.get_model("Generate_testcases", name)
+    FeatureLevel1, FeatureLevel2 = get("FeatureLevel1"), get("FeatureLevel2")
+    TestCaseSeed, SavedCaseItem = get("TestCaseSeed"), get("SavedCaseItem")
+    GenerationSession, GenerationItem = get("GenerationSession"), get("GenerationItem")
+
+    FeatureLevel1.objects.update(
+        level2_count=_count(FeatureLevel2, "level1"),
+        seed_count=_count(TestCaseSeed, "level2__level1"),
+    )
+    FeatureLevel2.objects.update(
+        seed_count=_count(TestCaseSeed, "level2"),
+        saved_count=_count(SavedCaseItem, "level2"),
+    )
+    GenerationSession.objects.update(item_count=_count(GenerationItem, "session"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featurelevel1',
+            name='level2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='featurelevel1',
+            name='seed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='featurelevel2',
+            name='saved_count',
+            field=models.PositiveIntegerField(default=0, help_text='最终库中该场景的用例数'),
+        ),
+        migrations.AddField(
+            model_name='featurelevel2',
+            name='seed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generationsession',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_latest_session(apps, schema_editor):
+    """每个二级功能指向最近一次完成（done）的会话"""
+    FeatureLevel2 = apps.get_model("Generate_testcases", "FeatureLevel2")
+    GenerationSession = apps.get_model("Generate_testcases", "GenerationSession")
+    latest = (
+        GenerationSession.objects
+        .filter(level2=OuterRef("pk"), status="done")
+        .order_by("-created_at", "-id")
+        .values("id")[:1]
+    )
+    FeatureLevel2.objects.update(latest_session=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0008_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featurelevel2',
+            name='latest_session',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Generate_testcases.generationsession'),
+        ),
+        migrations.RunPython(backfill_latest_session, migrations.RunPython.noop),
+    ]
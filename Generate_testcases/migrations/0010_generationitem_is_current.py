@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:24
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def mark_history_versions(apps, schema_editor):
+    """每个 (session, idx) 只保留最新一条为当前版本，其余（被重新生成替换的）标记为历史版本"""
+    GenerationItem = apps.get_model("Generate_testcases", "GenerationItem")
+    history_ids = (
+        GenerationItem.objects
+        .annotate(version_rank=Window(
+            RowNumber(),
+            partition_by=[F("session_id"), F("idx")],
+            order_by=[F("created_at").desc(), F("id").desc()],
+        ))
+        .filter(version_rank__gt=1)
+        .values_list("id", flat=True)
+    )
+    # 先取出全部 id 再分块更新，避免边读边改同一张表
+    history_ids = list(history_ids)
+    for start in range(0, len(history_ids), 2000):
+        GenerationItem.objects.filter(id__in=history_ids[start:start + 2000]).update(is_current=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0009_featurelevel2_latest_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationitem',
+            name='is_current',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(mark_history_versions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='generationitem',
+            index=models.Index(fields=['session', 'is_current', 'idx'], name='Generate_te_session_613dd9_idx'),
+        ),
+    ]
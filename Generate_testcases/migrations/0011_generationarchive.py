@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0010_generationitem_is_current'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.BigIntegerField(help_text='原 GenerationSession 的主键', unique=True)),
+                ('status', models.CharField(max_length=16)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('session_created_at', models.DateTimeField()),
+                ('payload', models.BinaryField(help_text='zlib 压缩的 JSON：{session, seed_configs, items}')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('level2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sessions', to='Generate_testcases.featurelevel2')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['level2', 'session_created_at'], name='Generate_te_level2__4d526c_idx')],
+            },
+        ),
+    ]
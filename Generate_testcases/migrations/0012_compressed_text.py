@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:28
+
+import Generate_testcases.fields
+from django.db import migrations, models, transaction
+from django.db.models import Value
+
+from Generate_testcases.fields import MAGIC, PackedText, pack, unpack
+
+CHUNK_SIZE = 1000
+
+TEXT_FIELDS = {
+    "GenerationItem": ["raw_text", "edited_text"],
+    "SavedCaseItem": ["text"],
+}
+
+
+def _convert(apps, compress):
+    """
+    按主键分块改写已有数据，每块一个事务：
+    compress=True 把达到阈值的文本压缩；False 全部还原为文本（回滚迁移用）
+    """
+    for model_name, fields in TEXT_FIELDS.items():
+        model = apps.get_model("Generate_testcases", model_name)
+        last_id = 0
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id).order_by("id").values_list("id", *fields)[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            changed = {field: [] for field in fields}
+            for row in rows:
+                for field, value in zip(fields, row[1:]):
+                    if value is None:
+                        continue
+                    if compress:
+                        if not isinstance(value, PackedText) and pack(value).startswith(MAGIC):
+                            changed[field].append(model(id=row[0], **{field: value}))
+                    else:
+                        # 全部写成文本参数（含未压缩的值），列类型改回 TEXT 后仍是原样的文本
+                        text = Value(unpack(value), output_field=models.TextField())
+                        changed[field].append(model(id=row[0], **{field: text}))
+            with transaction.atomic():
+                for field, objs in changed.items():
+                    if objs:
+                        model.objects.bulk_update(objs, [field])
+
+
+def compress_existing(apps, schema_editor):
+    _convert(apps, compress=True)
+
+
+def decompress_existing(apps, schema_editor):
+    _convert(apps, compress=False)
+
+
+class Migration(migrations.Migration):
+    # 分块提交，大表转换中途失败时已完成的块保留，重新执行会跳过已压缩的行
+    atomic = False
+
+    dependencies = [
+        ('Generate_testcases', '0011_generationarchive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='generationitem',
+            name='edited_text',
+            field=Generate_testcases.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='generationitem',
+            name='raw_text',
+            field=Generate_testcases.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='savedcaseitem',
+            name='text',
+            field=Generate_testcases.fields.CompressedTextField(help_text='测试用例内容'),
+        ),
+        migrations.RunPython(compress_existing, decompress_existing),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0012_compressed_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=32)),
+                ('tf', models.PositiveSmallIntegerField(default=1)),
+                ('level2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.featurelevel2')),
+                ('saved_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.savedcaseitem')),
+                ('seed', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.testcaseseed')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'seed'], name='Generate_te_token_b2e2ce_idx'), models.Index(fields=['token', 'saved_item'], name='Generate_te_token_8e0324_idx')],
+            },
+        ),
+    ]
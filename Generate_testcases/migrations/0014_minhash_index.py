@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0013_searchposting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MinHashSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.BinaryField()),
+                ('level2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.featurelevel2')),
+                ('saved_item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.savedcaseitem')),
+                ('seed', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.testcaseseed')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MinHashBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('saved_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.savedcaseitem')),
+                ('seed', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.testcaseseed')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'bucket'], name='Generate_te_band_c7d442_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Generate_testcases', '0014_minhash_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='savedcaseitem',
+            name='Generate_te_saved_b_57a782_idx',
+        ),
+        migrations.AddIndex(
+            model_name='generationitem',
+            index=models.Index(fields=['session', 'is_current', 'seed', 'idx'], name='Generate_te_session_3e7c07_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='savedcaseitem',
+            index=models.Index(fields=['level2', 'saved_batch_id', 'idx'], name='Generate_te_level2__d84370_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testcaseseed',
+            index=models.Index(fields=['level2', 'created_at'], name='Generate_te_level2__eb1d32_idx'),
+        ),
+    ]
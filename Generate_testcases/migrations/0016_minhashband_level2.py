@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+
+CHUNK_SIZE = 5000
+
+
+def backfill_level2(apps, schema_editor):
+    """按主键区间分块，从文档的签名行回填分桶行的 level2，每块一个事务"""
+    MinHashBand = apps.get_model("Generate_testcases", "MinHashBand")
+    MinHashSignature = apps.get_model("Generate_testcases", "MinHashSignature")
+
+    max_id = MinHashBand.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    for start in range(0, max_id, CHUNK_SIZE):
+        chunk = MinHashBand.objects.filter(id__gt=start, id__lte=start + CHUNK_SIZE)
+        with transaction.atomic():
+            for field in ("seed", "saved_item"):
+                chunk.filter(**{f"{field}__isnull": False}).update(level2_id=Subquery(
+                    MinHashSignature.objects.filter(**{field: OuterRef(field)}).values("level2_id")[:1]
+                ))
+    # 没有签名行的分桶行（不应出现）无法确定场景，直接删除；rebuild_similarity_index 可重建
+    MinHashBand.objects.filter(level2__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    # 分块提交，大表回填中途失败时已完成的块保留
+    atomic = False
+
+    dependencies = [
+        ('Generate_testcases', '0015_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='minhashband',
+            name='level2',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.featurelevel2'),
+        ),
+        migrations.RunPython(backfill_level2, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='minhashband',
+            name='level2',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Generate_testcases.featurelevel2'),
+        ),
+        migrations.RemoveIndex(
+            model_name='minhashband',
+            name='Generate_te_band_c7d442_idx',
+        ),
+        migrations.AddIndex(
+            model_name='minhashband',
+            index=models.Index(fields=['band', 'bucket', 'level2'], name='Generate_te_band_9a3e6d_idx'),
+        ),
+    ]
@@ -1,10 +1,15 @@
 from django.db import models
 from django.conf import settings
 
+from .fields import CompressedTextField
+
 
 class FeatureLevel1(models.Model):
     name = models.CharField(max_length=128, unique=True)  # 一级功能名
     code = models.CharField(max_length=64, blank=True, null=True, db_index=True)  # 可选：编码/业务Key
+    # 计数列（由 counters 模块增量维护，repair_counters 命令可重算）
+    level2_count = models.PositiveIntegerField(default=0)
+    seed_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -16,6 +21,13 @@ class FeatureLevel2(models.Model):
     name = models.CharField(max_length=128)  # 二级功能名
     code = models.CharField(max_length=64, blank=True, null=True, db_index=True)
     prompt = models.TextField(blank=True, null=True, help_text="场景提示词：该二级功能（场景）的提示词")  # 场景级别的提示词
+    # 计数列（由 counters 模块增量维护，repair_counters 命令可重算）
+    seed_count = models.PositiveIntegerField(default=0)
+    saved_count = models.PositiveIntegerField(default=0, help_text="最终库中该场景的用例数")
+    # 最近一次完成且有生成项的生成会话，会话完成时由 GenerationSession.mark_done 更新；详情页直接读取，不再排序查找
+    latest_session = models.ForeignKey(
+        "GenerationSession", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -35,6 +47,7 @@ class TestCaseSeed(models.Model):
     """
     level2 = models.ForeignKey(FeatureLevel2, on_delete=models.CASCADE, related_name="seeds")
     text = models.TextField()  # 测试用例例子（如 Input）
+    text_hash = models.CharField(max_length=64, editable=False, default="", help_text="规范化后文本的 sha256，用于同场景下去重")
     lang = models.CharField(max_length=16, default="zh")  # 可选：zh/en...
     source = models.CharField(max_length=32, default="import")  # import/manual 等
     created_by = models.ForeignKey(
@@ -45,7 +58,43 @@ class TestCaseSeed(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["level2", "lang"]),
+            # 种子列表 / 展示序号：按场景过滤、按创建时间排序
+            models.Index(fields=["level2", "created_at"]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=["level2", "text_hash"], name="uniq_seed_level2_text_hash"),
+        ]
+
+    @staticmethod
+    def hash_text(text):
+        """
+        种子文本的内容指纹：统一换行符并去掉首尾空白后取 sha256
+        只差在换行符/首尾空白上的两条种子视为同一条
+        """
+        import hashlib
+        normalized = (text or "").replace("\r\n", "\n").replace("\r", "\n").strip()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.text_hash = TestCaseSeed.hash_text(self.text)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "text" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"text_hash"}
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def ordinals_for_level2(level2_id):
+        """
+        界面展示用的连续序号 {seed_id: 序号}：按创建顺序在所属二级功能内从 1 编号
+        序号在读取时计算，删除种子不需要改动主键
+        """
+        ids = (
+            TestCaseSeed.objects
+            .filter(level2_id=level2_id)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+        )
+        return {seed_id: ordinal for ordinal, seed_id in enumerate(ids, start=1)}
 
 
 class GenerationSession(models.Model):
@@ -62,10 +111,14 @@ class GenerationSession(models.Model):
     top_p = models.FloatField(default=1.0)
     status = models.CharField(
         max_length=16,
-        choices=[("draft", "draft"), ("done", "done"), ("failed", "failed")],
+        choices=[("draft", "draft"), ("done", "done"), ("failed", "failed"), ("cancelled", "cancelled")],
         default="draft",
         db_index=True,
     )
+    # 用户点击取消后置为 True；生成过程在种子之间、排队期间检查该标记
+    cancel_requested = models.BooleanField(default=False)
+    # 生成项数量（包括重新生成的历史版本），由 counters 模块增量维护
+    item_count = models.PositiveIntegerField(default=0)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -77,6 +130,27 @@ class GenerationSession(models.Model):
             models.Index(fields=["status", "created_at"]),
         ]
 
+    def mark_done(self):
+        """
+        标记会话完成，并把所属二级功能的 latest_session 指向它
+        只会前移：并发生成时先开始、后完成的会话不会覆盖更新的会话
+        没有任何生成项的会话（例如所有种子数量都为 0）不前移，详情页继续展示之前的结果
+        """
+        self.status = "done"
+        self.save(update_fields=["status"])
+        if not GenerationItem.objects.filter(session_id=self.id).exists():
+            return
+        (
+            FeatureLevel2.objects
+            .filter(id=self.level2_id)
+            .filter(models.Q(latest_session__isnull=True) | models.Q(latest_session_id__lt=self.id))
+            .update(latest_session=self)
+        )
+
+    def is_cancel_requested(self):
+        """从数据库读取最新的取消标记（生成过程中由其他请求写入）"""
+        return GenerationSession.objects.filter(id=self.id, cancel_requested=True).exists()
+
     @property
     def effective_prompt(self):
         """获取有效提示词：优先使用会话级别的，否则使用场景级别的（二级功能的prompt）"""
@@ -93,6 +167,7 @@ class GenerationSeedConfig(models.Model):
     session = models.ForeignKey(GenerationSession, on_delete=models.CASCADE, related_name="seed_configs")
     seed = models.ForeignKey(TestCaseSeed, on_delete=models.CASCADE, related_name="gen_configs")
     n = models.PositiveSmallIntegerField(default=5, help_text="该种子要生成的用例数量")
+    fingerprint = models.CharField(max_length=64, blank=True, default="", help_text="生成输入指纹：种子文本+场景提示词+采样参数，用于增量重建时判断能否复用")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -104,6 +179,17 @@ class GenerationSeedConfig(models.Model):
     def __str__(self):
         return f"{self.session} - {self.seed} (n={self.n})"
 
+    @staticmethod
+    def make_fingerprint(*, seed_text, prompt, temperature, top_p, model_name):
+        """这些输入都没变时，该种子的生成结果可以直接复用"""
+        import hashlib
+        import json
+        payload = json.dumps(
+            [seed_text or "", prompt or "", float(temperature), float(top_p), model_name or ""],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
 
 class GenerationItem(models.Model):
     """
@@ -120,8 +206,8 @@ class GenerationItem(models.Model):
     session = models.ForeignKey(GenerationSession, on_delete=models.CASCADE, related_name="items")
     seed = models.ForeignKey(TestCaseSeed, on_delete=models.SET_NULL, null=True, blank=True, related_name="generated_items", help_text="该生成项来自哪个种子")
     idx = models.PositiveSmallIntegerField()  # 0~N，保证顺序
-    raw_text = models.TextField()  # 模型原始输出
-    edited_text = models.TextField(blank=True, null=True)  # 用户最终编辑稿（可为空）
+    raw_text = CompressedTextField()  # 模型原始输出
+    edited_text = CompressedTextField(blank=True, null=True)  # 用户最终编辑稿（可为空）
     is_edited = models.BooleanField(default=False, db_index=True)
 
     # 单条重生成追溯（可选）
@@ -129,6 +215,8 @@ class GenerationItem(models.Model):
     regen_from_item = models.ForeignKey(
         "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="regen_children"
     )
+    # 是否为该 (session, idx) 的当前版本：每个位置只有最新的一条为 True，重新生成时原子切换
+    is_current = models.BooleanField(default=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -138,12 +226,23 @@ class GenerationItem(models.Model):
             models.Index(fields=["session", "idx"]),
             models.Index(fields=["is_edited"]),
             models.Index(fields=["seed"]),
+            models.Index(fields=["session", "is_current", "idx"]),
+            # 详情页按种子分组展示、增量重建按种子复用：当前版本按 (seed, idx) 有序读取
+            models.Index(fields=["session", "is_current", "seed", "idx"]),
         ]
 
     @property
     def final_text(self):
         return self.edited_text if self.is_edited and self.edited_text else self.raw_text
 
+    @staticmethod
+    def retire_current(session_id, idxs):
+        """
+        把这些位置的当前版本标记为历史版本；须与插入新版本在同一事务内调用
+        （UPDATE 持有行锁，并发重新生成同一位置时会排队，不会出现两个当前版本）
+        """
+        GenerationItem.objects.filter(session_id=session_id, idx__in=list(idxs), is_current=True).update(is_current=False)
+
 
 class SavedCaseItem(models.Model):
     """
@@ -169,7 +268,7 @@ class SavedCaseItem(models.Model):
     
     # 用例内容
     idx = models.PositiveSmallIntegerField(help_text="在该批次中的序号")
-    text = models.TextField(help_text="测试用例内容")
+    text = CompressedTextField(help_text="测试用例内容")
     
     # 版本管理字段
     version_title = models.CharField(max_length=256, blank=True, null=True, help_text="版本名称/备注")
@@ -192,12 +291,190 @@ class SavedCaseItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # (saved_batch_id, idx) 的唯一约束本身就是索引，按批次读取走它
         unique_together = [("saved_batch_id", "idx")]
         indexes = [
             models.Index(fields=["level2", "created_at"]),
-            models.Index(fields=["saved_batch_id", "idx"]),
+            # 按场景导出：按 (批次, 序号) 有序读取
+            models.Index(fields=["level2", "saved_batch_id", "idx"]),
             models.Index(fields=["status", "created_at"]),
         ]
     
     def __str__(self):
         return f"{self.level2.name} - 批次{self.saved_batch_id} - #{self.idx}"
+
+
+class LLMInflightCall(models.Model):
+    """
+    跨 worker 的大模型调用合并锁行（single-flight）
+    - key：组装好的提示词 + 采样参数的哈希，唯一
+    - 第一个插入成功的请求是 leader，真正调用模型；其他请求轮询这一行，等待 leader 的结果
+    - 结束后保留一小段时间，供紧随其后的重复提交直接复用，之后视为过期
+    """
+    key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(
+        max_length=16,
+        choices=[("running", "running"), ("done", "done"), ("failed", "failed")],
+        default="running",
+    )
+    result = models.TextField(blank=True, null=True)  # 模型原始输出
+    error = models.TextField(blank=True, null=True)
+    owner = models.CharField(max_length=128, blank=True, default="")  # host:pid:thread
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["finished_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.status})"
+
+
+class LLMUsage(models.Model):
+    """
+    大模型用量：每个 tenant（用户/团队，见 llm_quota）每天一行
+    用于每日配额判断和按用户的用量报表，由 llm_quota.reserve_request / record_usage 原子累加
+    """
+    tenant = models.CharField(max_length=128)  # user:<id> / team:<组名> / anonymous
+    day = models.DateField()
+    request_count = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    total_tokens = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [("tenant", "day")]
+        indexes = [
+            models.Index(fields=["day", "tenant"]),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant} @ {self.day}: {self.request_count} 次 / {self.total_tokens} tokens"
+
+
+class ImportJob(models.Model):
+    """
+    Excel 异步导入任务
+    - 上传的文件先落盘（file_path），接口立即返回任务 id，由后台线程或 run_import_jobs 命令处理
+    - 按块提交，每块提交时在同一事务内记录 last_committed_row / stats / errors，
+      中断后从 last_committed_row 之后继续，不会重复计数
+    """
+    STATUS_CHOICES = [
+        ("pending", "排队中"),
+        ("running", "导入中"),
+        ("done", "已完成"),
+        ("failed", "失败"),
+    ]
+
+    original_name = models.CharField(max_length=255, blank=True, default="")
+    file_path = models.CharField(max_length=500)  # 落盘后的文件路径
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    total_rows = models.PositiveIntegerField(blank=True, null=True)  # 数据行数（不含表头），读不到时为空
+    processed_rows = models.PositiveIntegerField(default=0)
+    last_committed_row = models.PositiveIntegerField(default=0)  # 已提交的最后一个 Excel 行号
+    stats = models.JSONField(default=dict, blank=True)  # 与同步导入接口的 stats 字段一致
+    errors = models.JSONField(default=list, blank=True)  # [{"row": 行号, "error": 原因}]
+    message = models.TextField(blank=True, default="")  # 失败原因
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # 处理中定期刷新，用于发现中断的任务
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"导入任务#{self.id} {self.original_name} ({self.status})"
+
+
+class GenerationArchive(models.Model):
+    """
+    归档的生成会话（archive_generation_history 命令写入）
+    一个会话一行：会话本身、种子配置和全部生成项（含重新生成的历史版本）序列化为 JSON 后 zlib 压缩存放，
+    原会话及其生成项随后从热表删除。session_id 保留原会话主键，旧的引用仍可按 id 找回归档内容。
+    """
+    session_id = models.BigIntegerField(unique=True, help_text="原 GenerationSession 的主键")
+    level2 = models.ForeignKey(FeatureLevel2, on_delete=models.CASCADE, related_name="archived_sessions")
+    status = models.CharField(max_length=16)
+    item_count = models.PositiveIntegerField(default=0)
+    session_created_at = models.DateTimeField()
+    payload = models.BinaryField(help_text="zlib 压缩的 JSON：{session, seed_configs, items}")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["level2", "session_created_at"]),
+        ]
+
+    def load(self):
+        """解压并返回归档内容 {"session": {...}, "seed_configs": [...], "items": [...]}"""
+        import json
+        import zlib
+        return json.loads(zlib.decompress(bytes(self.payload)).decode("utf-8"))
+
+    def __str__(self):
+        return f"归档会话#{self.session_id} ({self.status}, {self.item_count} 条)"
+
+
+class SearchPosting(models.Model):
+    """
+    全文检索的倒排索引（由 search_index 模块在写入种子/最终用例时维护，rebuild_search_index 命令可重建）
+    每个 (文档, 词元) 一行：中文按相邻两字切分（bigram），英文和数字按单词
+    文档为种子用例或最终用例，各用一个外键，删除文档时级联删除
+    """
+    token = models.CharField(max_length=32)
+    level2 = models.ForeignKey(FeatureLevel2, on_delete=models.CASCADE, related_name="+")
+    seed = models.ForeignKey(TestCaseSeed, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    saved_item = models.ForeignKey(SavedCaseItem, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    tf = models.PositiveSmallIntegerField(default=1)  # 词元在文档中出现的次数
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["token", "seed"]),
+            models.Index(fields=["token", "saved_item"]),
+        ]
+
+    def __str__(self):
+        target = f"种子#{self.seed_id}" if self.seed_id else f"最终用例#{self.saved_item_id}"
+        return f"{self.token} -> {target}"
+
+
+class MinHashSignature(models.Model):
+    """
+    近似去重用的 MinHash 签名（由 similarity 模块在写入种子/最终用例时维护，rebuild_similarity_index 命令可重建）
+    每个文档一行，签名为若干个 32 位最小哈希值；文档为种子用例或最终用例，删除文档时级联删除
+    """
+    level2 = models.ForeignKey(FeatureLevel2, on_delete=models.CASCADE, related_name="+")
+    seed = models.OneToOneField(TestCaseSeed, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    saved_item = models.OneToOneField(SavedCaseItem, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    signature = models.BinaryField()
+
+    def __str__(self):
+        target = f"种子#{self.seed_id}" if self.seed_id else f"最终用例#{self.saved_item_id}"
+        return f"MinHash {target}"
+
+
+class MinHashBand(models.Model):
+    """
+    MinHash 签名的 LSH 分桶：签名切成若干段（band），每段的哈希值为一个桶
+    任一段落在同一个桶里的两个文档即为相似候选，查询只需按 (band, bucket) 走索引，不做两两比较
+    level2 冗余自文档所属场景：按场景查找时在索引内过滤，不必先取出全库的候选再回表过滤
+    """
+    level2 = models.ForeignKey(FeatureLevel2, on_delete=models.CASCADE, related_name="+")
+    seed = models.ForeignKey(TestCaseSeed, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    saved_item = models.ForeignKey(SavedCaseItem, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["band", "bucket", "level2"]),
+        ]
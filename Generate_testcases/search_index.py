@@ -0,0 +1,236 @@
+# Generate_testcases/search_index.py
+"""
+种子用例与最终用例的全文检索（应用维护的倒排索引 SearchPosting）。
+
+- 分词：NFKC 规范化并转小写后，连续的中文按相邻两字切分（bigram，单个汉字保留为一个词元），
+  英文、数字按单词；同一文档内相同词元合并为一行并记录出现次数
+- 写入路径（新增/修改种子、Excel 导入、保存到最终库）在同一事务内调用 index_seeds / index_saved_items；
+  文档删除时索引行随外键级联删除
+- 查询：先按词元从倒排表取有限的候选文档（每个词元至多 SEARCH_MAX_CANDIDATES 个，最新的优先），
+  再只对候选文档分组，默认要求命中全部词元，按命中词元数、词频之和排序，
+  游标分页（上一页最后一条的 命中数.词频.文档ID），不做 LIKE 全表扫描；
+  最终用例正文为压缩存储，无法用 MySQL FULLTEXT，因此由应用维护索引
+"""
+import re
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .fields import unpack
+from .models import SavedCaseItem, SearchPosting, TestCaseSeed
+
+
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[0-9a-z_]+")
+
+MAX_TOKEN_LENGTH = SearchPosting._meta.get_field("token").max_length
+MAX_TF = 32767
+MAX_QUERY_TOKENS = 32
+
+# 文档类型 -> (SearchPosting 外键名, 文档模型)
+KINDS = {
+    "seed": ("seed", TestCaseSeed),
+    "saved": ("saved_item", SavedCaseItem),
+}
+
+
+def tokenize(text):
+    """文本切分为 {词元: 出现次数}"""
+    counts = Counter()
+    normalized = unicodedata.normalize("NFKC", text or "").lower()
+    for run in _TOKEN_RE.findall(normalized):
+        if run.isascii():
+            counts[run[:MAX_TOKEN_LENGTH]] += 1
+        elif len(run) == 1:
+            counts[run] += 1
+        else:
+            counts.update(run[i:i + 2] for i in range(len(run) - 1))
+    return counts
+
+
+def _batch_size():
+    return getattr(settings, "BULK_INSERT_BATCH_SIZE", 500)
+
+
+def reindex(kind, docs):
+    """docs 为 [(文档ID, level2_id, 文本)]：先删除这些文档的旧索引行，再写入新的"""
+    field = KINDS[kind][0]
+    if not docs:
+        return 0
+    SearchPosting.objects.filter(**{f"{field}_id__in": [doc_id for doc_id, _, _ in docs]}).delete()
+    postings = [
+        SearchPosting(token=token, tf=min(tf, MAX_TF), level2_id=level2_id, **{f"{field}_id": doc_id})
+        for doc_id, level2_id, text in docs
+        for token, tf in tokenize(text).items()
+    ]
+    SearchPosting.objects.bulk_create(postings, batch_size=_batch_size())
+    return len(postings)
+
+
+def index_seeds(seeds):
+    """为种子建立/更新索引（需要 id、level2_id、text），应与种子写入在同一事务内调用"""
+    return reindex("seed", [(seed.id, seed.level2_id, seed.text) for seed in seeds])
+
+
+def index_saved_items(items):
+    """为最终用例建立/更新索引（需要 id、level2_id、text），应与用例写入在同一事务内调用"""
+    return reindex("saved", [(item.id, item.level2_id, item.text) for item in items])
+
+
+def rebuild(kind, chunk_size=500, on_chunk=None):
+    """
+    按主键分块重建某类文档的索引，每块一个事务；on_chunk(已处理文档数) 用于输出进度
+    返回 (文档数, 索引行数)
+    """
+    model = KINDS[kind][1]
+    docs = postings = 0
+    last_id = 0
+    while True:
+        rows = list(
+            model.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", "level2_id", "text")[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with transaction.atomic():
+            postings += reindex(kind, [(doc_id, level2_id, unpack(text)) for doc_id, level2_id, text in rows])
+        docs += len(rows)
+        if on_chunk:
+            on_chunk(docs)
+    return docs, postings
+
+
+def parse_cursor(cursor):
+    """游标 "命中数.词频.文档ID" -> (int, int, int)；格式错误抛 ValueError"""
+    hits, score, doc_id = (int(part) for part in cursor.split("."))
+    return hits, score, doc_id
+
+
+def _max_candidates():
+    return getattr(settings, "SEARCH_MAX_CANDIDATES", 2000)
+
+
+def _candidate_docs(postings, field, token_filters, match_all, limit):
+    """
+    先按词元取出有限的候选文档，再只对这些文档做分组排序，聚合规模与词元的文档频率无关
+    - 每个词元最多取 limit 个文档，按文档ID 倒序（最新的优先，走 (token, 文档) 索引，不排序）
+    - match_all：文档必须包含全部词元，只需从文档频率最小的词元取候选；文档频率不超过 limit 时结果是精确的
+    - 否则取各词元候选的并集
+    返回候选文档ID 列表（至多 limit 个 / 词元）
+    """
+    def docs_for(token_filter, n):
+        return postings.filter(token_filter).order_by(f"-{field}").values_list(field, flat=True)[:n]
+
+    if match_all and len(token_filters) > 1:
+        # 文档频率只数到 limit + 1，常见词元的计数本身也是有界的
+        driver = min(token_filters, key=lambda f: docs_for(f, limit + 1).count())
+        token_filters = [driver]
+    candidates = set()
+    for token_filter in token_filters:
+        candidates.update(docs_for(token_filter, limit))
+    return list(candidates)
+
+
+def ranked(kind, query, level1_id=None, level2_id=None, status=None,
+           date_from=None, date_to=None, match_all=True, cursor=None):
+    """
+    排好序的命中文档查询集（每行 {外键名: 文档ID, "hits": 命中数, "score": 词频之和}），参数同 search；
+    查询没有有效词元时返回 None
+    非常常见的词元只考虑包含它的最新 SEARCH_MAX_CANDIDATES 个文档（见 _candidate_docs）
+    """
+    field = KINDS[kind][0]
+    tokens = list(tokenize(query))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+
+    postings = SearchPosting.objects.filter(**{f"{field}__isnull": False})
+    if len(tokens) == 1 and len(tokens[0]) == 1 and not tokens[0].isascii():
+        # 单个汉字：匹配以它开头的 bigram（走 token 索引的前缀范围扫描）
+        token_filters = [Q(token__startswith=tokens[0])]
+        required = 1
+    else:
+        token_filters = [Q(token=token) for token in tokens]
+        required = len(tokens) if match_all else 1
+
+    if level2_id:
+        postings = postings.filter(level2_id=level2_id)
+    if level1_id:
+        postings = postings.filter(level2__level1_id=level1_id)
+    if status and kind == "saved":
+        postings = postings.filter(saved_item__status=status)
+    if date_from:
+        postings = postings.filter(**{f"{field}__created_at__gte": date_from})
+    if date_to:
+        postings = postings.filter(**{f"{field}__created_at__lt": date_to + timedelta(days=1)})
+
+    candidates = _candidate_docs(postings, field, token_filters, match_all, _max_candidates())
+    # 候选文档已满足上面的过滤条件，这里只按词元和候选文档取索引行
+    any_token = Q()
+    for token_filter in token_filters:
+        any_token |= token_filter
+    ranked = (
+        SearchPosting.objects.filter(any_token, **{f"{field}__in": candidates})
+        .values(field)
+        .annotate(hits=Count("id"), score=Sum("tf"))
+        .filter(hits__gte=required)
+    )
+    if cursor:
+        hits, score, doc_id = cursor
+        ranked = ranked.filter(
+            Q(hits__lt=hits)
+            | Q(hits=hits, score__lt=score)
+            | Q(hits=hits, score=score, **{f"{field}__lt": doc_id})
+        )
+    return ranked.order_by("-hits", "-score", f"-{field}")
+
+
+def search(kind, query, level1_id=None, level2_id=None, status=None,
+           date_from=None, date_to=None, match_all=True, cursor=None, limit=20):
+    """
+    检索种子（kind="seed"）或最终用例（kind="saved"）
+    - status 只对最终用例生效；date_from / date_to 为 date，按创建时间过滤（含两端）
+    - match_all=False 时命中任一词元即可，命中越多排名越前
+    返回 (结果列表 [(文档对象, 命中数, 词频)], 下一页游标或 None)
+    """
+    field, model = KINDS[kind]
+    ranked_docs = ranked(
+        kind, query, level1_id=level1_id, level2_id=level2_id, status=status,
+        date_from=date_from, date_to=date_to, match_all=match_all, cursor=cursor,
+    )
+    if ranked_docs is None:
+        return [], None
+
+    rows = list(ranked_docs[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last['hits']}.{last['score']}.{last[field]}"
+
+    docs = model.objects.select_related("level2", "level2__level1").in_bulk([row[field] for row in rows])
+    results = [
+        (docs[row[field]], row["hits"], row["score"])
+        for row in rows
+        if row[field] in docs
+    ]
+    return results, next_cursor
+
+
+def snippet(text, query, width=60):
+    """截取文本中第一个命中词元前后的片段，用于结果列表展示"""
+    lowered = unicodedata.normalize("NFKC", text).lower()
+    position = -1
+    for token in tokenize(query):
+        position = lowered.find(token)
+        if position >= 0:
+            break
+    if position < 0:
+        return text[:width * 2] + ("…" if len(text) > width * 2 else "")
+    start = max(0, position - width)
+    end = min(len(text), position + width)
+    return ("…" if start > 0 else "") + text[start:end] + ("…" if end < len(text) else "")
@@ -0,0 +1,219 @@
+# Generate_testcases/similarity.py
+"""
+种子用例与最终用例的近似重复检测（MinHash + LSH 分桶，MinHashSignature / MinHashBand）。
+
+- 文本 NFKC 规范化、转小写并去掉空白和标点后，取字符 3-gram 集合，计算 NUM_PERM 个最小哈希作为签名；
+  两个签名相同位置相等的比例即 Jaccard 相似度的估计值
+- 签名切成 BANDS 段、每段 ROWS 个值，每段哈希成一个桶；任一段同桶的文档成为候选，
+  再用签名估算相似度过滤。16×4 的分段下，相似度 0.7 的两个文档成为候选的概率约 98%，0.3 约 12%
+- 写入路径与检索索引相同（新增/修改种子、Excel 导入、保存到最终库），在同一事务内调用 index_seeds / index_saved_items；
+  文档删除时签名和分桶随外键级联删除
+- 分段参数改变后需要执行 rebuild_similarity_index 重建
+"""
+import hashlib
+import random
+import re
+import struct
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .fields import unpack
+from .models import MinHashBand, MinHashSignature, SavedCaseItem, TestCaseSeed
+
+
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+
+_NOISE_RE = re.compile(r"[\s\W_]+")
+
+# 文档类型 -> (索引表外键名, 文档模型)
+KINDS = {
+    "seed": ("seed", TestCaseSeed),
+    "saved": ("saved_item", SavedCaseItem),
+}
+
+
+def shingles(text):
+    """文本 -> 字符 3-gram 集合（短于 3 个字符的文本整体作为一个元素）"""
+    normalized = _NOISE_RE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """文本的 MinHash 签名（NUM_PERM 个整数）；没有有效字符时返回 None"""
+    values = [
+        int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+        for item in shingles(text)
+    ]
+    if not values:
+        return None
+    return [min((a * value + b) % _PRIME for value in values) & _MAX_HASH for a, b in _PERMUTATIONS]
+
+
+def bands(sig):
+    """签名 -> [(段号, 桶)]，桶为该段哈希的有符号 64 位整数"""
+    result = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}I", *sig[band * ROWS:(band + 1) * ROWS])
+        bucket = int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True)
+        result.append((band, bucket))
+    return result
+
+
+def pack_signature(sig):
+    return struct.pack(_SIGNATURE_FORMAT, *sig)
+
+
+def unpack_signature(data):
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+def estimate(sig_a, sig_b):
+    """两个签名估算的 Jaccard 相似度"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def default_threshold():
+    return getattr(settings, "SIMILARITY_THRESHOLD", 0.7)
+
+
+def _batch_size():
+    return getattr(settings, "BULK_INSERT_BATCH_SIZE", 500)
+
+
+def reindex(kind, docs):
+    """docs 为 [(文档ID, level2_id, 文本)]：先删除这些文档的旧签名和分桶，再写入新的；返回写入的签名数"""
+    field = KINDS[kind][0]
+    if not docs:
+        return 0
+    doc_ids = [doc_id for doc_id, _, _ in docs]
+    MinHashBand.objects.filter(**{f"{field}_id__in": doc_ids}).delete()
+    MinHashSignature.objects.filter(**{f"{field}_id__in": doc_ids}).delete()
+
+    signatures = []
+    band_rows = []
+    for doc_id, level2_id, text in docs:
+        sig = signature(text)
+        if sig is None:
+            continue
+        signatures.append(MinHashSignature(level2_id=level2_id, signature=pack_signature(sig), **{f"{field}_id": doc_id}))
+        band_rows.extend(
+            MinHashBand(band=band, bucket=bucket, level2_id=level2_id, **{f"{field}_id": doc_id})
+            for band, bucket in bands(sig)
+        )
+    MinHashSignature.objects.bulk_create(signatures, batch_size=_batch_size())
+    MinHashBand.objects.bulk_create(band_rows, batch_size=_batch_size())
+    return len(signatures)
+
+
+def index_seeds(seeds):
+    """为种子计算签名（需要 id、level2_id、text），应与种子写入在同一事务内调用"""
+    return reindex("seed", [(seed.id, seed.level2_id, seed.text) for seed in seeds])
+
+
+def index_saved_items(items):
+    """为最终用例计算签名（需要 id、level2_id、text），应与用例写入在同一事务内调用"""
+    return reindex("saved", [(item.id, item.level2_id, item.text) for item in items])
+
+
+def rebuild(kind, chunk_size=500, on_chunk=None):
+    """
+    按主键分块重建某类文档的签名和分桶，每块一个事务；on_chunk(已处理文档数) 用于输出进度
+    返回 (文档数, 签名数)
+    """
+    model = KINDS[kind][1]
+    docs = indexed = 0
+    last_id = 0
+    while True:
+        rows = list(
+            model.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", "level2_id", "text")[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        with transaction.atomic():
+            indexed += reindex(kind, [(doc_id, level2_id, unpack(text)) for doc_id, level2_id, text in rows])
+        docs += len(rows)
+        if on_chunk:
+            on_chunk(docs)
+    return docs, indexed
+
+
+def doc_key(signature_row):
+    """签名行对应的文档标识 ("seed"/"saved", 文档ID)"""
+    if signature_row.seed_id:
+        return "seed", signature_row.seed_id
+    return "saved", signature_row.saved_item_id
+
+
+def max_candidates():
+    return getattr(settings, "SIMILARITY_MAX_CANDIDATES", 500)
+
+
+def candidate_bands(sig, kinds=("seed", "saved"), level2_id=None):
+    """每段一个查询集：与签名该段同桶的分桶行（按 (band, bucket, level2) 索引查找）"""
+    kind_filter = Q()
+    for kind in kinds:
+        kind_filter |= Q(**{f"{KINDS[kind][0]}__isnull": False})
+    rows = MinHashBand.objects.filter(kind_filter)
+    if level2_id:
+        rows = rows.filter(level2_id=level2_id)
+    return [rows.filter(band=band, bucket=bucket) for band, bucket in bands(sig)]
+
+
+def find_similar(text=None, sig=None, kinds=("seed", "saved"), level2_id=None,
+                 threshold=None, exclude=None, limit=20):
+    """
+    按文本（或已有签名）查找相似文档：分桶命中候选后按签名估算相似度过滤、排序
+    exclude 为要排除的 (类型, 文档ID)，例如查询已有文档时排除它自己
+    候选最多取 SIMILARITY_MAX_CANDIDATES 个，平均分给各段：通用的短文本会落进很多文档共享的桶，
+    不设上限时候选数随库的规模增长；真正相似的文档有多个段同桶，某一段截断后通常仍能从其他段命中
+    返回 [(MinHashSignature, 相似度)]，按相似度从高到低
+    """
+    if sig is None:
+        sig = signature(text)
+    if sig is None:
+        return []
+    threshold = default_threshold() if threshold is None else threshold
+
+    seed_ids, saved_ids = set(), set()
+    per_band = max(1, max_candidates() // BANDS)
+    for rows in candidate_bands(sig, kinds, level2_id=level2_id):
+        for seed_id, saved_item_id in rows.values_list("seed_id", "saved_item_id")[:per_band]:
+            if seed_id:
+                seed_ids.add(seed_id)
+            else:
+                saved_ids.add(saved_item_id)
+    if exclude is not None:
+        (seed_ids if exclude[0] == "seed" else saved_ids).discard(exclude[1])
+    if not seed_ids and not saved_ids:
+        return []
+
+    matches = []
+    for row in MinHashSignature.objects.filter(Q(seed_id__in=seed_ids) | Q(saved_item_id__in=saved_ids)):
+        score = estimate(sig, unpack_signature(row.signature))
+        if score >= threshold:
+            matches.append((row, score))
+    matches.sort(key=lambda match: (-match[1], doc_key(match[0])))
+    return matches[:limit]
+
+
+def signature_of(kind, doc_id):
+    """已索引文档的签名；未索引（或文本为空）时返回 None"""
+    field = KINDS[kind][0]
+    row = MinHashSignature.objects.filter(**{f"{field}_id": doc_id}).only("signature").first()
+    return unpack_signature(row.signature) if row is not None else None
@@ -0,0 +1,159 @@
+# Generate_testcases/singleflight.py
+"""
+相同大模型请求的合并（single-flight）。
+
+多个用户同时打开同一个场景、用相同参数点击生成，或者前端重复提交，都会产生完全相同的请求。
+这里以「组装好的提示词 + 采样参数」为 key：
+- 进程内：同一时刻只有一个线程（leader）真正调用模型，其他线程（follower）等待它的结果；
+- 跨 worker：通过 LLMInflightCall 表中的唯一锁行实现同样的效果，follower 轮询锁行直到 leader 写回结果。
+
+leader 完成后 LLM_SINGLEFLIGHT_GRACE 秒内到达的相同请求直接复用结果（覆盖前端重复提交）；
+用户明确要求「重新生成」时传 reuse_recent=False，只合并仍在进行中的调用，不复用已完成的结果。
+
+注意：锁行需要提交后才能被其他 worker 看到，因此在事务（atomic）内部调用时只做进程内合并。
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.utils import timezone
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def make_key(**parts) -> str:
+    """按请求内容计算合并 key（参数顺序无关）"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def do(key: str, fn, cancel_check=None, reuse_recent=True):
+    """
+    执行 fn() 并返回结果；相同 key 的并发调用只会真正执行一次。
+    fn 抛出的异常会同样抛给所有等待中的 follower；
+    但 leader 被取消（GenerationCancelled）不代表 follower 也被取消，follower 会重新竞争 leader。
+    cancel_check：等待期间定期检查，返回 True 时抛出 GenerationCancelled。
+    reuse_recent：False 时不复用宽限期内已完成的结果（仍会等待进行中的相同调用）。
+    """
+    from .llm_client import GenerationCancelled
+
+    while True:
+        with _inflight_lock:
+            call = _inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                _inflight[key] = call
+
+        if leader:
+            break
+
+        while not call.event.wait(timeout=_poll_interval() if cancel_check else None):
+            if cancel_check():
+                raise GenerationCancelled("生成已取消")
+        if isinstance(call.error, GenerationCancelled):
+            continue
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _do_across_workers(key, fn, cancel_check, reuse_recent)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.event.set()
+
+
+def _poll_interval() -> float:
+    return getattr(settings, "LLM_SINGLEFLIGHT_POLL_INTERVAL", 0.5)
+
+
+def _do_across_workers(key: str, fn, cancel_check=None, reuse_recent=True):
+    from .models import LLMInflightCall
+    from .llm_client import LLMError, GenerationCancelled
+
+    if connection.in_atomic_block:
+        # 事务未提交前锁行对其他 worker 不可见，跨 worker 合并无意义
+        return fn()
+
+    wait_timeout = getattr(settings, "LLM_SINGLEFLIGHT_WAIT_TIMEOUT", 180)
+    grace = getattr(settings, "LLM_SINGLEFLIGHT_GRACE", 3)
+    poll = _poll_interval()
+
+    while True:
+        now = timezone.now()
+        try:
+            row = LLMInflightCall.objects.create(key=key, owner=_owner(), started_at=now)
+            break  # 抢到锁行：本请求是 leader
+        except IntegrityError:
+            pass
+
+        row = LLMInflightCall.objects.filter(key=key).first()
+        if row is None:
+            continue  # 锁行刚被清理，重新抢
+
+        if (
+            reuse_recent and row.status == "done" and row.finished_at
+            and now - row.finished_at <= timedelta(seconds=grace)
+        ):
+            return row.result
+
+        if row.status == "running" and now - row.started_at <= timedelta(seconds=wait_timeout):
+            deadline = row.started_at + timedelta(seconds=wait_timeout)
+            while timezone.now() < deadline:
+                time.sleep(poll)
+                if cancel_check is not None and cancel_check():
+                    raise GenerationCancelled("生成已取消")
+                row = LLMInflightCall.objects.filter(id=row.id).first()
+                if row is None or row.status != "running":
+                    break
+            if row is not None and row.status == "done":
+                return row.result
+            if row is not None and row.status == "failed":
+                raise LLMError(row.error or "合并请求的模型调用失败")
+
+        # 过期的结果 / 失败记录 / leader 超时未完成：清掉后重新抢锁
+        if row is not None:
+            LLMInflightCall.objects.filter(id=row.id, status=row.status).delete()
+
+    try:
+        result = fn()
+    except GenerationCancelled:
+        # 取消的是 leader 自己的会话：删掉锁行，让其他 worker 的 follower 接管
+        LLMInflightCall.objects.filter(id=row.id).delete()
+        raise
+    except Exception as e:
+        LLMInflightCall.objects.filter(id=row.id).update(
+            status="failed", error=str(e), finished_at=timezone.now()
+        )
+        raise
+
+    finished = timezone.now()
+    LLMInflightCall.objects.filter(id=row.id).update(status="done", result=result, finished_at=finished)
+    # 顺手清理早已结束的锁行，避免表无限增长
+    LLMInflightCall.objects.filter(finished_at__lt=finished - timedelta(hours=1)).delete()
+    return result
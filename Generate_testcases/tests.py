@@ -1,3 +1,1341 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import zlib
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from . import counters, excel_export, fields, llm_quota, search_index, similarity, singleflight
+from .excel_import import ExcelImporter
+from .llm_client import LLMError, QuotaExceeded, generate_cases_for_seed
+from .llm_scheduler import LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from .models import (
+    FeatureLevel1, FeatureLevel2, TestCaseSeed, GenerationSession, GenerationItem, LLMInflightCall, LLMUsage,
+    ImportJob, SavedCaseItem, MinHashBand, GenerationArchive
+)
+
+
+class _FakeZhipuAI:
+    """替代 zhipuai.ZhipuAI：记录调用参数，按调用次数返回不同的文本"""
+
+    calls = []
+
+    def __init__(self, api_key=None):
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        _FakeZhipuAI.calls.append(kwargs)
+        message = mock.Mock(content=f"用例{len(_FakeZhipuAI.calls)}")
+        return mock.Mock(choices=[mock.Mock(message=message)], usage=None)
+
+
+def _generate(**overrides):
+    params = dict(
+        level1_name="翻译", level2_name="文本翻译", seed_text="把你好翻译成英文",
+        prompt="", n=1, temperature=0.7, top_p=1.0, idx=0,
+    )
+    params.update(overrides)
+    return generate_cases_for_seed(**params)
+
+
+@override_settings(LLM_SINGLEFLIGHT_POLL_INTERVAL=0.01)
+class SingleFlightTests(TransactionTestCase):
+    """相同请求的合并：进程内 leader/follower、跨 worker 锁行、宽限期复用"""
+
+    def _run_concurrently(self, key, fn, followers):
+        """先启动 leader，等它进入 fn 后再启动 followers 个相同 key 的调用"""
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(singleflight.do(key, fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(followers + 1)]
+        threads[0].start()
+        self.assertTrue(self.entered.wait(5))
+        for t in threads[1:]:
+            t.start()
+        # 给 follower 时间挂到进程内的等待对象上，再放行 leader
+        time.sleep(0.2)
+        self.release.set()
+        for t in threads:
+            t.join(5)
+        return results, errors
+
+    def setUp(self):
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def _slow(self, outcome):
+        def fn():
+            self.calls += 1
+            self.entered.set()
+            self.release.wait(5)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+        return fn
+
+    def test_followers_share_leader_result(self):
+        results, errors = self._run_concurrently("k-share", self._slow("结果"), followers=3)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results, ["结果"] * 4)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(LLMInflightCall.objects.get(key="k-share").status, "done")
+
+    def test_leader_failure_propagates_to_followers(self):
+        results, errors = self._run_concurrently("k-fail", self._slow(LLMError("供应商超时")), followers=2)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(str(e) == "供应商超时" for e in errors))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(LLMInflightCall.objects.get(key="k-fail").status, "failed")
+
+    def _polling(self):
+        """cancel_check 在 follower 每次轮询锁行时被调用，借此确认 follower 已在等待"""
+        polled = threading.Event()
+        return polled, lambda: polled.set() or False
+
+    def test_follower_waits_for_other_worker(self):
+        row = LLMInflightCall.objects.create(key="k-remote", owner="other:1:1", started_at=timezone.now())
+        polled, cancel_check = self._polling()
+        results = []
+        t = threading.Thread(target=lambda: results.append(
+            singleflight.do("k-remote", self._slow("本地"), cancel_check=cancel_check)
+        ))
+        t.start()
+        self.assertTrue(polled.wait(5))
+        LLMInflightCall.objects.filter(id=row.id).update(
+            status="done", result="远端结果", finished_at=timezone.now()
+        )
+        t.join(5)
+
+        self.assertEqual(results, ["远端结果"])
+        self.assertEqual(self.calls, 0)
+
+    def test_other_worker_failure_raises(self):
+        row = LLMInflightCall.objects.create(key="k-remote-fail", owner="other:1:1", started_at=timezone.now())
+        polled, cancel_check = self._polling()
+        errors = []
+
+        def worker():
+            try:
+                singleflight.do("k-remote-fail", self._slow("本地"), cancel_check=cancel_check)
+            except LLMError as e:
+                errors.append(e)
+
+        t = threading.Thread(target=worker)
+        t.start()
+        self.assertTrue(polled.wait(5))
+        LLMInflightCall.objects.filter(id=row.id).update(
+            status="failed", error="远端失败", finished_at=timezone.now()
+        )
+        t.join(5)
+
+        self.assertEqual([str(e) for e in errors], ["远端失败"])
+        self.assertEqual(self.calls, 0)
+
+    def test_grace_window_reuses_recent_result(self):
+        self.release.set()
+        LLMInflightCall.objects.create(
+            key="k-grace", owner="other:1:1", status="done", result="刚完成",
+            started_at=timezone.now(), finished_at=timezone.now(),
+        )
+
+        self.assertEqual(singleflight.do("k-grace", self._slow("新结果")), "刚完成")
+        self.assertEqual(self.calls, 0)
+
+    def test_reuse_recent_false_skips_grace_window(self):
+        self.release.set()
+        LLMInflightCall.objects.create(
+            key="k-regen", owner="other:1:1", status="done", result="刚完成",
+            started_at=timezone.now(), finished_at=timezone.now(),
+        )
+
+        self.assertEqual(singleflight.do("k-regen", self._slow("新结果"), reuse_recent=False), "新结果")
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_result_is_not_reused(self):
+        self.release.set()
+        finished = timezone.now() - timedelta(seconds=60)
+        LLMInflightCall.objects.create(
+            key="k-old", owner="other:1:1", status="done", result="过期结果",
+            started_at=finished, finished_at=finished,
+        )
+
+        self.assertEqual(singleflight.do("k-old", self._slow("新结果")), "新结果")
+        self.assertEqual(self.calls, 1)
+
+
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class SingleFlightKeyTests(TransactionTestCase):
+    """合并 key 覆盖采样参数：temperature / top_p 不同的请求不能互相复用"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+
+    def test_key_depends_on_sampling_params(self):
+        base = dict(model="glm-4", messages=[{"role": "user", "content": "x"}], temperature=0.7, top_p=1.0)
+
+        self.assertEqual(singleflight.make_key(**base), singleflight.make_key(**dict(base)))
+        self.assertNotEqual(singleflight.make_key(**base), singleflight.make_key(**{**base, "temperature": 0.9}))
+        self.assertNotEqual(singleflight.make_key(**base), singleflight.make_key(**{**base, "top_p": 0.5}))
+
+    def test_identical_request_within_grace_is_merged(self):
+        first = _generate()
+        second = _generate()
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(_FakeZhipuAI.calls), 1)
+
+    def test_different_sampling_params_call_model_again(self):
+        _generate()
+        _generate(temperature=0.9)
+        _generate(top_p=0.5)
+
+        self.assertEqual(len(_FakeZhipuAI.calls), 3)
+        self.assertEqual(
+            [(c["temperature"], c["top_p"]) for c in _FakeZhipuAI.calls],
+            [(0.7, 1.0), (0.9, 1.0), (0.7, 0.5)],
+        )
+
+    def test_regenerate_gets_fresh_result(self):
+        first = _generate()
+        again = _generate(reuse_recent=False)
+
+        self.assertNotEqual(first, again)
+        self.assertEqual(len(_FakeZhipuAI.calls), 2)
+
+
+class CancelSessionTests(TestCase):
+    """只能取消同一 tenant（用户 / 团队 / 匿名）发起的会话"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice")
+        self.bob = User.objects.create_user("bob")
+        self.sessions = {
+            owner: GenerationSession.objects.create(level2=self.level2, created_by=user)
+            for owner, user in (("alice", self.alice), ("bob", self.bob), ("anonymous", None))
+        }
+
+    def _cancel(self, payload):
+        return self.client.post(
+            reverse("Generate_testcases:cancel_session"), payload, content_type="application/json"
+        )
+
+    def _cancelled(self):
+        return {
+            owner for owner, session in self.sessions.items()
+            if GenerationSession.objects.get(id=session.id).cancel_requested
+        }
+
+    def test_anonymous_only_cancels_anonymous_sessions(self):
+        response = self._cancel({"level2_id": self.level2.id})
+
+        self.assertEqual(response.json()["cancelled_count"], 1)
+        self.assertEqual(self._cancelled(), {"anonymous"})
+
+    def test_user_only_cancels_own_sessions(self):
+        self.client.force_login(self.alice)
+
+        response = self._cancel({"level2_id": self.level2.id})
+
+        self.assertEqual(response.json()["cancelled_count"], 1)
+        self.assertEqual(self._cancelled(), {"alice"})
+
+    def test_cannot_cancel_other_users_session_by_id(self):
+        self.client.force_login(self.alice)
+
+        for owner in ("bob", "anonymous"):
+            with self.subTest(owner=owner):
+                response = self._cancel({"session_id": self.sessions[owner].id})
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self._cancel({"session_id": self.sessions["alice"].id}).status_code, 200)
+        self.assertEqual(self._cancelled(), {"alice"})
+
+    def test_anonymous_cannot_cancel_user_session_by_id(self):
+        self.assertEqual(self._cancel({"session_id": self.sessions["bob"].id}).status_code, 404)
+        self.assertEqual(self._cancelled(), set())
+
+    @override_settings(LLM_FAIR_SHARE_BY="team")
+    def test_team_members_share_a_tenant(self):
+        from django.contrib.auth.models import Group
+        team = Group.objects.create(name="qa")
+        team.user_set.add(self.alice, self.bob)
+        self.client.force_login(self.alice)
+
+        self.assertEqual(self._cancel({"session_id": self.sessions["bob"].id}).status_code, 200)
+        self.assertEqual(self._cancelled(), {"bob"})
+
+
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class RegenerateItemsTests(TransactionTestCase):
+    """批量重新生成：请求里的 id 统一按整数处理，同一位置只生成一次"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        seed = TestCaseSeed.objects.create(level2=level2, text="把你好翻译成英文")
+        session = GenerationSession.objects.create(level2=level2, status="done")
+        self.item = GenerationItem.objects.create(session=session, seed=seed, idx=0, raw_text="旧用例")
+
+    def _regenerate(self, item_ids):
+        return self.client.post(
+            reverse("Generate_testcases:regenerate_items"), {"item_ids": item_ids}, content_type="application/json"
+        )
+
+    def test_string_ids_are_accepted(self):
+        data = self._regenerate([str(self.item.id), str(self.item.id + 1000)]).json()
+
+        self.assertEqual([r["item_id"] for r in data["results"]], [self.item.id])
+        self.assertEqual(data["errors"], [{"item_id": self.item.id + 1000, "error": "生成项不存在"}])
+
+    def test_non_integer_ids_are_rejected(self):
+        response = self._regenerate([self.item.id, "abc"])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(_FakeZhipuAI.calls, [])
+
+    def test_old_and_current_version_of_one_slot_regenerate_once(self):
+        self.item.is_current = False
+        self.item.save(update_fields=["is_current"])
+        current = GenerationItem.objects.create(
+            session=self.item.session, seed=self.item.seed, idx=0, raw_text="新用例", regen_from_item=self.item,
+        )
+
+        data = self._regenerate([self.item.id, current.id]).json()
+
+        self.assertEqual([r["item_id"] for r in data["results"]], [current.id])
+        self.assertEqual(len(_FakeZhipuAI.calls), 1)
+        heads = GenerationItem.objects.filter(session=self.item.session, idx=0, is_current=True)
+        self.assertEqual([head.id for head in heads], [data["results"][0]["new_item_id"]])
+
+
+class SchedulerFairQueueTests(TestCase):
+    """同一优先级内按 tenant 加权公平排队"""
+
+    def _drain(self, arrivals):
+        """
+        占住唯一的槽位，按 arrivals（[(tenant, weight), ...]）的顺序逐个入队，然后放行；
+        返回放行顺序和每次放行时的虚拟时间
+        """
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order, vtimes = [], []
+
+        def worker(tenant, weight):
+            with scheduler.slot(PRIORITY_BULK, tenant=tenant, weight=weight):
+                order.append(tenant)
+                vtimes.append(scheduler._vtime[PRIORITY_BULK])
+
+        threads = []
+        with scheduler.slot(PRIORITY_BULK, tenant="holder"):
+            for tenant, weight in arrivals:
+                t = threading.Thread(target=worker, args=(tenant, weight))
+                t.start()
+                threads.append(t)
+                # 等这个请求进入队列后再放下一个，保证入队顺序确定
+                for _ in range(500):
+                    if scheduler.stats()["classes"][PRIORITY_BULK]["queued"] == len(threads):
+                        break
+                    time.sleep(0.01)
+        for t in threads:
+            t.join(5)
+        return order, vtimes
+
+    def test_weighted_tenant_gets_larger_share(self):
+        order, _ = self._drain([("a", 2)] * 4 + [("b", 1)] * 2)
+
+        # a 的权重是 b 的两倍：每放行一个 b 之前放行两个 a
+        self.assertEqual(order, ["a", "a", "b", "a", "a", "b"])
+
+    def test_heavy_tenant_does_not_starve_others(self):
+        order, _ = self._drain([("a", 1)] * 4 + [("b", 1)])
+
+        self.assertEqual(order, ["a", "b", "a", "a", "a"])
+
+    def test_virtual_time_never_decreases(self):
+        # 低权重的 a 虚拟开始时间最早，但完成时间晚，会排在已放行的 b 之后
+        order, vtimes = self._drain([("a", 0.5)] + [("b", 2)] * 4)
+
+        self.assertEqual(order, ["b", "b", "b", "a", "b"])
+        self.assertEqual(vtimes, sorted(vtimes))
+
+
+class SchedulerPriorityTests(TestCase):
+    """优先级之间：严格优先级 + 为 interactive 预留的并发份额"""
+
+    def _wait_until(self, predicate):
+        for _ in range(500):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("等待调度器状态超时")
+
+    def test_interactive_admitted_while_bulk_saturates_pool(self):
+        scheduler = LLMScheduler(max_concurrency=3, interactive_reserved=1)
+        release = threading.Event()
+        admitted = threading.Event()
+
+        def bulk():
+            with scheduler.slot(PRIORITY_BULK, tenant="batch"):
+                release.wait(5)
+
+        def interactive():
+            with scheduler.slot(PRIORITY_INTERACTIVE, tenant="user:1"):
+                admitted.set()
+
+        threads = [threading.Thread(target=bulk) for _ in range(5)]
+        for t in threads:
+            t.start()
+        # bulk 最多占用 3 - 1 = 2 个槽位，其余排队
+        self._wait_until(lambda: scheduler.stats()["classes"][PRIORITY_BULK]["queued"] == 3)
+        self.assertEqual(scheduler.stats()["running"], 2)
+
+        t = threading.Thread(target=interactive)
+        t.start()
+        threads.append(t)
+        try:
+            self.assertTrue(admitted.wait(2), "interactive 请求没有拿到预留槽位")
+        finally:
+            release.set()
+            for t in threads:
+                t.join(5)
+
+    def test_higher_priority_is_admitted_first(self):
+        scheduler = LLMScheduler(max_concurrency=1, interactive_reserved=0)
+        order = []
+
+        def worker(priority):
+            with scheduler.slot(priority):
+                order.append(priority)
+
+        threads = []
+        with scheduler.slot(PRIORITY_BULK):
+            # 按优先级从低到高入队
+            for priority in (PRIORITY_BACKGROUND, PRIORITY_BULK, PRIORITY_INTERACTIVE):
+                t = threading.Thread(target=worker, args=(priority,))
+                t.start()
+                threads.append(t)
+                self._wait_until(lambda: scheduler.stats()["classes"][priority]["queued"] == 1)
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(order, [PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_BACKGROUND])
+
+
+@override_settings(LLM_DAILY_REQUEST_QUOTA=2, LLM_DAILY_TOKEN_QUOTA=None, LLM_TENANT_QUOTAS={})
+class QuotaTests(TestCase):
+    """每日配额：原子占用、退回、超出后 429"""
+
+    def test_reserve_stops_at_quota(self):
+        self.assertIsNone(llm_quota.reserve_request("user:1"))
+        self.assertIsNone(llm_quota.reserve_request("user:1"))
+        retry_after = llm_quota.reserve_request("user:1")
+
+        self.assertIsInstance(retry_after, int)
+        self.assertGreater(retry_after, 0)
+        self.assertEqual(LLMUsage.objects.get(tenant="user:1").request_count, 2)
+        # 其他 tenant 不受影响
+        self.assertIsNone(llm_quota.reserve_request("user:2"))
+
+    def test_release_returns_quota(self):
+        llm_quota.reserve_request("user:1")
+        llm_quota.reserve_request("user:1")
+        llm_quota.release_request("user:1")
+
+        self.assertIsNone(llm_quota.reserve_request("user:1"))
+
+    @override_settings(LLM_TENANT_QUOTAS={"user:1": {"tokens": 100}})
+    def test_token_quota(self):
+        LLMUsage.objects.create(tenant="user:1", day=timezone.now().date(), total_tokens=100)
+
+        self.assertIsNotNone(llm_quota.reserve_request("user:1"))
+
+
+@override_settings(LLM_DAILY_REQUEST_QUOTA=1, LLM_DAILY_TOKEN_QUOTA=None, LLM_TENANT_QUOTAS={})
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class QuotaEnforcementTests(TransactionTestCase):
+    """配额在模型调用入口生效，视图返回 429 + Retry-After"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+
+    def _usage(self):
+        return LLMUsage.objects.get(tenant=llm_quota.ANONYMOUS_TENANT).request_count
+
+    def test_exhausted_quota_raises(self):
+        _generate()
+
+        with self.assertRaises(QuotaExceeded) as ctx:
+            _generate(seed_text="另一条种子")
+        self.assertGreater(ctx.exception.retry_after, 0)
+        self.assertEqual(len(_FakeZhipuAI.calls), 1)
+
+    def test_merged_request_is_not_charged(self):
+        _generate()
+        # 配额已用完：宽限期内的相同请求也会被拒绝，不会绕过配额
+        with self.assertRaises(QuotaExceeded):
+            _generate()
+
+        with override_settings(LLM_DAILY_REQUEST_QUOTA=2):
+            _generate()
+        # 第二次拿到的是合并结果，占用的额度已退回
+        self.assertEqual(self._usage(), 1)
+        self.assertEqual(len(_FakeZhipuAI.calls), 1)
+
+    def test_failed_call_is_not_charged(self):
+        with mock.patch.object(_FakeZhipuAI, "create", side_effect=RuntimeError("boom")):
+            with self.assertRaises(LLMError):
+                _generate()
+
+        self.assertEqual(self._usage(), 0)
+
+    def test_view_returns_429(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        seed = TestCaseSeed.objects.create(level2=level2, text="把你好翻译成英文")
+        session = GenerationSession.objects.create(level2=level2, status="done")
+        item = GenerationItem.objects.create(session=session, seed=seed, idx=0, raw_text="旧用例")
+        LLMUsage.objects.create(tenant=llm_quota.ANONYMOUS_TENANT, day=timezone.now().date(), request_count=1)
+
+        response = self.client.post(
+            reverse("Generate_testcases:regenerate_item"), {"item_id": item.id}, content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(response.json()["retry_after"]))
+        self.assertEqual(_FakeZhipuAI.calls, [])
+
+
+@override_settings(LLM_DAILY_REQUEST_QUOTA=None, LLM_DAILY_TOKEN_QUOTA=None, LLM_TENANT_QUOTAS={})
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class ScenarioGenerateTests(TransactionTestCase):
+    """向导第 3 步：逐个种子落库，配额用完返回 429，模型失败返回 500"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        self.seeds = [
+            TestCaseSeed.objects.create(level2=self.level2, text=text) for text in ("把你好翻译成英文", "把谢谢翻译成英文")
+        ]
+
+    def _post(self):
+        data = {"action": "step3_generate", "level2_id": self.level2.id, "temperature": 0.7, "top_p": 1.0}
+        for seed in self.seeds:
+            data[f"seed_{seed.id}"] = "on"
+            data[f"seed_{seed.id}_n"] = 1
+        return self.client.post(reverse("Generate_testcases:create_or_select_scenario"), data)
+
+    def test_each_seed_is_persisted(self):
+        response = self._post()
+
+        self.assertEqual(response.status_code, 302)
+        session = GenerationSession.objects.get()
+        self.assertEqual(session.status, "done")
+        self.assertEqual(session.items.count(), 2)
+        self.assertEqual(len(_FakeZhipuAI.calls), 2)
+
+    def test_exhausted_quota_returns_429(self):
+        with override_settings(LLM_DAILY_REQUEST_QUOTA=0):
+            response = self._post()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(GenerationSession.objects.get().status, "failed")
+        self.assertEqual(_FakeZhipuAI.calls, [])
+
+    def test_llm_error_returns_500_and_keeps_finished_seeds(self):
+        calls = []
+
+        def create(_self, **kwargs):
+            calls.append(kwargs)
+            if len(calls) > 1:
+                raise RuntimeError("boom")
+            return mock.Mock(choices=[mock.Mock(message=mock.Mock(content="用例1"))], usage=None)
+
+        with mock.patch.object(_FakeZhipuAI, "create", create):
+            response = self._post()
+
+        self.assertEqual(response.status_code, 500)
+        session = GenerationSession.objects.get()
+        self.assertEqual(session.status, "failed")
+        # 没有外层事务：第一个种子的结果已经落库
+        self.assertEqual(session.items.count(), 1)
+
+
+class WorkspaceGenerateValidationTests(TestCase):
+    """种子配置在创建会话之前校验"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+
+    def _generate(self, seed_configs, **extra):
+        return self.client.post(reverse("Generate_testcases:workspace_generate"), {
+            "level2_id": self.level2.id, "seed_configs": seed_configs, **extra,
+        })
+
+    def test_bad_seed_configs_return_400_without_session(self):
+        for seed_configs in (
+            '[{"seed_id": "abc", "n": 1}]',
+            '[{"seed_id": 1, "n": "many"}]',
+            '[1, 2]',
+            '{"seed_id": 1}',
+        ):
+            with self.subTest(seed_configs=seed_configs):
+                self.assertEqual(self._generate(seed_configs).status_code, 400)
+        self.assertFalse(GenerationSession.objects.exists())
+
+    def test_bad_sampling_params_return_400(self):
+        response = self._generate('[{"seed_id": 1, "n": 1}]', temperature="hot")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GenerationSession.objects.exists())
+
+
+class ImportUploadTests(TestCase):
+    """上传时同步检查工作簿，无法导入的文件直接返回 400"""
+
+    def setUp(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+        settings_override = override_settings(IMPORT_SPOOL_DIR=self.spool_dir, IMPORT_RUN_IN_THREAD=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _xlsx(self, rows):
+        wb = Workbook()
+        for row in rows:
+            wb.active.append(row)
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    def _upload(self, content, name="cases.xlsx"):
+        return self.client.post(
+            reverse("Generate_testcases:import_excel_to_db"), {"file": SimpleUploadedFile(name, content)}
+        )
+
+    def test_valid_workbook_is_queued(self):
+        content = self._xlsx([["#", "一级", "二级", "提示词", "种子"], [1, "翻译", "文本翻译", "", "你好"]])
+
+        response = self._upload(content)
+
+        self.assertEqual(response.status_code, 202)
+        job = ImportJob.objects.get(id=response.json()["job_id"])
+        self.assertEqual((job.status, job.total_rows), ("pending", 1))
+
+    def test_invalid_workbooks_are_rejected(self):
+        for label, content in (
+            ("corrupt", b"not a zip file"),
+            ("empty", self._xlsx([])),
+            ("header_only", self._xlsx([["#", "一级", "二级", "提示词", "种子"]])),
+        ):
+            with self.subTest(label):
+                response = self._upload(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()["ok"])
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+class CounterMaintenanceTests(TestCase):
+    """反范式计数在各写入路径上保持准确"""
+
+    def test_create_scenario_bumps_level2_count(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+
+        self.client.post(reverse("Generate_testcases:create_or_select_scenario"), {
+            "action": "step2_level2", "level1_id": level1.id, "name": "文本翻译",
+        })
+
+        self.assertTrue(FeatureLevel2.objects.filter(level1=level1, name="文本翻译").exists())
+        level1.refresh_from_db()
+        self.assertEqual(level1.level2_count, 1)
+
+    def test_import_counts_only_seeds_it_inserted(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        # 另一个导入进程已写入同一条种子，但本进程查重时还看不到（查重之后才提交）
+        TestCaseSeed.objects.create(level2=level2, text="种子 0")
+        real_existing = ExcelImporter._existing_seed_keys
+        checks = []
+
+        def stale_first_check(keys):
+            checks.append(keys)
+            return set() if len(checks) == 1 else real_existing(keys)
+
+        rows = [(i + 2, "翻译", "文本翻译", "", f"种子 {i}") for i in range(3)]
+        with mock.patch.object(ExcelImporter, "_existing_seed_keys", staticmethod(stale_first_check)):
+            stats = ExcelImporter().import_rows(rows)
+
+        self.assertEqual(len(checks), 2)
+        self.assertEqual(stats["created_seed"], 2)
+        self.assertEqual(TestCaseSeed.objects.filter(level2=level2).count(), 3)
+        level2.refresh_from_db()
+        self.assertEqual(level2.seed_count, 2)
+
+    def test_decrement_clamps_at_zero(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译", seed_count=1, saved_count=5)
+
+        counters.bump(FeatureLevel2, level2.id, seed_count=-3, saved_count=-2)
+        counters.bump_many(FeatureLevel1, "level2_count", {level1.id: -1})
+
+        level2.refresh_from_db()
+        self.assertEqual((level2.seed_count, level2.saved_count), (0, 3))
+        self.assertEqual(FeatureLevel1.objects.get(id=level1.id).level2_count, 0)
+
+    def test_deleting_seeds_with_drifted_counter_succeeds(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        # 直接建行、不经过写入路径：计数仍为 0，比实际少（计数偏差）
+        TestCaseSeed.objects.create(level2=level2, text="把你好翻译成英文")
+
+        counters.seeds_deleting(TestCaseSeed.objects.filter(level2=level2))
+
+        level2.refresh_from_db()
+        self.assertEqual(level2.seed_count, 0)
+
+
+# 远超压缩阈值、压缩效果明显的长文本
+LONG_TEXT = "用户输入一段包含数字 2024-01-01 和 URL https://example.com 的长句，翻译后格式保持不变。\n" * 20
+
+
+def _raw_column(model, pk, column):
+    """绕过字段转换，直接读数据库里存的原始值"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {connection.ops.quote_name(column)} FROM {connection.ops.quote_name(model._meta.db_table)} "
+            f"WHERE id = %s",
+            [pk],
+        )
+        value = cursor.fetchone()[0]
+    return bytes(value) if isinstance(value, (bytes, memoryview)) else value
+
+
+@override_settings(COMPRESSED_TEXT_MIN_BYTES=256, COMPRESSED_TEXT_LEVEL=6)
+class CompressedTextFieldTests(TestCase):
+    """CompressedTextField：按阈值压缩存储、惰性解压、未访问的值原样写回"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        self.session = GenerationSession.objects.create(level2=level2)
+
+    def _item(self, raw_text, edited_text=None):
+        return GenerationItem.objects.create(session=self.session, idx=0, raw_text=raw_text, edited_text=edited_text)
+
+    def test_round_trip(self):
+        for text in (LONG_TEXT, "短文本", "", "emoji 😀 与换行\n第二行"):
+            with self.subTest(text=text[:10]):
+                item = self._item(text)
+                self.assertEqual(GenerationItem.objects.get(id=item.id).raw_text, text)
+
+    def test_null_is_kept(self):
+        item = self._item("短文本", edited_text=None)
+
+        self.assertIsNone(GenerationItem.objects.get(id=item.id).edited_text)
+        self.assertIsNone(_raw_column(GenerationItem, item.id, "edited_text"))
+
+    def test_long_text_is_compressed(self):
+        item = self._item(LONG_TEXT)
+
+        stored = _raw_column(GenerationItem, item.id, "raw_text")
+        self.assertTrue(stored.startswith(fields.MAGIC))
+        self.assertLess(len(stored), len(LONG_TEXT.encode("utf-8")))
+        self.assertEqual(zlib.decompress(stored[len(fields.MAGIC):]).decode("utf-8"), LONG_TEXT)
+
+    def test_threshold(self):
+        text = "a" * 256
+        below = self._item(text[:-1])
+        at = self._item(text)
+
+        self.assertEqual(_raw_column(GenerationItem, below.id, "raw_text"), text[:-1].encode("utf-8"))
+        self.assertTrue(_raw_column(GenerationItem, at.id, "raw_text").startswith(fields.MAGIC))
+
+    def test_threshold_counts_utf8_bytes(self):
+        # 86 个汉字 = 258 字节，超过 256 字节阈值
+        item = self._item("翻" * 86)
+
+        self.assertTrue(_raw_column(GenerationItem, item.id, "raw_text").startswith(fields.MAGIC))
+
+    @override_settings(COMPRESSED_TEXT_MIN_BYTES=1)
+    def test_value_that_grows_when_compressed_is_stored_plain(self):
+        item = self._item("翻译")
+
+        self.assertEqual(_raw_column(GenerationItem, item.id, "raw_text"), "翻译".encode("utf-8"))
+
+    def test_decompression_is_lazy(self):
+        item_id = self._item(LONG_TEXT).id
+        item = GenerationItem.objects.get(id=item_id)
+
+        self.assertIsInstance(item.__dict__["raw_text"], fields.PackedText)
+        self.assertEqual(item.raw_text, LONG_TEXT)
+        # 解压结果缓存到实例上，之后的访问不再解压
+        self.assertEqual(item.__dict__["raw_text"], LONG_TEXT)
+
+    def test_untouched_value_is_written_back_unchanged(self):
+        item_id = self._item(LONG_TEXT).id
+        stored = _raw_column(GenerationItem, item_id, "raw_text")
+        item = GenerationItem.objects.get(id=item_id)
+        item.is_edited = True
+
+        with mock.patch("Generate_testcases.fields.pack", side_effect=AssertionError("不应重新压缩")):
+            item.save()
+
+        self.assertIsInstance(item.__dict__["raw_text"], fields.PackedText)
+        self.assertEqual(_raw_column(GenerationItem, item_id, "raw_text"), stored)
+
+    def test_assigned_value_is_recompressed(self):
+        item = GenerationItem.objects.get(id=self._item(LONG_TEXT).id)
+        item.raw_text = LONG_TEXT + "追加"
+        item.save()
+
+        self.assertEqual(GenerationItem.objects.get(id=item.id).raw_text, LONG_TEXT + "追加")
+
+    def test_values_return_packed_text(self):
+        item = self._item(LONG_TEXT, edited_text="短文本")
+
+        raw_text, edited_text = GenerationItem.objects.values_list("raw_text", "edited_text").get(id=item.id)
+        self.assertIsInstance(raw_text, fields.PackedText)
+        self.assertEqual(fields.unpack(raw_text), LONG_TEXT)
+        self.assertEqual(edited_text, "短文本")
+        self.assertEqual(fields.unpack(edited_text), "短文本")
+        self.assertIsInstance(GenerationItem.objects.values("raw_text").get(id=item.id)["raw_text"], fields.PackedText)
+
+    def test_bulk_create_and_bulk_update(self):
+        GenerationItem.objects.bulk_create([
+            GenerationItem(session=self.session, idx=i, raw_text=LONG_TEXT) for i in range(3)
+        ])
+        items = list(GenerationItem.objects.filter(session=self.session))
+        for it in items:
+            it.edited_text = f"{LONG_TEXT}{it.idx}"
+        GenerationItem.objects.bulk_update(items, ["edited_text"])
+
+        for it in GenerationItem.objects.filter(session=self.session):
+            self.assertEqual((it.raw_text, it.edited_text), (LONG_TEXT, f"{LONG_TEXT}{it.idx}"))
+
+
+class _MigrationTestCase(TransactionTestCase):
+    """数据迁移测试：先回退到 migrate_from，用历史模型造数据后迁移到 migrate_to，结束后迁移回最新"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.migration = importlib.import_module(f"Generate_testcases.migrations.{self.migrate_to[0][1]}")
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.migrate_from)
+        self.addCleanup(self._migrate_to_latest)
+        self.old_apps = self.executor.loader.project_state(self.migrate_from).apps
+
+    def _migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def _migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def old_model(self, name):
+        return self.old_apps.get_model("Generate_testcases", name)
+
+
+class CompressedTextMigrationTests(_MigrationTestCase):
+    """0012 迁移：分块压缩已有数据，回滚时还原为文本"""
+
+    migrate_from = [("Generate_testcases", "0011_generationarchive")]
+    migrate_to = [("Generate_testcases", "0012_compressed_text")]
+
+    def test_existing_rows_are_converted_in_chunks(self):
+        apps = self.executor.loader.project_state(self.migrate_from).apps
+        level1 = apps.get_model("Generate_testcases", "FeatureLevel1").objects.create(name="翻译")
+        level2 = apps.get_model("Generate_testcases", "FeatureLevel2").objects.create(level1=level1, name="文本翻译")
+        session = apps.get_model("Generate_testcases", "GenerationSession").objects.create(level2=level2)
+        old_item = apps.get_model("Generate_testcases", "GenerationItem")
+        texts = [(LONG_TEXT + str(i), "短文本" if i % 2 else None) for i in range(5)]
+        ids = [
+            old_item.objects.create(session=session, idx=i, raw_text=raw, edited_text=edited).id
+            for i, (raw, edited) in enumerate(texts)
+        ]
+        saved = apps.get_model("Generate_testcases", "SavedCaseItem").objects.create(
+            level2=level2, saved_batch_id="b1", idx=0, text=LONG_TEXT,
+        )
+
+        # 每块 2 行：5 行数据需要 3 块
+        with mock.patch.object(self.migration, "CHUNK_SIZE", 2):
+            self._migrate(self.migrate_to)
+
+        for pk, (raw, edited) in zip(ids, texts):
+            stored = _raw_column(GenerationItem, pk, "raw_text")
+            self.assertTrue(stored.startswith(fields.MAGIC))
+            self.assertEqual(fields.PackedText(stored).unpack(), raw)
+            # 短文本不压缩：sqlite 修改列类型时保留原来的 TEXT 值，这里只校验内容
+            edited_stored = _raw_column(GenerationItem, pk, "edited_text")
+            self.assertEqual(
+                edited_stored.decode("utf-8") if isinstance(edited_stored, bytes) else edited_stored, edited
+            )
+        self.assertTrue(_raw_column(SavedCaseItem, saved.id, "text").startswith(fields.MAGIC))
+
+        # 回滚：全部还原为文本
+        with mock.patch.object(self.migration, "CHUNK_SIZE", 2):
+            self._migrate(self.migrate_from)
+        for pk, (raw, edited) in zip(ids, texts):
+            self.assertEqual(_raw_column(GenerationItem, pk, "raw_text"), raw)
+            self.assertEqual(_raw_column(GenerationItem, pk, "edited_text"), edited)
+        self.assertEqual(_raw_column(SavedCaseItem, saved.id, "text"), LONG_TEXT)
+
+
+@override_settings(SEARCH_MAX_CANDIDATES=3)
+class SearchCandidateLimitTests(TestCase):
+    """检索先按词元取有限的候选文档再排序，常见词元的开销有上限"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="账户")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="登录")
+        texts = ["验证码登录失败"] + [f"用户登录场景 {i}" for i in range(6)]
+        self.seeds = [TestCaseSeed.objects.create(level2=self.level2, text=text) for text in texts]
+        search_index.index_seeds(self.seeds)
+
+    def _ids(self, query, **kwargs):
+        results, _ = search_index.search("seed", query, **kwargs)
+        return [doc.id for doc, _, _ in results]
+
+    def test_common_token_only_considers_newest_documents(self):
+        self.assertEqual(self._ids("登录"), [seed.id for seed in reversed(self.seeds[-3:])])
+
+    def test_match_all_drives_from_rarest_token(self):
+        # 「验证码」只出现在最早的文档里，常见词元「登录」的候选截断不影响结果
+        self.assertEqual(self._ids("验证码 登录"), [self.seeds[0].id])
+
+    def test_match_any_unions_capped_candidates(self):
+        ids = self._ids("验证码 场景", match_all=False)
+
+        self.assertIn(self.seeds[0].id, ids)
+        self.assertEqual(len(ids), 4)
+
+
+class SimilarityTests(TestCase):
+    """近似重复查找：场景过滤在分桶查询里完成，候选数有上限"""
+
+    TEXT = "用户登录失败后提示密码错误"
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="账户")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="登录")
+        self.other = FeatureLevel2.objects.create(level1=level1, name="注册")
+        self.items = self._save(self.level2, 3)
+        self.foreign = self._save(self.other, 1)[0]
+
+    def _save(self, level2, count):
+        start = SavedCaseItem.objects.count()
+        items = [
+            SavedCaseItem.objects.create(level2=level2, saved_batch_id="b1", idx=start + i, text=self.TEXT)
+            for i in range(count)
+        ]
+        similarity.index_saved_items(items)
+        return items
+
+    def _ids(self, **kwargs):
+        return [row.saved_item_id for row, _ in similarity.find_similar(self.TEXT, **kwargs)]
+
+    def test_bands_carry_level2(self):
+        self.assertEqual(
+            set(MinHashBand.objects.filter(saved_item=self.foreign).values_list("level2_id", flat=True)),
+            {self.other.id},
+        )
+
+    def test_level2_filter_applies_to_band_rows(self):
+        self.assertEqual(sorted(self._ids(level2_id=self.level2.id)), [item.id for item in self.items])
+        for rows in similarity.candidate_bands(similarity.signature(self.TEXT), level2_id=self.level2.id):
+            self.assertNotIn(self.foreign.id, rows.values_list("saved_item_id", flat=True))
+
+    def test_exclude_drops_the_document_itself(self):
+        ids = self._ids(level2_id=self.level2.id, exclude=("saved", self.items[0].id))
+
+        self.assertEqual(sorted(ids), [item.id for item in self.items[1:]])
+
+    @override_settings(SIMILARITY_MAX_CANDIDATES=similarity.BANDS)
+    def test_candidates_are_capped_per_band(self):
+        # 每段最多取 1 行：16 段最多命中 16 个候选
+        self._save(self.level2, 30)
+
+        with self.assertNumQueries(similarity.BANDS + 1):
+            ids = self._ids(level2_id=self.level2.id, limit=100)
+        self.assertTrue(0 < len(ids) <= similarity.BANDS)
+
+
+class MinHashBandMigrationTests(_MigrationTestCase):
+    """0016 迁移：从签名行分块回填分桶行的 level2"""
+
+    migrate_from = [("Generate_testcases", "0015_hot_query_indexes")]
+    migrate_to = [("Generate_testcases", "0016_minhashband_level2")]
+
+    def test_band_rows_are_backfilled_in_chunks(self):
+        apps = self.executor.loader.project_state(self.migrate_from).apps
+        level1 = apps.get_model("Generate_testcases", "FeatureLevel1").objects.create(name="账户")
+        level2 = apps.get_model("Generate_testcases", "FeatureLevel2").objects.create(level1=level1, name="登录")
+        # 历史模型没有 save() 里的 text_hash 计算，手工给出
+        seed_model = apps.get_model("Generate_testcases", "TestCaseSeed")
+        seed = seed_model.objects.create(level2=level2, text="登录", text_hash="h1")
+        saved = apps.get_model("Generate_testcases", "SavedCaseItem").objects.create(
+            level2=level2, saved_batch_id="b1", idx=0, text="登录",
+        )
+        signature_model = apps.get_model("Generate_testcases", "MinHashSignature")
+        signature_model.objects.create(level2=level2, seed=seed, signature=b"s")
+        signature_model.objects.create(level2=level2, saved_item=saved, signature=b"s")
+        old_band = apps.get_model("Generate_testcases", "MinHashBand")
+        for band in range(3):
+            old_band.objects.create(band=band, bucket=band, seed=seed)
+            old_band.objects.create(band=band, bucket=band, saved_item=saved)
+        orphan = seed_model.objects.create(level2=level2, text="注册", text_hash="h2")
+        old_band.objects.create(band=0, bucket=0, seed=orphan)
+
+        # 每块 2 行：7 行数据需要 4 块
+        with mock.patch.object(self.migration, "CHUNK_SIZE", 2):
+            self._migrate(self.migrate_to)
+
+        self.assertEqual(MinHashBand.objects.filter(level2_id=level2.id).count(), 6)
+        # 没有签名行的分桶行无法确定场景，被删除
+        self.assertFalse(MinHashBand.objects.filter(seed_id=orphan.id).exists())
+
+
+class ReplicaSettingsTests(TestCase):
+    """只读副本的地址来自环境变量，开启副本但缺少地址时启动失败"""
+
+    def _load(self, **env):
+        import PA_Project.settings as project_settings
+
+        self.addCleanup(importlib.reload, project_settings)
+        with mock.patch.dict(os.environ, env):
+            return importlib.reload(project_settings)
+
+    def test_enabled_without_host_fails(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "READ_REPLICA_HOST"):
+            self._load(READ_REPLICA_ENABLED="true", READ_REPLICA_HOST="", READ_REPLICA_PORT="3306")
+
+    def test_replica_uses_configured_address(self):
+        loaded = self._load(
+            READ_REPLICA_ENABLED="true", READ_REPLICA_HOST="10.0.0.2", READ_REPLICA_PORT="3307",
+            READ_REPLICA_USER="reader",
+        )
+
+        replica = loaded.DATABASES["replica"]
+        self.assertEqual((replica["HOST"], replica["PORT"], replica["USER"]), ("10.0.0.2", "3307", "reader"))
+        self.assertEqual(loaded.DATABASES["default"]["HOST"], "127.0.0.1")
+
+    def test_disabled_adds_no_alias(self):
+        loaded = self._load(READ_REPLICA_ENABLED="", READ_REPLICA_HOST="", READ_REPLICA_PORT="")
+
+        self.assertNotIn("replica", loaded.DATABASES)
+
+
+class ArchiveGenerationHistoryTests(TestCase):
+    """archive_generation_history：归档后删除热表数据，重复执行无副作用，主键重用时不丢数据"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        self.seed = TestCaseSeed.objects.create(level2=self.level2, text="把你好翻译成英文")
+
+    def _old_session(self, texts):
+        session = GenerationSession.objects.create(level2=self.level2, status="done")
+        for idx, text in enumerate(texts):
+            GenerationItem.objects.create(session=session, seed=self.seed, idx=idx, raw_text=text)
+        GenerationSession.objects.filter(id=session.id).update(created_at=timezone.now() - timedelta(days=200))
+        return session
+
+    def _archive(self):
+        out = io.StringIO()
+        call_command("archive_generation_history", days=90, chunk_size=1, stdout=out)
+        return out.getvalue()
+
+    def test_old_sessions_are_archived_and_deleted(self):
+        old = self._old_session(["用例1", "用例2"])
+        recent = GenerationSession.objects.create(level2=self.level2, status="done")
+
+        self._archive()
+
+        self.assertFalse(GenerationSession.objects.filter(id=old.id).exists())
+        self.assertFalse(GenerationItem.objects.filter(session_id=old.id).exists())
+        self.assertTrue(GenerationSession.objects.filter(id=recent.id).exists())
+        data = GenerationArchive.objects.get(session_id=old.id).load()
+        self.assertEqual([item["raw_text"] for item in data["items"]], ["用例1", "用例2"])
+
+    def test_rerun_is_a_noop(self):
+        old = self._old_session(["用例1"])
+        self._archive()
+
+        self._archive()
+
+        self.assertEqual(GenerationArchive.objects.filter(session_id=old.id).count(), 1)
+
+    def test_reused_session_id_keeps_live_rows(self):
+        old = self._old_session(["新会话的用例"])
+        # 主键被重用：已有一条属于另一个（早已删除的）会话的归档
+        GenerationArchive.objects.create(
+            session_id=old.id, level2=self.level2, status="done", item_count=1,
+            session_created_at=timezone.now() - timedelta(days=400), payload=zlib.compress(b"{}"),
+        )
+        other = self._old_session(["用例"])
+
+        output = self._archive()
+
+        self.assertIn(str(old.id), output)
+        self.assertEqual(list(GenerationItem.objects.filter(session_id=old.id).values_list("raw_text", flat=True)),
+                         ["新会话的用例"])
+        self.assertEqual(GenerationArchive.objects.get(session_id=old.id).load(), {})
+        # 同一次执行中其他会话照常归档
+        self.assertFalse(GenerationSession.objects.filter(id=other.id).exists())
+        self.assertTrue(GenerationArchive.objects.filter(session_id=other.id).exists())
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExcelExportTests(TestCase):
+    """导出按键集分页读取：行数多于一页时内容和顺序不变"""
+
+    def test_export_spans_several_pages(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        rows = [("b2", 0), ("b1", 1), ("b1", 0), ("b2", 2), ("b1", 2)]
+        for i, (batch, idx) in enumerate(rows):
+            SavedCaseItem.objects.create(level2=level2, saved_batch_id=batch, idx=idx, text=f"用例{i}")
+
+        out = io.BytesIO()
+        with self.assertNumQueries(3):
+            count = excel_export.write_workbook(excel_export.export_queryset(level2_id=level2.id), out)
+
+        self.assertEqual(count, 5)
+        sheet = load_workbook(io.BytesIO(out.getvalue()), read_only=True)["测试用例"]
+        values = [(row[2], row[3], row[4]) for row in sheet.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual(values, [
+            ("b1", 0, "用例2"), ("b1", 1, "用例1"), ("b1", 2, "用例4"), ("b2", 0, "用例0"), ("b2", 2, "用例3"),
+        ])
+
+
+class SeedDedupMigrationTests(_MigrationTestCase):
+    """0006 迁移：合并同场景下内容相同的种子，依赖它们的生成项、种子配置和最终用例都保留"""
+
+    migrate_from = [("Generate_testcases", "0005_llmusage")]
+    migrate_to = [("Generate_testcases", "0006_testcaseseed_text_hash")]
+
+    def test_duplicates_are_merged_into_the_oldest_seed(self):
+        level1 = self.old_model("FeatureLevel1").objects.create(name="翻译")
+        level2 = self.old_model("FeatureLevel2").objects.create(level1=level1, name="文本翻译")
+        other_level2 = self.old_model("FeatureLevel2").objects.create(level1=level1, name="语音翻译")
+        seed_model = self.old_model("TestCaseSeed")
+        keeper = seed_model.objects.create(level2=level2, text="把你好翻译成英文")
+        # 只差首尾空白和换行符：规范化后相同
+        duplicate = seed_model.objects.create(level2=level2, text="把你好翻译成英文\r\n")
+        # 其他场景的同文本种子不合并
+        elsewhere = seed_model.objects.create(level2=other_level2, text="把你好翻译成英文")
+
+        session_model = self.old_model("GenerationSession")
+        config_model = self.old_model("GenerationSeedConfig")
+        shared = session_model.objects.create(level2=level2)
+        only_dup = session_model.objects.create(level2=level2)
+        config_model.objects.create(session=shared, seed=keeper, n=1)
+        config_model.objects.create(session=shared, seed=duplicate, n=2)
+        config_model.objects.create(session=only_dup, seed=duplicate, n=3)
+        item = self.old_model("GenerationItem").objects.create(
+            session=only_dup, seed=duplicate, idx=0, raw_text="用例",
+        )
+        saved = self.old_model("SavedCaseItem").objects.create(
+            level2=level2, from_session=only_dup, from_gen_item=item, saved_batch_id="b1", idx=0, text="用例",
+        )
+
+        apps = self._migrate(self.migrate_to)
+
+        new_seed = apps.get_model("Generate_testcases", "TestCaseSeed")
+        self.assertEqual(sorted(new_seed.objects.values_list("id", flat=True)), sorted([keeper.id, elsewhere.id]))
+        self.assertEqual(apps.get_model("Generate_testcases", "GenerationItem").objects.get(id=item.id).seed_id, keeper.id)
+        self.assertEqual(
+            apps.get_model("Generate_testcases", "SavedCaseItem").objects.get(id=saved.id).from_gen_item_id, item.id
+        )
+        configs = {
+            session_id: (seed_id, n)
+            for session_id, seed_id, n in apps.get_model("Generate_testcases", "GenerationSeedConfig")
+            .objects.values_list("session_id", "seed_id", "n")
+        }
+        # 会话里已有保留种子的配置时丢弃重复种子的配置，否则改指向保留种子
+        self.assertEqual(configs, {shared.id: (keeper.id, 1), only_dup.id: (keeper.id, 3)})
+        self.assertEqual(
+            new_seed.objects.get(id=keeper.id).text_hash, TestCaseSeed.hash_text("把你好翻译成英文")
+        )
+
+
+class CurrentVersionMigrationTests(_MigrationTestCase):
+    """0010 迁移：每个 (会话, idx) 只有最新一条是当前版本"""
+
+    migrate_from = [("Generate_testcases", "0009_featurelevel2_latest_session")]
+    migrate_to = [("Generate_testcases", "0010_generationitem_is_current")]
+
+    def test_only_latest_version_per_slot_stays_current(self):
+        level1 = self.old_model("FeatureLevel1").objects.create(name="翻译")
+        level2 = self.old_model("FeatureLevel2").objects.create(level1=level1, name="文本翻译")
+        session = self.old_model("GenerationSession").objects.create(level2=level2)
+        item_model = self.old_model("GenerationItem")
+        v1 = item_model.objects.create(session=session, idx=0, raw_text="v1")
+        v2 = item_model.objects.create(session=session, idx=0, raw_text="v2", regen_from_item=v1)
+        v3 = item_model.objects.create(session=session, idx=0, raw_text="v3", regen_from_item=v2)
+        other = item_model.objects.create(session=session, idx=1, raw_text="其他位置")
+
+        apps = self._migrate(self.migrate_to)
+
+        current = apps.get_model("Generate_testcases", "GenerationItem").objects.filter(is_current=True)
+        self.assertEqual(sorted(current.values_list("id", flat=True)), [v3.id, other.id])
+
+
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class CurrentVersionTests(TransactionTestCase):
+    """重新生成（单条 / 批量）后每个 (会话, idx) 恰好一个当前版本"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        seed = TestCaseSeed.objects.create(level2=level2, text="把你好翻译成英文")
+        self.session = GenerationSession.objects.create(level2=level2, status="done")
+        self.items = [
+            GenerationItem.objects.create(session=self.session, seed=seed, idx=idx, raw_text=f"用例{idx}")
+            for idx in range(3)
+        ]
+
+    def _post(self, name, data):
+        return self.client.post(reverse(f"Generate_testcases:{name}"), data, content_type="application/json")
+
+    def assertSingleHeads(self):
+        heads = (
+            GenerationItem.objects.filter(session=self.session, is_current=True)
+            .values_list("idx", flat=True).order_by("idx")
+        )
+        self.assertEqual(list(heads), [0, 1, 2])
+
+    def test_regenerate_item(self):
+        first = self._post("regenerate_item", {"item_id": self.items[0].id}).json()
+        # 对已被替换的历史版本再次重新生成，仍只有一个当前版本
+        self._post("regenerate_item", {"item_id": self.items[0].id})
+
+        self.assertSingleHeads()
+        self.assertFalse(GenerationItem.objects.get(id=first["item_id"]).is_current)
+        self.assertEqual(GenerationItem.objects.filter(session=self.session, idx=0).count(), 3)
+
+    def test_regenerate_items(self):
+        self._post("regenerate_items", {"item_ids": [it.id for it in self.items[:2]]})
+        self._post("regenerate_items", {"item_ids": [it.id for it in self.items]})
+
+        self.assertSingleHeads()
+        self.assertEqual(GenerationItem.objects.filter(session=self.session).count(), 8)
+
+
+@override_settings(LLM_DAILY_REQUEST_QUOTA=None, LLM_DAILY_TOKEN_QUOTA=None, LLM_TENANT_QUOTAS={})
+@mock.patch.dict("os.environ", {"ZHIPU_API_KEY": "test-key"})
+@mock.patch("Generate_testcases.llm_client.ZhipuAI", _FakeZhipuAI)
+class IncrementalRebuildTests(TransactionTestCase):
+    """增量重建：输入没变的种子直接复制基准会话的当前版本，只有变化的种子调用模型"""
+
+    def setUp(self):
+        _FakeZhipuAI.calls = []
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        self.kept = TestCaseSeed.objects.create(level2=self.level2, text="把你好翻译成英文")
+        self.changed = TestCaseSeed.objects.create(level2=self.level2, text="把谢谢翻译成英文")
+
+    def _generate(self, **extra):
+        seed_configs = json.dumps([{"seed_id": seed.id, "n": 1} for seed in (self.kept, self.changed)])
+        return self.client.post(reverse("Generate_testcases:workspace_generate"), {
+            "level2_id": self.level2.id, "seed_configs": seed_configs, **extra,
+        }).json()
+
+    def test_unchanged_seeds_are_reused(self):
+        base = self._generate()
+        self.assertEqual(len(_FakeZhipuAI.calls), 2)
+        base_item = GenerationItem.objects.get(session_id=base["session_id"], seed=self.kept)
+        base_item.edited_text = "人工修改过的用例"
+        base_item.is_edited = True
+        base_item.save(update_fields=["edited_text", "is_edited"])
+        self.changed.text = "把再见翻译成英文"
+        self.changed.save()
+
+        rebuilt = self._generate(rebuild_from_latest="1")
+
+        self.assertEqual(len(_FakeZhipuAI.calls), 3)
+        self.assertIn("把再见翻译成英文", _FakeZhipuAI.calls[-1]["messages"][-1]["content"])
+        self.assertEqual((rebuilt["base_session_id"], rebuilt["reused_seeds"], rebuilt["generated_seeds"]),
+                         (base["session_id"], 1, 1))
+        reused = GenerationItem.objects.get(session_id=rebuilt["session_id"], seed=self.kept)
+        self.assertEqual((reused.raw_text, reused.edited_text, reused.is_edited),
+                         (base_item.raw_text, "人工修改过的用例", True))
+
+
+class LatestSessionTests(TestCase):
+    """latest_session 只前移到有生成项的已完成会话"""
+
+    def setUp(self):
+        level1 = FeatureLevel1.objects.create(name="翻译")
+        self.level2 = FeatureLevel2.objects.create(level1=level1, name="文本翻译")
+        seed = TestCaseSeed.objects.create(level2=self.level2, text="把你好翻译成英文")
+        self.session = GenerationSession.objects.create(level2=self.level2)
+        GenerationItem.objects.create(session=self.session, seed=seed, idx=0, raw_text="旧结果")
+        self.session.mark_done()
+
+    def _latest_id(self):
+        return FeatureLevel2.objects.get(id=self.level2.id).latest_session_id
+
+    def test_done_session_becomes_latest(self):
+        self.assertEqual(self._latest_id(), self.session.id)
+        response = self.client.get(reverse("Generate_testcases:level2_detail", args=[self.level2.id]))
+        self.assertEqual(response.context["session"].id, self.session.id)
+        self.assertEqual(response.context["total_count"], 1)
+
+    def test_empty_session_does_not_hide_previous_results(self):
+        empty = GenerationSession.objects.create(level2=self.level2)
+        empty.mark_done()
+
+        self.assertEqual(empty.status, "done")
+        self.assertEqual(self._latest_id(), self.session.id)
+
+    def test_older_session_finishing_late_does_not_move_pointer_back(self):
+        newer = GenerationSession.objects.create(level2=self.level2)
+        GenerationItem.objects.create(session=newer, idx=0, raw_text="新结果")
+        newer.mark_done()
+
+        self.session.mark_done()
+
+        self.assertEqual(self._latest_id(), newer.id)
@@ -16,14 +16,23 @@ urlpatterns = [
     path("api/add-level2/", views.add_level2, name="add_level2"),
     path("api/add-seed/", views.add_seed, name="add_seed"),
     path("api/workspace-generate/", views.workspace_generate, name="workspace_generate"),
+    path("api/cancel-session/", views.cancel_session, name="cancel_session"),
     path("api/delete-items/", views.delete_items, name="delete_items"),
     path("api/update-level1/", views.update_level1, name="update_level1"),
     path("api/update-level2/", views.update_level2, name="update_level2"),
     path("api/update-seed/", views.update_seed, name="update_seed"),
     path("api/regenerate-item/", views.regenerate_item, name="regenerate_item"),
+    path("api/regenerate-items/", views.regenerate_items, name="regenerate_items"),
     path("api/save-all-edits/", views.save_all_edits, name="save_all_edits"),
     path("api/save-to-final/", views.save_to_final, name="save_to_final"),
+    path("api/llm-scheduler-stats/", views.llm_scheduler_stats, name="llm_scheduler_stats"),
+    path("api/llm-usage/", views.llm_usage, name="llm_usage"),
     # urls.py 里 urlpatterns 中追加
     path('api/import-excel/', views.import_excel_to_db, name='import_excel_to_db'),
+    path('api/import-jobs/<int:job_id>/', views.import_job_status, name='import_job_status'),
+    path('api/export-saved/', views.export_saved_cases, name='export_saved_cases'),
+    path('api/level2-sessions/', views.level2_sessions, name='level2_sessions'),
+    path('api/search/', views.search_cases, name='search_cases'),
+    path('api/similar/', views.similar_items, name='similar_items'),
 
 ]
\ No newline at end of file
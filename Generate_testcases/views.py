@@ -4,33 +4,39 @@ from django.shortcuts import render,HttpResponse
 
 # app/views.py
 from django.shortcuts import get_object_or_404, redirect, render
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 
 from .models import (
     FeatureLevel1, FeatureLevel2, TestCaseSeed, 
     GenerationSession, GenerationItem, GenerationSeedConfig,
-    SavedCaseItem
+    SavedCaseItem, ImportJob
 )
 from .forms import (
     FeatureLevel1Form, FeatureLevel2Form, SeedSelectionForm,
     GenerationSessionForm, GenerationItemFormSet, SaveCaseSetForm, TestCaseSeedForm
 )
-from .llm_client import generate_cases_for_seed, LLMError
+from .llm_client import generate_cases_for_seed, LLMError, GenerationCancelled, QuotaExceeded
+from .llm_quota import tenant_for_user
+from .llm_scheduler import get_scheduler, priority_for_session, PRIORITY_INTERACTIVE
 
 # views.py 末尾追加
 # from django.http import JsonResponse
 # from django.views.decorators.http import require_http_methods
 # from django.db import transaction
 
-from openpyxl import load_workbook
+from .excel_import import create_import_job, start_import_job, InvalidWorkbook
+from .excel_export import open_export
+from . import counters, search_index, similarity
+from .db_router import read_replica
 
 from .models import FeatureLevel1, FeatureLevel2, TestCaseSeed
 
+@read_replica
 def testcase_workspace(request):
     """
     测试用例工作台：三栏布局
@@ -127,7 +133,9 @@ def create_or_select_scenario(request):
                         # 不存在则创建新的
                         level2 = level2_form.save(commit=False)
                         level2.level1 = level1
-                        level2.save()
+                        with transaction.atomic():
+                            level2.save()
+                            counters.bump(FeatureLevel1, level1.id, level2_count=1)
                         messages.success(request, f"已创建二级功能：{level2.name}")
                 
                 # 初始化种子选择表单
@@ -150,85 +158,103 @@ def create_or_select_scenario(request):
                     messages.error(request, "请至少选择一个种子样例")
                     seed_form = SeedSelectionForm(level2=level2)
                 else:
-                    with transaction.atomic():
-                        # # 创建生成会话
-                        # session = session_form.save(commit=False)
-                        # session.level2 = level2
-                        # session.model_name = "mock-model"
-                        # session.status = "done"
-                        # session.created_by = request.user if request.user.is_authenticated else None
-                        # session.save()
-                        #
-                        # # 为每个选中的种子创建配置并生成用例
-                        # idx = 0
-                        # for seed, n in selected_seeds:
-                        #     # 创建种子配置
-                        #     GenerationSeedConfig.objects.create(
-                        #         session=session,
-                        #         seed=seed,
-                        #         n=n
-                        #     )
-                        #
-                        #     # 生成用例（mock）
-                        #     base = seed.text[:50] + "…" if len(seed.text) > 50 else seed.text
-                        #     effective_prompt = session.effective_prompt
-                        #     for i in range(n):
-                        #         GenerationItem.objects.create(
-                        #             session=session,
-                        #             idx=idx,
-                        #             raw_text=f"[{level2.name}] 泛化用例 {idx+1} | seed={base} | prompt={effective_prompt[:30] if effective_prompt else 'default'}",
-                        #         )
-                        #         idx += 1
-                        # 创建生成会话
-                        session = session_form.save(commit=False)
-                        session.level2 = level2
-
-                        # 你要求“只有一个prompt”：这里以 session.prompt 为准（来自前端提交）
-                        # session_form 已包含 prompt 字段 :contentReference[oaicite:10]{index=10}
-
-                        session.model_name = "your-llm-model"  # 这里写你实际模型名/渠道名
-                        session.status = "draft"
-                        session.created_by = request.user if request.user.is_authenticated else None
-                        session.save()
-
-                        idx = 0
-                        try:
-                            for seed, n in selected_seeds:
-                                GenerationSeedConfig.objects.create(session=session, seed=seed, n=n)
-
-                                # === 真实大模型调用 ===
-                                prompt = (session.prompt or "").strip()  # 你定义的“唯一prompt”
-                                outputs = generate_cases_by_llm(
-                                    level1_name=level1.name,
-                                    level2_name=level2.name,
-                                    prompt=prompt,
-                                    seed_text=seed.text,
-                                    n=n,
-                                    temperature=session.temperature,
-                                    top_p=session.top_p,
-                                )
-
-                                # outputs 必须是 list[str]，长度最好==n（不足就按实际写入）
-                                for text in outputs:
-                                    text = (text or "").strip()
-                                    if not text:
-                                        continue
-                                    GenerationItem.objects.create(
-                                        session=session,
-                                        seed=seed,  # ✅ 关键：补上seed关联，否则结果页按种子分组会丢 :contentReference[oaicite:11]{index=11}
-                                        idx=idx,
-                                        raw_text=text,  # ✅ 真实模型输出直接写这里
-                                    )
-                                    idx += 1
-
-                            session.status = "done"
-                            session.save(update_fields=["status"])
-
-                        except Exception as e:
-                            # 失败要落库，方便前端提示/排查
-                            session.status = "failed"
-                            session.save(update_fields=["status"])
-                            raise
+                    # # 创建生成会话
+                    # session = session_form.save(commit=False)
+                    # session.level2 = level2
+                    # session.model_name = "mock-model"
+                    # session.status = "done"
+                    # session.created_by = request.user if request.user.is_authenticated else None
+                    # session.save()
+                    #
+                    # # 为每个选中的种子创建配置并生成用例
+                    # idx = 0
+                    # for seed, n in selected_seeds:
+                    #     # 创建种子配置
+                    #     GenerationSeedConfig.objects.create(
+                    #         session=session,
+                    #         seed=seed,
+                    #         n=n
+                    #     )
+                    #
+                    #     # 生成用例（mock）
+                    #     base = seed.text[:50] + "…" if len(seed.text) > 50 else seed.text
+                    #     effective_prompt = session.effective_prompt
+                    #     for i in range(n):
+                    #         GenerationItem.objects.create(
+                    #             session=session,
+                    #             idx=idx,
+                    #             raw_text=f"[{level2.name}] 泛化用例 {idx+1} | seed={base} | prompt={effective_prompt[:30] if effective_prompt else 'default'}",
+                    #         )
+                    #         idx += 1
+                    # 创建生成会话
+                    session = session_form.save(commit=False)
+                    session.level2 = level2
+
+                    # 你要求“只有一个prompt”：这里以 session.prompt 为准（来自前端提交）
+                    # session_form 已包含 prompt 字段 :contentReference[oaicite:10]{index=10}
+
+                    # ⚠️ 不要用一个大事务包住整个生成过程（同 workspace_generate）：模型调用耗时很长，
+                    # 事务不提交时配额行一直被锁住、single-flight 锁行对其他 worker 不可见；每个种子的结果单独落库
+                    session.model_name = "your-llm-model"  # 这里写你实际模型名/渠道名
+                    session.status = "draft"
+                    session.created_by = request.user if request.user.is_authenticated else None
+                    session.save()
+
+                    idx = 0
+                    priority = priority_for_session(len(selected_seeds))
+                    try:
+                        # 种子配置一次性批量写入
+                        GenerationSeedConfig.objects.bulk_create(
+                            [GenerationSeedConfig(session=session, seed=seed, n=n) for seed, n in selected_seeds]
+                        )
+
+                        for seed, n in selected_seeds:
+                            # === 真实大模型调用 ===
+                            prompt = (session.prompt or "").strip()  # 你定义的“唯一prompt”
+                            outputs = generate_cases_for_seed(
+                                level1_name=level1.name,
+                                level2_name=level2.name,
+                                prompt=prompt,
+                                seed_text=seed.text,
+                                n=n,
+                                temperature=session.temperature,
+                                top_p=session.top_p,
+                                idx=idx,
+                                priority=priority,
+                                tenant=tenant_for_user(request.user),
+                            )
+
+                            # outputs 必须是 list[str]，长度最好==n（不足就按实际写入）
+                            new_items = []
+                            for text in outputs:
+                                text = (text or "").strip()
+                                if not text:
+                                    continue
+                                new_items.append(GenerationItem(
+                                    session=session,
+                                    seed=seed,  # ✅ 关键：补上seed关联，否则结果页按种子分组会丢 :contentReference[oaicite:11]{index=11}
+                                    idx=idx,
+                                    raw_text=text,  # ✅ 真实模型输出直接写这里
+                                ))
+                                idx += 1
+                            # 每个种子一次多行 INSERT
+                            _bulk_create_items(new_items)
+
+                        session.mark_done()
+
+                    except QuotaExceeded as e:
+                        session.status = "failed"
+                        session.save(update_fields=["status"])
+                        return _quota_exceeded_response(e)
+                    except LLMError as e:
+                        session.status = "failed"
+                        session.save(update_fields=["status"])
+                        return JsonResponse({"error": str(e)}, status=500)
+                    except Exception as e:
+                        # 失败要落库，方便前端提示/排查
+                        session.status = "failed"
+                        session.save(update_fields=["status"])
+                        raise
 
                     messages.success(request, f"生成完成！共生成 {idx} 条用例（mock）")
                     return redirect(reverse("Generate_testcases:level2_detail", args=[level2.id]))
@@ -241,9 +267,11 @@ def create_or_select_scenario(request):
     seed_list = []
     if level2 and seed_form:
         seeds = TestCaseSeed.objects.filter(level2=level2).order_by("-created_at")
+        ordinals = TestCaseSeed.ordinals_for_level2(level2.id)
         for seed in seeds:
             seed_list.append({
                 'id': seed.id,
+                'ordinal': ordinals.get(seed.id),
                 'text': seed.text,
                 'field_name': f'seed_{seed.id}',
                 'n_field_name': f'seed_{seed.id}_n'
@@ -266,6 +294,7 @@ def create_or_select_scenario(request):
 
 
 @require_http_methods(["GET"])
+@read_replica
 def get_level2_list(request):
     """AJAX接口：根据一级功能ID获取二级功能列表"""
     level1_id = request.GET.get("level1_id")
@@ -275,13 +304,16 @@ def get_level2_list(request):
     try:
         level1 = FeatureLevel1.objects.get(id=level1_id)
         level2_list = FeatureLevel2.objects.filter(level1=level1).order_by("name")
-        data = [{"id": l2.id, "name": l2.name, "prompt": l2.prompt or ""} for l2 in level2_list]
+        data = [{"id": l2.id, "ordinal": i, "name": l2.name, "prompt": l2.prompt or "",
+                 "seed_count": l2.seed_count, "saved_count": l2.saved_count}
+                for i, l2 in enumerate(level2_list, start=1)]
         return JsonResponse({"level2_list": data})
     except FeatureLevel1.DoesNotExist:
         return JsonResponse({"error": "一级功能不存在"}, status=404)
 
 
 @require_http_methods(["GET"])
+@read_replica
 def get_seed_list(request):
     """AJAX接口：根据二级功能ID获取种子测试用例列表"""
     level2_id = request.GET.get("level2_id")
@@ -291,12 +323,14 @@ def get_seed_list(request):
     try:
         level2 = FeatureLevel2.objects.get(id=level2_id)
         seeds = TestCaseSeed.objects.filter(level2=level2).order_by("-created_at")
+        ordinals = TestCaseSeed.ordinals_for_level2(level2.id)
         data = [{
             "id": seed.id,
+            "ordinal": ordinals.get(seed.id),  # 展示用序号（按创建顺序），主键不保证连续
             "text": seed.text,
             "created_at": seed.created_at.strftime("%Y-%m-%d %H:%M")
         } for seed in seeds]
-        return JsonResponse({"seed_list": data, "prompt": level2.prompt or ""})
+        return JsonResponse({"seed_list": data, "prompt": level2.prompt or "", "seed_count": level2.seed_count})
     except FeatureLevel2.DoesNotExist:
         return JsonResponse({"error": "二级功能不存在"}, status=404)
 
@@ -342,7 +376,9 @@ def add_level2(request):
     if existing:
         return JsonResponse({"error": f"二级功能「{name}」已存在"}, status=400)
     
-    level2 = FeatureLevel2.objects.create(level1=level1, name=name, code=code, prompt=prompt)
+    with transaction.atomic():
+        level2 = FeatureLevel2.objects.create(level1=level1, name=name, code=code, prompt=prompt)
+        counters.bump(FeatureLevel1, level1.id, level2_count=1)
     return JsonResponse({"id": level2.id, "name": level2.name, "prompt": level2.prompt or "", "message": "添加成功"})
 
 
@@ -362,17 +398,35 @@ def add_seed(request):
     except FeatureLevel2.DoesNotExist:
         return JsonResponse({"error": "二级功能不存在"}, status=404)
     
-    seed = TestCaseSeed.objects.create(
-        level2=level2,
-        text=text,
-        source="manual",
-        created_by=request.user if request.user.is_authenticated else None
-    )
+    if TestCaseSeed.objects.filter(level2=level2, text_hash=TestCaseSeed.hash_text(text)).exists():
+        return JsonResponse({"error": "该种子测试用例已存在"}, status=400)
+
+    try:
+        with transaction.atomic():
+            seed = TestCaseSeed.objects.create(
+                level2=level2,
+                text=text,
+                source="manual",
+                created_by=request.user if request.user.is_authenticated else None
+            )
+            counters.seeds_created({level2.id: 1})
+            search_index.index_seeds([seed])
+            similarity.index_seeds([seed])
+    except IntegrityError:
+        # 并发提交了相同内容
+        return JsonResponse({"error": "该种子测试用例已存在"}, status=400)
+
+    # 提示已有的相似种子（不阻止添加）
+    similar = similarity.find_similar(seed.text, kinds=("seed",), exclude=("seed", seed.id), limit=5)
     
     return JsonResponse({
         "id": seed.id,
         "text": seed.text,
         "created_at": seed.created_at.strftime("%Y-%m-%d %H:%M"),
+        "similar_seeds": [
+            {"id": row.seed_id, "level2_id": row.level2_id, "similarity": round(score, 2)}
+            for row, score in similar
+        ],
         "message": "添加成功"
     })
 
@@ -524,10 +578,21 @@ def add_seed(request):
 
 @require_http_methods(["POST"])
 def workspace_generate(request):
+    """
+    工作台生成测试用例
+    增量重建模式（传 base_session_id，或 rebuild_from_latest=1 表示基于该场景最近一次会话）：
+    种子文本、场景提示词、采样参数都没变的种子，直接复制基准会话中的最新结果，
+    只有新增或变化的种子才调用大模型
+    """
     level2_id = request.POST.get("level2_id")
     seed_configs = request.POST.get("seed_configs")
-    temperature = float(request.POST.get("temperature", 0.7))
-    top_p = float(request.POST.get("top_p", 1.0))
+    try:
+        temperature = float(request.POST.get("temperature", 0.7))
+        top_p = float(request.POST.get("top_p", 1.0))
+    except ValueError:
+        return JsonResponse({"error": "采样参数格式错误"}, status=400)
+    base_session_id = request.POST.get("base_session_id")
+    rebuild_from_latest = request.POST.get("rebuild_from_latest") in ("1", "true", "on")
 
     if not level2_id:
         return JsonResponse({"error": "缺少二级功能ID"}, status=400)
@@ -542,6 +607,19 @@ def workspace_generate(request):
     except Exception:
         return JsonResponse({"error": "种子配置格式错误"}, status=400)
 
+    # 解析种子配置：同一种子重复出现时以最后一次的数量为准
+    # 在创建会话之前校验完所有配置，格式错误直接返回 400，不留下空的 draft 会话
+    requested = {}
+    try:
+        for config in seed_configs:
+            seed_id = config.get("seed_id")
+            n = int(config.get("n", 0) or 0)
+            if not seed_id or n <= 0:
+                continue
+            requested[int(seed_id)] = n
+    except (AttributeError, TypeError, ValueError):
+        return JsonResponse({"error": "种子配置格式错误"}, status=400)
+
     try:
         level2 = FeatureLevel2.objects.select_related("level1").get(id=level2_id)
     except FeatureLevel2.DoesNotExist:
@@ -551,82 +629,213 @@ def workspace_generate(request):
     scenario_prompt = level2.prompt or ""
     level1_name = level2.level1.name
     level2_name = level2.name
+    model_name = getattr(settings, "ZHIPU_MODEL", "glm-4")
+
+    # 增量重建的基准会话
+    base_session = None
+    if base_session_id:
+        base_session = GenerationSession.objects.filter(id=base_session_id, level2=level2).first()
+        if base_session is None:
+            return JsonResponse({"error": "基准会话不存在"}, status=404)
+    elif rebuild_from_latest:
+        base_session = (
+            GenerationSession.objects
+            .filter(level2=level2, status__in=["done", "cancelled"])
+            .order_by("-created_at")
+            .first()
+        )
+    base_configs = {}
+    if base_session:
+        base_configs = {cfg.seed_id: cfg for cfg in base_session.seed_configs.all()}
+
+    # ⚠️ 不要用一个大事务包住整个生成过程：模型调用耗时很长，
+    # 事务不提交时 session 和 single-flight 锁行对其他 worker 都不可见。
+    # 每个种子的结果单独批量落库，查询次数与种子数成正比，与用例条数无关。
+    # ✅ 只创建一次 session
+    session = GenerationSession.objects.create(
+        level2=level2,
+        prompt=None,
+        model_name=model_name,
+        temperature=temperature,
+        top_p=top_p,
+        status="draft",
+        created_by=request.user if request.user.is_authenticated else None
+    )
 
-    with transaction.atomic():
-        # ✅ 只创建一次 session
-        session = GenerationSession.objects.create(
-            level2=level2,
-            prompt=None,
-            model_name=getattr(settings, "ZHIPU_MODEL", "glm-4"),
+    seeds_by_id = TestCaseSeed.objects.filter(level2=level2).in_bulk(list(requested))
+    plan = []  # [(seed, n, fingerprint)]
+    for seed_id, n in requested.items():
+        seed = seeds_by_id.get(seed_id)
+        if seed is None:
+            continue
+        fingerprint = GenerationSeedConfig.make_fingerprint(
+            seed_text=seed.text,
+            prompt=scenario_prompt,
             temperature=temperature,
             top_p=top_p,
-            status="draft",
-            created_by=request.user if request.user.is_authenticated else None
+            model_name=model_name,
         )
-
-        idx = 0
-        try:
-            for config in seed_configs:
-                seed_id = config.get("seed_id")
-                n = int(config.get("n", 0) or 0)
-                if not seed_id or n <= 0:
-                    continue
-
-                try:
-                    seed = TestCaseSeed.objects.get(id=seed_id, level2=level2)
-                except TestCaseSeed.DoesNotExist:
+        plan.append((seed, n, fingerprint))
+
+    # 种子配置一次性批量写入（新会话，不会触发唯一键冲突）
+    GenerationSeedConfig.objects.bulk_create([
+        GenerationSeedConfig(session=session, seed=seed, n=n, fingerprint=fingerprint)
+        for seed, n, fingerprint in plan
+    ])
+
+    idx = 0
+    reused_seeds = generated_seeds = 0
+    tenant = tenant_for_user(request.user)
+    # 少量种子的生成视为点击类请求，优先于批量任务
+    priority = priority_for_session(len(plan))
+    try:
+        for seed, n, fingerprint in plan:
+            # 每个种子开始前检查是否已被取消
+            if session.is_cancel_requested():
+                raise GenerationCancelled("生成已取消")
+
+            # 增量重建：输入没变且基准会话里数量够用，直接复制最新版本
+            base_cfg = base_configs.get(seed.id)
+            if base_cfg and base_cfg.fingerprint == fingerprint and base_cfg.n >= n:
+                reused = list(
+                    GenerationItem.objects
+                    .filter(session=base_session, seed=seed, is_current=True)
+                    .order_by("idx")[:n]
+                )
+                if len(reused) == n:
+                    new_items = []
+                    for it in reused:
+                        new_items.append(GenerationItem(
+                            session=session,
+                            seed=seed,
+                            idx=idx,
+                            raw_text=it.raw_text,
+                            edited_text=it.edited_text,
+                            is_edited=it.is_edited,
+                        ))
+                        idx += 1
+                    _bulk_create_items(new_items)
+                    reused_seeds += 1
                     continue
 
-                # ✅ 不会触发唯一键冲突
-                GenerationSeedConfig.objects.update_or_create(
+            # ✅ 只调用一次大模型
+            cases = generate_cases_for_seed(
+                level1_name=level1_name,
+                level2_name=level2_name,
+                seed_text=seed.text,
+                prompt=scenario_prompt,
+                n=n,
+                temperature=temperature,
+                top_p=top_p,
+                idx=idx,
+                priority=priority,
+                cancel_check=session.is_cancel_requested,
+                tenant=tenant,
+            )
+
+            # 每个种子的结果一次多行 INSERT 落库（单条语句本身是原子的）
+            new_items = []
+            for text in cases:
+                new_items.append(GenerationItem(
                     session=session,
                     seed=seed,
-                    defaults={"n": n},
-                )
-
-                # ✅ 只调用一次大模型
-                cases = generate_cases_for_seed(
-                    level1_name=level1_name,
-                    level2_name=level2_name,
-                    seed_text=seed.text,
-                    prompt=scenario_prompt,
-                    n=n,
-                    temperature=temperature,
-                    top_p=top_p,
                     idx=idx,
-                )
-
-                for text in cases:
-                    GenerationItem.objects.create(
-                        session=session,
-                        seed=seed,
-                        idx=idx,
-                        raw_text=text,
-                    )
-                    idx += 1
-
-            session.status = "done"
-            session.save(update_fields=["status"])
+                    raw_text=text,
+                ))
+                idx += 1
+            _bulk_create_items(new_items)
+            generated_seeds += 1
+
+        session.mark_done()
+
+    except GenerationCancelled:
+        # 已完成的种子结果保留
+        session.status = "cancelled"
+        session.save(update_fields=["status"])
+        return JsonResponse({
+            "session_id": session.id,
+            "level2_id": level2.id,
+            "total": idx,
+            "cancelled": True,
+            "message": f"生成已取消，保留已完成的 {idx} 条用例"
+        })
+    except QuotaExceeded as e:
+        session.status = "failed"
+        session.save(update_fields=["status"])
+        return _quota_exceeded_response(e)
+    except LLMError as e:
+        session.status = "failed"
+        session.save(update_fields=["status"])
+        return JsonResponse({"error": str(e)}, status=500)
+    except Exception as e:
+        session.status = "failed"
+        session.save(update_fields=["status"])
+        return JsonResponse({"error": f"生成失败: {str(e)}"}, status=500)
 
-        except LLMError as e:
-            session.status = "failed"
-            session.save(update_fields=["status"])
-            return JsonResponse({"error": str(e)}, status=500)
-        except Exception as e:
-            session.status = "failed"
-            session.save(update_fields=["status"])
-            return JsonResponse({"error": f"生成失败: {str(e)}"}, status=500)
+    message = f"生成完成！共生成 {idx} 条用例"
+    if base_session:
+        message += f"（复用 {reused_seeds} 个未变化种子的结果，{generated_seeds} 个种子重新生成）"
 
     return JsonResponse({
         "session_id": session.id,
         "level2_id": level2.id,
         "total": idx,
-        "message": f"生成完成！共生成 {idx} 条用例"
+        "base_session_id": base_session.id if base_session else None,
+        "reused_seeds": reused_seeds,
+        "generated_seeds": generated_seeds,
+        "message": message
+    })
+
+@require_http_methods(["POST"])
+def cancel_session(request):
+    """
+    取消进行中的生成会话
+    - 传 session_id：取消指定会话
+    - 传 level2_id：取消该场景下所有进行中的会话（前端在生成返回前拿不到 session_id）
+    只能取消同一 tenant 发起的会话，其他人的会话返回 404
+    只是置取消标记，生成过程在下一个检查点退出，状态变为 cancelled
+    """
+    import json
+
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        level2_id = data.get('level2_id')
+    except:
+        return JsonResponse({"error": "请求数据格式错误"}, status=400)
+
+    if not session_id and not level2_id:
+        return JsonResponse({"error": "缺少session_id或level2_id"}, status=400)
+
+    qs = GenerationSession.objects.filter(status="draft")
+    if session_id:
+        qs = qs.filter(id=session_id)
+    else:
+        qs = qs.filter(level2_id=level2_id)
+
+    # 只能取消与自己同一 tenant（与配额相同的划分：用户 / 团队 / 匿名）发起的会话，
+    # 其他人的会话按不存在处理；进行中的会话很少，逐个判断即可
+    tenant = tenant_for_user(request.user)
+    owned_ids = [
+        session.id for session in qs.select_related("created_by")
+        if tenant_for_user(session.created_by) == tenant
+    ]
+    cancelled_count = GenerationSession.objects.filter(id__in=owned_ids, status="draft").update(cancel_requested=True)
+    if session_id and not cancelled_count:
+        return JsonResponse({"error": "会话不存在或已结束"}, status=404)
+
+    return JsonResponse({
+        "message": f"已请求取消 {cancelled_count} 个生成会话",
+        "cancelled_count": cancelled_count
     })
 
+
 @require_http_methods(["POST"])
 def delete_items(request):
-    """批量删除并重排ID"""
+    """
+    批量删除
+    主键保持稳定、不再重排；界面上的连续编号由读取时计算的 ordinal 提供
+    """
     import json
     
     try:
@@ -648,59 +857,21 @@ def delete_items(request):
         # 2. 删除选中的二级功能（会级联删除种子）
         if level2_ids:
             deleted_count += FeatureLevel2.objects.filter(id__in=level2_ids).count()
+            counters.level2_deleting(FeatureLevel2.objects.filter(id__in=level2_ids))
             FeatureLevel2.objects.filter(id__in=level2_ids).delete()
         
         # 3. 删除选中的种子
         if seed_ids:
             deleted_count += TestCaseSeed.objects.filter(id__in=seed_ids).count()
+            counters.seeds_deleting(TestCaseSeed.objects.filter(id__in=seed_ids))
             TestCaseSeed.objects.filter(id__in=seed_ids).delete()
-        
-        # 4. 重排ID
-        if level1_ids:
-            _reorder_ids(FeatureLevel1)
-        if level2_ids:
-            _reorder_ids(FeatureLevel2)
-        if seed_ids:
-            _reorder_ids(TestCaseSeed)
-    
+
     return JsonResponse({
         "message": f"成功删除 {deleted_count} 项",
         "deleted_count": deleted_count
     })
 
 
-def _reorder_ids(model):
-    """重排模型的ID，使其连续"""
-    from django.db import connection
-    
-    # 获取所有记录，按当前ID排序
-    items = list(model.objects.all().order_by('id'))
-    
-    if not items:
-        return
-    
-    # 临时禁用外键检查（MySQL）
-    with connection.cursor() as cursor:
-        cursor.execute('SET FOREIGN_KEY_CHECKS=0')
-        
-        try:
-            # 重新分配ID
-            for new_id, item in enumerate(items, start=1):
-                if item.id != new_id:
-                    # 更新ID
-                    old_id = item.id
-                    model.objects.filter(id=old_id).update(id=new_id)
-            
-            # 重置自增计数器
-            table_name = model._meta.db_table
-            next_id = len(items) + 1
-            cursor.execute(f"ALTER TABLE {table_name} AUTO_INCREMENT = {next_id}")
-        
-        finally:
-            # 重新启用外键检查
-            cursor.execute('SET FOREIGN_KEY_CHECKS=1')
-
-
 @require_http_methods(["POST"])
 def update_level1(request):
     """更新一级功能"""
@@ -770,11 +941,24 @@ def update_seed(request):
     
     try:
         seed = TestCaseSeed.objects.get(id=seed_id)
-        seed.text = text
-        seed.save()
+        duplicate = (
+            TestCaseSeed.objects
+            .filter(level2_id=seed.level2_id, text_hash=TestCaseSeed.hash_text(text))
+            .exclude(id=seed.id)
+            .exists()
+        )
+        if duplicate:
+            return JsonResponse({"error": "同一场景下已存在相同内容的种子用例"}, status=400)
+        with transaction.atomic():
+            seed.text = text
+            seed.save()
+            search_index.index_seeds([seed])
+            similarity.index_seeds([seed])
         return JsonResponse({"message": "更新成功"})
     except TestCaseSeed.DoesNotExist:
         return JsonResponse({"error": "种子用例不存在"}, status=404)
+    except IntegrityError:
+        return JsonResponse({"error": "同一场景下已存在相同内容的种子用例"}, status=400)
 
 
 @require_http_methods(["POST"])
@@ -820,22 +1004,29 @@ def regenerate_item(request):
                 n=1,
                 temperature=session.temperature,
                 top_p=session.top_p,
-                idx='重试生成'
-
+                idx='重试生成',
+                priority=PRIORITY_INTERACTIVE,
+                tenant=tenant_for_user(request.user),
+                reuse_recent=False,
             )[0]
+        except QuotaExceeded as e:
+            return _quota_exceeded_response(e)
         except LLMError as e:
             return JsonResponse({"error": str(e)}, status=500)
 
-        # ⭐ 创建新记录（重新生成模式）
-        new_item = GenerationItem.objects.create(
-            session=original_item.session,
-            seed=original_item.seed,
-            idx=original_item.idx,  # 保持相同的idx，表示这是同一个位置的重新生成
-            raw_text=new_text,
-            edited_text=None,  # 重新生成后清空编辑内容
-            is_edited=False,
-            regen_from_item=original_item  # 关联到原始记录
-        )
+        # ⭐ 创建新记录（重新生成模式），并在同一事务内切换该位置的当前版本
+        with transaction.atomic():
+            GenerationItem.retire_current(original_item.session_id, [original_item.idx])
+            new_item = GenerationItem.objects.create(
+                session=original_item.session,
+                seed=original_item.seed,
+                idx=original_item.idx,  # 保持相同的idx，表示这是同一个位置的重新生成
+                raw_text=new_text,
+                edited_text=None,  # 重新生成后清空编辑内容
+                is_edited=False,
+                regen_from_item=original_item  # 关联到原始记录
+            )
+            counters.bump(GenerationSession, new_item.session_id, item_count=1)
 
         return JsonResponse({
             "new_text": new_text,
@@ -848,10 +1039,193 @@ def regenerate_item(request):
         return JsonResponse({"error": f"重新生成失败: {str(e)}"}, status=500)
 
 
+@require_http_methods(["POST"])
+def regenerate_items(request):
+    """
+    批量重新生成多条测试用例
+    - 按 (会话, 种子) 分组：同一种子下的 k 条只调用一次模型（n=k）
+    - 各组并发调用（受调度器并发上限约束）
+    - 新记录一次性批量写入，regen_from_item 指向原记录，idx 保持不变
+    """
+    import json
+    from collections import defaultdict
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        data = json.loads(request.body)
+        item_ids = data.get('item_ids', [])
+    except:
+        return JsonResponse({"error": "请求数据格式错误"}, status=400)
+
+    if not item_ids:
+        return JsonResponse({"error": "请至少选择一条用例"}, status=400)
+    # JSON / 表单里的 id 可能是字符串，统一转成 int 再与查询结果比对；去重并保持顺序
+    try:
+        if not isinstance(item_ids, list):
+            raise TypeError
+        item_ids = list(dict.fromkeys(int(item_id) for item_id in item_ids))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "item_ids 必须是整数列表"}, status=400)
+
+    items = (
+        GenerationItem.objects
+        .filter(id__in=item_ids)
+        .select_related("session", "session__level2", "session__level2__level1", "seed")
+        .order_by("idx", "id")
+    )
+
+    # 同一位置 (会话, idx) 只重新生成一次：请求里同时出现某位置的历史版本和当前版本时，
+    # 合并为一条并以该位置的当前版本为准，否则同一位置会插入两个当前版本
+    found_ids = set()
+    by_slot = {}
+    for item in items:
+        found_ids.add(item.id)
+        by_slot.setdefault((item.session_id, item.idx), item)
+    if by_slot:
+        heads = (
+            GenerationItem.objects
+            .filter(
+                session_id__in={session_id for session_id, _ in by_slot},
+                idx__in={idx for _, idx in by_slot},
+                is_current=True,
+            )
+            .select_related("session", "session__level2", "session__level2__level1", "seed")
+        )
+        for head in heads:
+            if (head.session_id, head.idx) in by_slot:
+                by_slot[(head.session_id, head.idx)] = head
+
+    errors = []
+    groups = defaultdict(list)
+    for item in by_slot.values():
+        if not item.seed:
+            errors.append({"item_id": item.id, "error": "该条记录没有关联种子，无法重新生成"})
+            continue
+        groups[(item.session_id, item.seed_id)].append(item)
+    for item_id in item_ids:
+        if item_id not in found_ids:
+            errors.append({"item_id": item_id, "error": "生成项不存在"})
+
+    priority = priority_for_session(len(groups))
+    tenant = tenant_for_user(request.user)
+
+    def regenerate_group(group):
+        from django.db import connections
+        first = group[0]
+        session = first.session
+        level2 = session.level2
+        try:
+            return generate_cases_for_seed(
+                level1_name=level2.level1.name,
+                level2_name=level2.name,
+                seed_text=first.seed.text,
+                prompt=level2.prompt or "",
+                n=len(group),
+                temperature=session.temperature,
+                top_p=session.top_p,
+                idx='批量重试生成',
+                priority=priority,
+                tenant=tenant,
+                reuse_recent=False,
+            )
+        finally:
+            # 线程内的数据库连接（single-flight 锁行）用完即关
+            connections.close_all()
+
+    new_items = []
+    quota_error = None
+    max_workers = max(1, min(len(groups), getattr(settings, "LLM_MAX_CONCURRENCY", 4)))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(group, pool.submit(regenerate_group, group)) for group in groups.values()]
+        for group, future in futures:
+            try:
+                texts = future.result()
+            except QuotaExceeded as e:
+                quota_error = e
+                errors.extend({"item_id": it.id, "error": str(e)} for it in group)
+                continue
+            except LLMError as e:
+                errors.extend({"item_id": it.id, "error": str(e)} for it in group)
+                continue
+            except Exception as e:
+                errors.extend({"item_id": it.id, "error": f"重新生成失败: {str(e)}"} for it in group)
+                continue
+            for original_item, new_text in zip(group, texts):
+                new_items.append(GenerationItem(
+                    session_id=original_item.session_id,
+                    seed_id=original_item.seed_id,
+                    idx=original_item.idx,  # 保持相同的idx，表示这是同一个位置的重新生成
+                    raw_text=new_text,
+                    edited_text=None,
+                    is_edited=False,
+                    regen_from_item=original_item,
+                ))
+
+    if quota_error is not None and not new_items:
+        return _quota_exceeded_response(quota_error)
+
+    with transaction.atomic():
+        idxs_by_session = defaultdict(set)
+        for it in new_items:
+            idxs_by_session[it.session_id].add(it.idx)
+        for session_id, idxs in idxs_by_session.items():
+            GenerationItem.retire_current(session_id, idxs)
+        _bulk_create_items(new_items, id_lookup="regen_from_item")
+
+    results = [{
+        "item_id": it.regen_from_item_id,
+        "new_item_id": it.id,
+        "new_text": it.raw_text,
+    } for it in new_items]
+
+    return JsonResponse({
+        "results": results,
+        "errors": errors,
+        "regenerated_count": len(results),
+        "message": f"成功重新生成 {len(results)} 条用例" + (f"，失败 {len(errors)} 条" if errors else "")
+    })
+
+
+def _bulk_create_items(items, id_lookup=None, batch_size=None):
+    """
+    批量写入 GenerationItem，按 batch_size（默认 settings.BULK_INSERT_BATCH_SIZE）分块生成多行 INSERT。
+    MySQL 的 bulk_create 不回填主键：传入 id_lookup 时按该字段回查并补上 id
+    - "regen_from_item"：每个原记录对应一条新记录，取该原记录最新的子记录
+    同时按会话累加 item_count
+    """
+    if not items:
+        return items
+    if batch_size is None:
+        batch_size = getattr(settings, "BULK_INSERT_BATCH_SIZE", 500)
+    GenerationItem.objects.bulk_create(items, batch_size=batch_size)
+    counters.bump_many(GenerationSession, "item_count", counters.count_by(items, "session_id"))
+    if id_lookup is None or items[0].pk is not None:
+        return items
+
+    if id_lookup == "regen_from_item":
+        rows = (
+            GenerationItem.objects
+            .filter(regen_from_item_id__in=[it.regen_from_item_id for it in items])
+            .order_by("regen_from_item_id", "-id")
+            .values_list("regen_from_item_id", "id")
+        )
+        latest = {}
+        for parent_id, pk in rows:
+            latest.setdefault(parent_id, pk)
+        for it in items:
+            it.id = latest.get(it.regen_from_item_id)
+    return items
+
+
 @require_http_methods(["POST"])
 def save_all_edits(request):
-    """批量保存所有编辑"""
+    """
+    批量保存所有编辑
+    一次查询取出本会话内所有目标记录，再用一条批量 UPDATE 只写 edited_text/is_edited/updated_at，
+    查询次数与编辑条数无关
+    """
     import json
+    from django.utils import timezone
     
     try:
         data = json.loads(request.body)
@@ -868,25 +1242,39 @@ def save_all_edits(request):
     except GenerationSession.DoesNotExist:
         return JsonResponse({"error": "会话不存在"}, status=404)
     
+    # item_id -> 新文本（空文本忽略；同一条重复提交以最后一次为准）
+    texts = {}
+    for update in updates:
+        item_id = update.get('item_id')
+        text = (update.get('text') or '').strip()
+        if not item_id or not text:
+            continue
+        try:
+            texts[int(item_id)] = text
+        except (TypeError, ValueError):
+            continue
+
     saved_count = 0
-    
+
     with transaction.atomic():
-        for update in updates:
-            item_id = update.get('item_id')
-            text = update.get('text', '').strip()
-            
-            if not text:
-                continue
-            
-            try:
-                item = GenerationItem.objects.get(id=item_id, session=session)
-                item.edited_text = text
-                item.is_edited = True
-                item.save()
-                saved_count += 1
-            except GenerationItem.DoesNotExist:
-                continue
-    
+        # 只取本会话内的记录，不属于该会话的 item_id 直接忽略
+        items = list(
+            GenerationItem.objects
+            .filter(session=session, id__in=list(texts))
+            .only("id", "edited_text", "is_edited", "updated_at")
+        )
+        now = timezone.now()  # bulk_update 不会触发 auto_now，需要手动设置
+        for item in items:
+            item.edited_text = texts[item.id]
+            item.is_edited = True
+            item.updated_at = now
+        GenerationItem.objects.bulk_update(
+            items,
+            ["edited_text", "is_edited", "updated_at"],
+            batch_size=getattr(settings, "BULK_INSERT_BATCH_SIZE", 500),
+        )
+        saved_count = len(items)
+
     return JsonResponse({
         "message": f"成功保存 {saved_count} 条修改",
         "saved_count": saved_count
@@ -899,14 +1287,13 @@ def save_to_final(request):
     将生成结果保存到最终库
     ⭐ 关键修改：按idx分组，找到每个idx的最新版本
     功能流程：
-    1. 获取该会话的所有GenerationItem记录
-    2. 按idx分组，对每个idx找到最新的GenerationItem记录（按created_at倒序）
-    3. 使用该记录的final_text作为最终用例
-    4. 保存到SavedCaseItem表
+    1. 按 is_current 取每个idx的当前版本（重新生成时已切换），走 (session, is_current, idx) 索引
+    2. 使用该记录的final_text作为最终用例
+    3. 分块批量写入SavedCaseItem表
+    重新生成的历史版本不会被读取，读取行数只与用例条数有关
     """
     import json
     from datetime import datetime
-    from collections import defaultdict
 
     try:
         data = json.loads(request.body)
@@ -928,50 +1315,52 @@ def save_to_final(request):
             version_title = f"{session.level2.name} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
 
         with transaction.atomic():
-            # 获取该场景的所有旧记录数量（用于提示）
-            old_count = SavedCaseItem.objects.filter(level2=session.level2).count()
-
-            # ⭐ 关键修改：按idx分组，找到每个idx的最新GenerationItem
-            all_items = GenerationItem.objects.filter(session=session).order_by('idx', '-created_at')
+            # 该场景已有的最终用例数量（用于提示），直接读计数列
+            old_count = FeatureLevel2.objects.filter(id=session.level2_id).values_list("saved_count", flat=True).first() or 0
 
-            if not all_items.exists():
+            if not GenerationItem.objects.filter(session=session).exists():
                 return JsonResponse({"error": "该会话没有生成任何用例"}, status=400)
 
-            # 按idx分组
-            items_by_idx = defaultdict(list)
-            for item in all_items:
-                items_by_idx[item.idx].append(item)
+            # ⭐ 关键修改：每个idx只取当前版本
+            latest_items = (
+                GenerationItem.objects
+                .filter(session=session, is_current=True)
+                .order_by("idx")
+                .only("id", "idx", "raw_text", "edited_text", "is_edited")
+            )
 
+            batch_size = getattr(settings, "BULK_INSERT_BATCH_SIZE", 500)
+            created_by = request.user if request.user.is_authenticated else None
             saved_count = 0
-            final_idx = 1  # SavedCaseItem的索引，从1开始
-
-            # 按idx排序后遍历
-            for idx in sorted(items_by_idx.keys()):
-                items_list = items_by_idx[idx]
-                # 取该idx的最新记录（第一个，因为已经按created_at倒序排序）
-                latest_item = items_list[0]
-
-                # 使用该记录的final_text
-                final_text = latest_item.final_text
-
-                # 保存到最终库
-                SavedCaseItem.objects.create(
-                    level2=session.level2,
+            buffer = []
+            for latest_item in latest_items.iterator(chunk_size=batch_size):
+                saved_count += 1
+                buffer.append(SavedCaseItem(
+                    level2_id=session.level2_id,
                     from_session=session,
-                    from_gen_item=latest_item,
+                    from_gen_item_id=latest_item.id,
                     saved_batch_id=saved_batch_id,
-                    idx=final_idx,
-                    text=final_text,
+                    idx=saved_count,  # SavedCaseItem的索引，从1开始
+                    text=latest_item.final_text,
                     version_title=version_title,
                     status=status,
-                    created_by=request.user if request.user.is_authenticated else None
-                )
-
-                saved_count += 1
-                final_idx += 1
+                    created_by=created_by,
+                ))
+                if len(buffer) >= batch_size:
+                    SavedCaseItem.objects.bulk_create(buffer)
+                    buffer = []
+            if buffer:
+                SavedCaseItem.objects.bulk_create(buffer)
 
             if saved_count == 0:
                 return JsonResponse({"error": "没有找到可保存的用例"}, status=400)
+            counters.bump(FeatureLevel2, session.level2_id, saved_count=saved_count)
+            # bulk_create 在 MySQL 上不回填主键，按批次重新取出后建立检索索引和相似度签名
+            saved_items = list(
+                SavedCaseItem.objects.filter(saved_batch_id=saved_batch_id).only("id", "level2_id", "text")
+            )
+            search_index.index_saved_items(saved_items)
+            similarity.index_saved_items(saved_items)
 
         message = f"成功保存 {saved_count} 条测试用例到最终库"
         if old_count > 0:
@@ -991,6 +1380,56 @@ def save_to_final(request):
         return JsonResponse({"error": f"保存到最终库失败: {str(e)}"}, status=500)
 
 
+@require_http_methods(["GET"])
+def llm_scheduler_stats(request):
+    """AJAX接口：大模型调度器各优先级的排队时间统计（本进程）"""
+    return JsonResponse(get_scheduler().stats())
+
+
+@require_http_methods(["GET"])
+def llm_usage(request):
+    """
+    AJAX接口：按用户/团队统计的大模型用量
+    参数：day=YYYY-MM-DD（默认今天）
+    """
+    from datetime import datetime
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from .models import LLMUsage
+
+    day_str = request.GET.get("day")
+    try:
+        day = datetime.strptime(day_str, "%Y-%m-%d").date() if day_str else timezone.now().date()
+    except ValueError:
+        return JsonResponse({"error": "day格式应为YYYY-MM-DD"}, status=400)
+
+    rows = list(LLMUsage.objects.filter(day=day).order_by("-total_tokens"))
+    user_ids = [int(r.tenant.split(":", 1)[1]) for r in rows if r.tenant.startswith("user:")]
+    usernames = dict(get_user_model().objects.filter(pk__in=user_ids).values_list("pk", "username"))
+
+    data = []
+    for r in rows:
+        username = None
+        if r.tenant.startswith("user:"):
+            username = usernames.get(int(r.tenant.split(":", 1)[1]))
+        data.append({
+            "tenant": r.tenant,
+            "username": username,
+            "request_count": r.request_count,
+            "prompt_tokens": r.prompt_tokens,
+            "completion_tokens": r.completion_tokens,
+            "total_tokens": r.total_tokens,
+        })
+    return JsonResponse({"day": day.strftime("%Y-%m-%d"), "usage": data})
+
+
+def _quota_exceeded_response(e):
+    """配额用完：429 + Retry-After"""
+    response = JsonResponse({"error": str(e), "retry_after": e.retry_after}, status=429)
+    response["Retry-After"] = str(e.retry_after)
+    return response
+
+
 # @require_http_methods(["GET"])
 # def get_level2_list(request):
 #     """AJAX接口：根据一级功能ID获取二级功能列表"""
@@ -1007,28 +1446,40 @@ def save_to_final(request):
 #         return JsonResponse({"error": "一级功能不存在"}, status=404)
 
 
+@read_replica
 def level2_detail(request, level2_id):
     """
     二级功能详情：展示生成结果（新版美化界面）
     1. 只读展示种子测试用例
-    2. 按种子分组展示所有生成结果（包括重新生成的版本）
+    2. 按种子分组展示生成结果（每个位置的当前版本）
+    默认展示最近一次完成的会话（level2.latest_session）；?session_id= 查看历史会话
     """
-    level2 = get_object_or_404(FeatureLevel2.objects.select_related("level1"), id=level2_id)
+    level2 = get_object_or_404(FeatureLevel2.objects.select_related("level1", "latest_session"), id=level2_id)
     seeds = TestCaseSeed.objects.filter(level2=level2).order_by("created_at")
 
-    # 取最新 session
-    session = GenerationSession.objects.filter(level2=level2).order_by("-created_at").first()
+    session_id = request.GET.get("session_id")
+    if session_id:
+        session = get_object_or_404(GenerationSession, id=session_id, level2=level2)
+    else:
+        session = level2.latest_session
 
     items_by_seed = {}
     total_count = 0
 
     if session:
-        # 获取该会话的所有生成项，按种子分组显示所有记录
-        items = GenerationItem.objects.filter(session=session).select_related('seed').order_by('seed_id', 'created_at')
+        # 只取每个位置的当前版本（重新生成的历史版本不展示），按种子分组
+        items = (
+            GenerationItem.objects
+            .filter(session=session, is_current=True)
+            .select_related('seed')
+            .order_by('seed_id', 'idx')
+        )
+        ordinals = TestCaseSeed.ordinals_for_level2(level2.id)
 
         for item in items:
             if item.seed:
                 if item.seed not in items_by_seed:
+                    item.seed.ordinal = ordinals.get(item.seed_id)
                     items_by_seed[item.seed] = []
                 items_by_seed[item.seed].append(item)
                 total_count += 1
@@ -1116,7 +1567,8 @@ def session_edit_and_save(request, session_id):
 @require_http_methods(["POST"])
 def import_excel_to_db(request):
     """
-    Excel 导入规则（固定列位）：
+    Excel 导入（异步）：上传后返回 job_id，前端轮询 api/import-jobs/<job_id>/ 查看进度
+    规则（固定列位）：
     - 忽略第 1 列
     - 第 2 列：一级功能
     - 第 3 列：二级功能
@@ -1134,86 +1586,239 @@ def import_excel_to_db(request):
         if not f.name.lower().endswith(".xlsx"):
             return JsonResponse({"ok": False, "msg": "目前只支持 .xlsx 格式"}, status=400)
 
+        # 文件先落盘并同步检查表头，接口立即返回任务 id；解析和写库在后台按块进行，进度见 import_job_status
         try:
-            wb = load_workbook(f, data_only=True)
-            ws = wb.active
-        except Exception as e:
-            return JsonResponse({"ok": False, "msg": f"读取Excel失败：{e}"}, status=400)
+            with transaction.atomic():
+                job = create_import_job(f, user=request.user)
+                start_import_job(job.id)
+        except InvalidWorkbook as e:
+            return JsonResponse({"ok": False, "msg": str(e)}, status=400)
 
-        def norm(v):
-            return "" if v is None else str(v).strip()
+        return JsonResponse({
+            "ok": True,
+            "msg": "文件已上传，正在后台导入",
+            "job_id": job.id,
+            "status": job.status,
+            "total_rows": job.total_rows,
+        }, status=202)
 
-        rows = list(ws.iter_rows(values_only=True))
-        if len(rows) <= 1:
-            return JsonResponse({"ok": False, "msg": "Excel中没有数据行"}, status=400)
+    except Exception as e:
+        # ✅ 兜底：保证永远返回 HttpResponse，不会是 None
+        return JsonResponse({"ok": False, "msg": f"导入异常：{str(e)}"}, status=500)
 
-        created_l1 = created_l2 = created_seed = updated_l2_prompt = skipped = 0
 
-        # 合并单元格继承：l1/l2/prompt
-        last_l1 = ""
-        last_l2 = ""
-        last_prompt = ""
+@require_http_methods(["GET"])
+def import_job_status(request, job_id):
+    """导入任务进度：已处理行数、统计（与原同步接口的 stats 一致）、逐行错误"""
+    try:
+        job = ImportJob.objects.get(id=job_id)
+    except ImportJob.DoesNotExist:
+        return JsonResponse({"ok": False, "msg": "导入任务不存在"}, status=404)
 
-        with transaction.atomic():
-            for r in rows[1:]:
-                # B/C/D/E
-                raw_l1 = norm(r[1]) if len(r) > 1 else ""
-                raw_l2 = norm(r[2]) if len(r) > 2 else ""
-                raw_prompt = norm(r[3]) if len(r) > 3 else ""   # 第4列 prompt
-                seed = norm(r[4]) if len(r) > 4 else ""         # 第5列 seed
-
-                # l1/l2 向下继承
-                l1 = raw_l1 or last_l1
-                l2 = raw_l2 or last_l2
-
-                # 必须有 l1/l2，prompt 可为空
-                if not l1 or not l2:
-                    skipped += 1
-                    continue
+    return JsonResponse({
+        "ok": job.status != "failed",
+        "job_id": job.id,
+        "file_name": job.original_name,
+        "status": job.status,
+        "total_rows": job.total_rows,
+        "processed_rows": job.processed_rows,
+        "stats": job.stats,
+        "errors": job.errors,
+        "msg": job.message,
+        "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "finished_at": job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+    })
 
-                # prompt 向下继承（只对合并单元格有效：同一个 l1+l2 的连续行）
-                if raw_prompt:
-                    prompt = raw_prompt
-                else:
-                    prompt = last_prompt if (l1 == last_l1 and l2 == last_l2) else ""
 
-                # 更新缓存
-                last_l1, last_l2, last_prompt = l1, l2, prompt
+@require_http_methods(["GET"])
+@read_replica
+def export_saved_cases(request):
+    """
+    导出最终用例为 Excel（?level2_id= 按场景，?batch_id= 按保存批次，可同时指定）
+    文件流式返回；已交付批次的文件会缓存，重复下载不再查询生成
+    """
+    level2_id = request.GET.get("level2_id") or None
+    batch_id = request.GET.get("batch_id") or None
+    if not level2_id and not batch_id:
+        return JsonResponse({"error": "缺少 level2_id 或 batch_id"}, status=400)
+
+    qs = SavedCaseItem.objects.all()
+    if level2_id:
+        qs = qs.filter(level2_id=level2_id)
+    if batch_id:
+        qs = qs.filter(saved_batch_id=batch_id)
+    first = qs.select_related("level2").first()
+    if first is None:
+        return JsonResponse({"error": "没有可导出的用例"}, status=404)
+
+    fileobj = open_export(level2_id=level2_id, batch_id=batch_id)
+    filename = f"{batch_id}.xlsx" if batch_id else f"{first.level2.name}_测试用例.xlsx"
+    return FileResponse(
+        fileobj,
+        as_attachment=True,
+        filename=filename,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+@require_http_methods(["GET"])
+@read_replica
+def level2_sessions(request):
+    """
+    生成会话历史（按时间倒序，游标分页）
+    参数：level2_id；before_id 上一页最后一条的 id；limit 每页条数（默认 20，最多 100）
+    """
+    level2_id = request.GET.get("level2_id")
+    if not level2_id:
+        return JsonResponse({"error": "缺少level2_id参数"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        before_id = int(request.GET.get("before_id") or 0)
+    except ValueError:
+        return JsonResponse({"error": "分页参数格式错误"}, status=400)
+
+    level2 = FeatureLevel2.objects.filter(id=level2_id).only("id", "latest_session_id").first()
+    if level2 is None:
+        return JsonResponse({"error": "二级功能不存在"}, status=404)
 
-                level1, l1_created = FeatureLevel1.objects.get_or_create(name=l1)
-                if l1_created:
-                    created_l1 += 1
+    qs = GenerationSession.objects.filter(level2_id=level2.id)
+    if before_id:
+        qs = qs.filter(id__lt=before_id)
+    sessions = list(
+        qs.order_by("-id").values("id", "status", "item_count", "model_name", "created_at")[:limit + 1]
+    )
+    has_more = len(sessions) > limit
+    sessions = sessions[:limit]
+    for item in sessions:
+        item["created_at"] = item["created_at"].strftime("%Y-%m-%d %H:%M:%S")
+        item["is_latest"] = item["id"] == level2.latest_session_id
 
-                level2, l2_created = FeatureLevel2.objects.get_or_create(level1=level1, name=l2)
-                if l2_created:
-                    created_l2 += 1
+    return JsonResponse({
+        "sessions": sessions,
+        "latest_session_id": level2.latest_session_id,
+        "next_before_id": sessions[-1]["id"] if has_more else None,
+    })
 
-                # prompt 可为空：为空不覆盖；有值才更新
-                if prompt and (level2.prompt or "") != prompt:
-                    level2.prompt = prompt
-                    level2.save(update_fields=["prompt"])
-                    updated_l2_prompt += 1
 
-                # seed 写入（不继承；为空则跳过）
-                if seed:
-                    _, seed_created = TestCaseSeed.objects.get_or_create(level2=level2, text=seed)
-                    if seed_created:
-                        created_seed += 1
+@require_http_methods(["GET"])
+@read_replica
+def search_cases(request):
+    """
+    全文检索种子用例 / 最终用例（倒排索引，见 search_index）
+    参数：q 关键词；type=saved（默认）/seed；level1_id、level2_id、status（仅最终用例）、
+    date_from / date_to（YYYY-MM-DD，按创建日期）；match=all（默认，命中全部关键词）/any；
+    cursor 上一页返回的 next_cursor；limit 每页条数（默认 20，最多 100）
+    """
+    from datetime import datetime
 
-        return JsonResponse({
-            "ok": True,
-            "msg": "导入成功",
-            "stats": {
-                "created_level1": created_l1,
-                "created_level2": created_l2,
-                "updated_level2_prompt": updated_l2_prompt,
-                "created_seed": created_seed,
-                "skipped_rows": skipped,
-            }
-        })
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"error": "缺少关键词"}, status=400)
+    kind = request.GET.get("type", "saved")
+    if kind not in search_index.KINDS:
+        return JsonResponse({"error": "type 只能是 saved 或 seed"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        cursor = search_index.parse_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+        date_from, date_to = (
+            datetime.strptime(request.GET[name], "%Y-%m-%d").date() if request.GET.get(name) else None
+            for name in ("date_from", "date_to")
+        )
+        level1_id = int(request.GET.get("level1_id") or 0)
+        level2_id = int(request.GET.get("level2_id") or 0)
+    except ValueError:
+        return JsonResponse({"error": "参数格式错误"}, status=400)
+
+    results, next_cursor = search_index.search(
+        kind, query,
+        level1_id=level1_id, level2_id=level2_id,
+        status=request.GET.get("status") or None,
+        date_from=date_from, date_to=date_to,
+        match_all=request.GET.get("match", "all") != "any",
+        cursor=cursor, limit=limit,
+    )
+
+    data = []
+    for doc, hits, score in results:
+        row = {
+            "id": doc.id,
+            "level1_id": doc.level2.level1_id,
+            "level1_name": doc.level2.level1.name,
+            "level2_id": doc.level2_id,
+            "level2_name": doc.level2.name,
+            "snippet": search_index.snippet(doc.text, query),
+            "hits": hits,
+            "score": score,
+            "created_at": doc.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if kind == "saved":
+            row["saved_batch_id"] = doc.saved_batch_id
+            row["status"] = doc.status
+        data.append(row)
+
+    return JsonResponse({"results": data, "next_cursor": next_cursor})
 
-    except Exception as e:
-        # ✅ 兜底：保证永远返回 HttpResponse，不会是 None
-        return JsonResponse({"ok": False, "msg": f"导入异常：{str(e)}"}, status=500)
 
+@require_http_methods(["GET"])
+@read_replica
+def similar_items(request):
+    """
+    查找近似重复的种子用例 / 最终用例（MinHash 分桶，见 similarity）
+    参数（三选一）：text 任意文本（例如准备新增的种子）；seed_id；saved_id
+    可选：type=all（默认）/seed/saved；level2_id 限定场景；threshold 相似度下限（默认 settings.SIMILARITY_THRESHOLD）；
+    limit 条数（默认 20，最多 100）
+    """
+    kind = request.GET.get("type", "all")
+    if kind not in ("all", *similarity.KINDS):
+        return JsonResponse({"error": "type 只能是 all、seed 或 saved"}, status=400)
+    kinds = tuple(similarity.KINDS) if kind == "all" else (kind,)
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+        threshold = float(request.GET["threshold"]) if request.GET.get("threshold") else None
+        level2_id = int(request.GET.get("level2_id") or 0)
+        seed_id = int(request.GET.get("seed_id") or 0)
+        saved_id = int(request.GET.get("saved_id") or 0)
+    except ValueError:
+        return JsonResponse({"error": "参数格式错误"}, status=400)
+
+    text = request.GET.get("text", "").strip()
+    exclude = None
+    sig = None
+    if seed_id or saved_id:
+        exclude = ("seed", seed_id) if seed_id else ("saved", saved_id)
+        sig = similarity.signature_of(*exclude)
+        if sig is None:
+            return JsonResponse({"error": "该用例不存在或尚未建立相似度索引"}, status=404)
+    elif not text:
+        return JsonResponse({"error": "缺少 text、seed_id 或 saved_id"}, status=400)
+
+    matches = similarity.find_similar(
+        text, sig=sig, kinds=kinds, level2_id=level2_id,
+        threshold=threshold, exclude=exclude, limit=limit,
+    )
+
+    # 按类型批量取出文档，用于展示
+    keys = [similarity.doc_key(row) for row, _ in matches]
+    docs = {}
+    for doc_kind, (_, model) in similarity.KINDS.items():
+        ids = [doc_id for k, doc_id in keys if k == doc_kind]
+        if ids:
+            for doc in model.objects.select_related("level2", "level2__level1").filter(id__in=ids):
+                docs[(doc_kind, doc.id)] = doc
+
+    results = []
+    for key, (row, score) in zip(keys, matches):
+        doc = docs.get(key)
+        if doc is None:
+            continue
+        results.append({
+            "type": key[0],
+            "id": key[1],
+            "level1_name": doc.level2.level1.name,
+            "level2_id": doc.level2_id,
+            "level2_name": doc.level2.name,
+            "text": doc.text,
+            "similarity": round(score, 3),
+        })
 
+    return JsonResponse({"results": results})
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Generate_testcases.db_router.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -135,3 +139,89 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# 大模型调用调度（Generate_testcases/llm_scheduler.py）
+# 单进程内同时请求供应商的最大并发数
+LLM_MAX_CONCURRENCY = 4
+# 为点击类（interactive）请求预留的槽位数，批量任务占不到这部分
+LLM_INTERACTIVE_RESERVED = 1
+# 种子数不超过该值的生成会话按 interactive 优先级调度
+LLM_INTERACTIVE_MAX_SEEDS = 2
+
+# 相同请求合并（Generate_testcases/singleflight.py）
+# follower 等待 leader 的最长时间（秒），超过则认为 leader 已失效并接管
+LLM_SINGLEFLIGHT_WAIT_TIMEOUT = 180
+# leader 完成后多少秒内到达的相同请求直接复用结果（覆盖前端重复提交）
+LLM_SINGLEFLIGHT_GRACE = 3
+# follower 轮询锁行的间隔（秒）
+LLM_SINGLEFLIGHT_POLL_INTERVAL = 0.5
+
+# 按用户/团队的公平排队与每日配额（Generate_testcases/llm_quota.py）
+# "user"：按用户；"team"：按用户所在的第一个 Django 组
+LLM_FAIR_SHARE_BY = "user"
+# 默认每日请求数 / token 上限，None 表示不限；超出返回 429 + Retry-After
+LLM_DAILY_REQUEST_QUOTA = None
+LLM_DAILY_TOKEN_QUOTA = None
+# 按 tenant 覆盖配额，例如 {"user:3": {"requests": 500, "tokens": 2000000}}
+LLM_TENANT_QUOTAS = {}
+# 按 tenant 设置公平排队权重（默认 1），例如 {"team:qa": 2}
+LLM_TENANT_WEIGHTS = {}
+
+# 批量写入（bulk_create / bulk_update）每条 SQL 的最大行数
+BULK_INSERT_BATCH_SIZE = 500
+
+# Excel 导入每个事务块处理的行数
+IMPORT_CHUNK_SIZE = 1000
+# 逐行错误明细最多保留的条数
+IMPORT_MAX_ERRORS = 200
+# 上传的 Excel 落盘目录（异步导入任务从这里读取）
+IMPORT_SPOOL_DIR = BASE_DIR / "import_spool"
+# True：上传后在 web 进程的后台线程中导入；False：只入队，由 `manage.py run_import_jobs --loop` 处理
+IMPORT_RUN_IN_THREAD = True
+# 导入中的任务超过这么久（秒）没有进度，视为处理进程已中断，可被重新领取并从断点继续
+IMPORT_JOB_STALE_SECONDS = 300
+
+# 最终用例导出：每次从数据库读取的行数，已交付批次的导出文件缓存目录
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_CACHE_DIR = BASE_DIR / "export_cache"
+
+# 生成历史保留天数：archive_generation_history 把更早的、未被最终用例引用的会话压缩归档后从热表删除
+GENERATION_RETENTION_DAYS = 90
+
+# 长文本压缩存储（生成项原文/编辑稿、最终用例）：UTF-8 编码后达到该字节数才压缩，zlib 压缩级别 1~9
+COMPRESSED_TEXT_MIN_BYTES = 256
+COMPRESSED_TEXT_LEVEL = 6
+
+# 全文检索：每个查询词元最多取这么多候选文档（最新的优先）再分组排序，常见词元的查询开销有上限
+SEARCH_MAX_CANDIDATES = 2000
+
+# 近似重复检测（MinHash）：估算相似度达到该值才视为相似，similar 接口和重复聚类报告的默认阈值
+SIMILARITY_THRESHOLD = 0.7
+# 每次查找最多取这么多个同桶的候选文档（平均分给各段），候选数不随库的规模增长
+SIMILARITY_MAX_CANDIDATES = 500
+
+# 只读副本：开启后 get_level2_list、level2_detail 等只读视图从 READ_REPLICA_ALIAS 读取，写入始终走 default；
+# 同一浏览器写入后 READ_REPLICA_STICKY_SECONDS 秒内仍读主库。单库部署保持关闭
+# 副本地址从环境变量读取：开启时必须配置 READ_REPLICA_HOST / READ_REPLICA_PORT，否则启动失败；
+# READ_REPLICA_USER / READ_REPLICA_PASSWORD 为副本账号（只需要 SELECT 权限），未配置时沿用主库账号
+READ_REPLICA_ENABLED = os.getenv("READ_REPLICA_ENABLED", "").lower() in ("1", "true", "yes")
+READ_REPLICA_ALIAS = "replica"
+READ_REPLICA_STICKY_SECONDS = 10
+READ_REPLICA_HOST = os.getenv("READ_REPLICA_HOST", "")
+READ_REPLICA_PORT = os.getenv("READ_REPLICA_PORT", "")
+DATABASE_ROUTERS = ["Generate_testcases.db_router.ReplicaRouter"]
+
+if READ_REPLICA_ENABLED:
+    _missing = [name for name in ("READ_REPLICA_HOST", "READ_REPLICA_PORT") if not globals()[name]]
+    if _missing:
+        raise ImproperlyConfigured(f"已开启 READ_REPLICA_ENABLED，但未配置 {', '.join(_missing)}")
+    DATABASES[READ_REPLICA_ALIAS] = {
+        **DATABASES["default"],
+        'HOST': READ_REPLICA_HOST,
+        'PORT': READ_REPLICA_PORT,
+        'USER': os.getenv("READ_REPLICA_USER") or DATABASES["default"]["USER"],
+        'PASSWORD': os.getenv("READ_REPLICA_PASSWORD") or DATABASES["default"]["PASSWORD"],
+        # 测试时副本指向测试主库
+        'TEST': {'MIRROR': 'default'},
+    }